@@ -0,0 +1,200 @@
+r"""
+Cross-backend consistency check and benchmark table. Random numeric matrices (square, rectangular,
+singular and sparse, \matrix and \ematrix) go through every installed backend of engines.backends.
+Exact backends must give equal results (REF too, it has the form of sympy echelon_form),
+NumPy must agree within tolerance and have the same pivots of REF (exactly singular matrices are
+invertible in float64, so they aren't compared). Exits with status 1 if any result differs.
+The same checks of command outputs run in tests/test_backends.py.
+
+Run from the src directory:
+    python -m benchmarks.backends
+    python -m benchmarks.backends --sizes 10 50 100 --repeat 3
+"""
+
+from engines import backends
+from parsers.matrix_parser import Matrix
+
+import argparse
+import random
+import sympy as sp
+import sys
+import time
+
+
+OPERATIONS = ('det_rank', 'inv', 'ref', 'rref', 'T', 'block_ref', 'block_rref')
+# Relative tolerance of NumPy results
+TOLERANCE = 1e-8
+# Symbolic matrices are served only by SymPy, so they are checked at small sizes
+SYMBOLIC_SIZES = (2, 3)
+# Entries of non-reduced REF (the form of sympy echelon_form) grow exponentially with size,
+# so exact REF of larger matrices isn't benchmarked
+MAX_REF_SIZE = 12
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[4, 12, 30], help="Sizes of benchmarked matrices")
+    arg_parser.add_argument('--cases', type=int, default=20, help="Amount of random matrices of every kind to check")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="Runs of every benchmark, the best one is taken")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    return arg_parser.parse_args()
+
+
+def installed():
+    return [name for name, backend in backends.REGISTRY.items() if backend.available()]
+
+
+def random_entry(density: float):
+    if random.random() > density:
+        return sp.Integer(0)
+    return sp.Rational(random.randint(-9, 9), random.choice((1, 1, 2, 3)))
+
+
+def random_matrix(rows: int, cols: int, density: float = 1.0, rank: int = None):
+    matrix = sp.Matrix(rows, cols, lambda i, j: random_entry(density))
+    if rank is not None:
+        # Rows after rank are combinations of the first ones
+        for i in range(rank, rows):
+            matrix[i, :] = sum((random.randint(-2, 2) * matrix[j, :] for j in range(rank)), sp.zeros(1, cols))
+    return sp.ImmutableMatrix(matrix)
+
+
+def run(operation: str, backend: str, matrix, ematrix=None):
+    """
+    Runs operation on copy of matrix with the backend.
+
+    Returns:
+        result of operation or the raised exception.
+    """
+
+    block = operation.startswith('block_')
+    wrapper = Matrix(r'\ematrix' if block else r'\matrix', matrix, ematrix if block else None, backend=backend)
+    wrapper.sparse = sum(x != 0 for x in matrix) < 0.25 * len(matrix) and matrix.shape[0] >= 8
+    try:
+        if operation == 'det_rank':
+            return wrapper.det_rank()
+        elif operation == 'inv':
+            return wrapper.inv().matrix
+        elif operation == 'T':
+            return wrapper.T().matrix
+        wrapper.ref(operation.endswith('rref'))
+        return (wrapper.matrix, wrapper.ematrix) if block else wrapper.matrix
+    except Exception as e:
+        return e
+
+
+def flatten(result):
+    if isinstance(result, tuple):
+        return [x for part in result for x in flatten(part)]
+    if isinstance(result, sp.MatrixBase):
+        return list(result)
+    return [sp.sympify(result)]
+
+
+def close(result, expected):
+    if isinstance(expected, Exception) or isinstance(result, Exception):
+        return isinstance(expected, Exception) == isinstance(result, Exception)
+    result, expected = flatten(result), flatten(expected)
+    scale = max([1] + [abs(float(x)) for x in expected])
+    return len(result) == len(expected) and all(abs(float(x) - float(y)) <= TOLERANCE * scale
+                                                for x, y in zip(result, expected))
+
+
+def pivots(result):
+    """Columns of leading entries of rows, they are the same for every echelon form of matrix"""
+
+    if isinstance(result, tuple):
+        result = sp.Matrix.hstack(*result)
+    # Exact entries are compared with zero, floats with tolerance
+    scale = max([1] + [abs(float(x)) for x in result if x.is_Float])
+    columns = []
+    for row in result.tolist():
+        column = next((j for j, x in enumerate(row) if (abs(float(x)) > TOLERANCE * scale if x.is_Float else x)), None)
+        if column is not None:
+            columns.append(column)
+    return columns
+
+
+def consistent(operation: str, name: str, result, expected):
+    if name == 'numpy':
+        if operation in ('ref', 'block_ref') and not isinstance(expected, Exception):
+            # Partial pivoting gives another echelon form
+            return not isinstance(result, Exception) and pivots(result) == pivots(expected)
+        if operation == 'inv' and isinstance(expected, Exception):
+            # Rounding makes exactly singular matrices invertible in float64
+            return True
+        return close(result, expected)
+    if isinstance(expected, Exception) or isinstance(result, Exception):
+        return isinstance(expected, Exception) and isinstance(result, Exception)
+    return result == expected
+
+
+def check(names: list, cases: int):
+    """Compares every installed backend with the Python backend, returns amount of mismatches"""
+
+    kinds = {
+        'square': lambda n: random_matrix(n, n),
+        'wide': lambda n: random_matrix(n, n + 2),
+        'tall': lambda n: random_matrix(n + 2, n),
+        'singular': lambda n: random_matrix(n, n, rank=max(1, n - 2)),
+        'sparse': lambda n: random_matrix(n + 8, n + 8, density=0.1),
+    }
+    mismatches = 0
+    for kind, generate in kinds.items():
+        for case in range(cases):
+            matrix = generate(random.randint(1, 6))
+            ematrix = random_matrix(matrix.shape[0], random.randint(1, 4))
+            for operation in OPERATIONS:
+                expected = run(operation, 'python', matrix, ematrix)
+                for name in names:
+                    result = run(operation, name, matrix, ematrix)
+                    if not consistent(operation, name, result, expected):
+                        mismatches += 1
+                        print(f'MISMATCH {kind} {operation} {name}: {matrix.tolist()} {ematrix.tolist()}')
+
+    # Symbolic matrices go to SymPy whatever backend is requested
+    a, b = sp.symbols('a b')
+    for n in SYMBOLIC_SIZES:
+        matrix = sp.ImmutableMatrix(n, n, lambda i, j: a + i if i == j else b * j + 1)
+        expected = run('det_rank', 'sympy', matrix)
+        for name in names:
+            if run('det_rank', name, matrix) != expected:
+                mismatches += 1
+                print(f'MISMATCH symbolic det_rank {name}: {matrix.tolist()}')
+    return mismatches
+
+
+def best_time(operation: str, name: str, matrix, ematrix, repeat: int):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(operation, name, matrix, ematrix)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def benchmark(names: list, sizes: list, repeat: int):
+    print(f"{'operation':<12}{'size':>6}" + ''.join(f'{name:>12}' for name in names))
+    for size in sizes:
+        matrix = random_matrix(size, size)
+        ematrix = sp.ImmutableMatrix(sp.eye(size))
+        for operation in OPERATIONS:
+            cells = []
+            for name in names:
+                if name != 'numpy' and operation in ('ref', 'block_ref') and size > MAX_REF_SIZE:
+                    cells.append(f"{'-':>12}")
+                else:
+                    cells.append(f'{best_time(operation, name, matrix, ematrix, repeat) * 1e3:>10.1f}ms')
+            print(f'{operation:<12}{size:>6}' + ''.join(cells))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    random.seed(args.seed)
+    names = installed()
+    print(f"Backends: {', '.join(names)}")
+
+    mismatches = check(names, args.cases)
+    print(f'Consistency: {mismatches} mismatches')
+    benchmark(names, args.sizes, args.repeat)
+    sys.exit(1 if mismatches else 0)
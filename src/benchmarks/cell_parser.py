@@ -0,0 +1,54 @@
+r"""
+Compares fast recursive descent parser with sympy's parse_latex on matrix cells and elementary operation coefficients.
+
+Run from the src directory:
+    python -m benchmarks.cell_parser
+"""
+
+from parsers.expression_parser import parse_fast, UnsupportedLaTeX
+from sympy.parsing.latex import parse_latex
+
+import argparse
+import timeit
+
+
+CORPUS = [
+    '0', '1', '-1', '2', '-4', '17', '0.5', 'a', 'x', r'\lambda',
+    r'\frac{1}{2}', r'-\frac{3}{7}', r'\frac{a}{b}', r'\frac{1}{2}a', r'2\cdot\frac{1}{7}',
+    r'\lambda - 1', r'1 - \lambda', r'2x^2 + 3x - 1', r'x^{2}y', r'(a + b)(a - b)',
+    r'\sqrt{2}', r'\sqrt[3]{x}', r'\frac{\sqrt{3}}{2}', r'-\frac{\sqrt{2}}{2}', r'\left(1 + t\right)^2',
+    r'a \cdot b', r't^{-1}', r'\alpha + \beta', r'3(x + 1)', r'\frac{x - 1}{x + 1}',
+]
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--repeat', type=int, default=20, help="How many times to parse the corpus")
+    return arg_parser.parse_args()
+
+
+def bench(parse, repeat):
+    return min(timeit.repeat(lambda: [parse(cell) for cell in CORPUS], number=1, repeat=repeat))
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    unsupported = []
+    for cell in CORPUS:
+        try:
+            parse_fast(cell)
+        except UnsupportedLaTeX:
+            unsupported.append(cell)
+    if unsupported:
+        print(f'Falls back to parse_latex: {unsupported}')
+
+    # First call of parse_latex loads ANTLR runtime
+    parse_latex('1')
+
+    fast = bench(parse_fast, args.repeat)
+    antlr = bench(parse_latex, args.repeat)
+    print(f'cells: {len(CORPUS)}')
+    print(f'parse_fast:  {fast * 1e3:.3f} ms ({fast / len(CORPUS) * 1e6:.1f} us/cell)')
+    print(f'parse_latex: {antlr * 1e3:.3f} ms ({antlr / len(CORPUS) * 1e6:.1f} us/cell)')
+    print(f'speedup: {antlr / fast:.1f}x')
@@ -0,0 +1,71 @@
+r"""
+Compares elementary operations on sympy matrices (a new matrix for every operation)
+with in place operations on row lists of Matrix on augmented system.
+
+Run from the src directory:
+    python -m benchmarks.el_ops --size 60 --ops 200
+"""
+
+from parsers.matrix_parser import Matrix
+
+import argparse
+import random
+import sympy as sp
+import time
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--size', type=int, default=60, help="Size of square matrix and its right hand side")
+    arg_parser.add_argument('--ops', type=int, default=200, help="Amount of elementary operations")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    return arg_parser.parse_args()
+
+
+def random_ops(size, count):
+    ops = []
+    for _ in range(count):
+        n, m = random.sample(range(size), 2)
+        op = random.choice(('n->kn', 'n<->m', 'n->n+km'))
+        k = sp.Rational(random.randint(1, 9), random.randint(1, 9))
+        ops.append({'op': op, 'n': n, 'm': m, 'k': k})
+    return ops
+
+
+def sympy_ops(matrix, ematrix, ops):
+    for op in ops:
+        kwargs = {'op': op['op'], 'k': op['k'], 'row2': op['m']}
+        kwargs['row1' if op['op'] == 'n<->m' else 'row'] = op['n']
+        matrix = matrix.elementary_row_op(**kwargs)
+        ematrix = ematrix.elementary_row_op(**kwargs)
+    return matrix, ematrix
+
+
+def in_place_ops(matrix, ematrix, ops):
+    wrapper = Matrix(r'\ematrix', matrix, ematrix)
+    for op in ops:
+        wrapper.row_op(**op)
+    return wrapper.matrix, wrapper.ematrix
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    random.seed(args.seed)
+
+    matrix = sp.ImmutableMatrix(args.size, args.size, lambda i, j: random.randint(-9, 9))
+    ematrix = sp.ImmutableMatrix(sp.eye(args.size))
+    ops = random_ops(args.size, args.ops)
+
+    start = time.perf_counter()
+    expected = sympy_ops(matrix, ematrix, ops)
+    sympy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = in_place_ops(matrix, ematrix, ops)
+    in_place_time = time.perf_counter() - start
+
+    assert result[0] == expected[0] and result[1] == expected[1]
+    print(f'{args.size}x{args.size} augmented, {args.ops} row operations')
+    print(f'elementary_row_op: {sympy_time * 1e3:.1f} ms')
+    print(f'in place:          {in_place_time * 1e3:.1f} ms')
+    print(f'speedup: {sympy_time / in_place_time:.1f}x')
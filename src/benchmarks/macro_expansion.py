@@ -0,0 +1,81 @@
+r"""
+Measures expansion of custom commands on generated inputs of growing size with nested
+macros and matrices. Time per kilobyte should stay flat as the input grows.
+
+Run from the src directory:
+    python -m benchmarks.macro_expansion --sizes 4 16 64 256
+"""
+
+from parsers.latex_parser import Parser
+
+import argparse
+import random
+import time
+
+
+PREAMBLE = r"""
+\newcommand{\R}{\mathbb{R}}
+\newcommand{\sq}[1]{{#1}^{2}}
+\newcommand{\norm}[1]{\sqrt{\sq{#1}}}
+\newcommand{\pair}[2]{\left(\norm{#1}, \sq{#2}\right)}
+\newcommand{\wrap}[1]{\pair{#1}{\frac{#1}{\R}}}
+"""
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--sizes', type=int, nargs='+', default=[4, 16, 64, 256],
+                            help="Sizes of generated inputs in kilobytes")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    return arg_parser.parse_args()
+
+
+def random_term(depth=0):
+    choice = random.randrange(6 if depth < 3 else 2)
+    if choice == 0:
+        return random.choice('abcxyz')
+    if choice == 1:
+        return str(random.randint(1, 99))
+    if choice == 2:
+        return r'\sq{' + random_term(depth + 1) + '}'
+    if choice == 3:
+        return r'\pair{' + random_term(depth + 1) + '}{' + random_term(depth + 1) + '}'
+    if choice == 4:
+        return r'\wrap{' + random_term(depth + 1) + '}'
+    return r'\frac{' + random_term(depth + 1) + '}{' + random_term(depth + 1) + '}'
+
+
+def random_input(size):
+    """Generates sum of random terms and small matrices which is at least size bytes long"""
+
+    terms = []
+    length = 0
+    while length < size:
+        if random.random() < 0.1:
+            term = r'\matrix{' + random_term() + r' & 1 \\ 0 & ' + random_term() + '}'
+        else:
+            term = random_term()
+        terms.append(term)
+        length += len(term) + 3
+    return ' + '.join(terms)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    random.seed(args.seed)
+
+    parser = Parser()
+    parser.parse_command_file(PREAMBLE)
+
+    print(f'{"input, KB":>10} {"output, KB":>11} {"time, ms":>9} {"ms/KB":>7}')
+    for size in args.sizes:
+        text = random_input(size * 1024)
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result, _ = parser.replace_custom_commands(text, False)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'{len(text) / 1024:>10.1f} {len(result) / 1024:>11.1f} {best * 1e3:>9.2f} '
+              f'{best * 1e3 / (len(text) / 1024):>7.3f}')
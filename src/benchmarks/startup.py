@@ -0,0 +1,98 @@
+r"""
+Measures startup of main.py: the slowest imports (python -X importtime) of the modules
+which main.py and parser need, time until the ready message and until the first response
+with and without --prewarm.
+
+Run from the src directory:
+    python -m benchmarks.startup --top 15
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FIRST_REQUEST = {'command': 'simplify', 'id': 1, 'text': r'\frac{x^2 - 1}{x - 1}'}
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--top', type=int, default=15, help="Amount of the slowest imports to show")
+    arg_parser.add_argument('--workers', type=int, default=1)
+    arg_parser.add_argument('--delay', type=float, default=2,
+                            help="Seconds between ready message and the first request, time an editor is idle")
+    return arg_parser.parse_args()
+
+
+def import_times(module: str):
+    """
+    Imports module in a new interpreter with -X importtime.
+
+    Returns:
+        list: list of tuple(cumulative microseconds, self microseconds, module) sorted by cumulative time.
+    """
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=SRC_DIR,
+                            capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        times.append((int(cumulative), int(own), name.rstrip()))
+    return sorted(times, reverse=True)
+
+
+def print_imports(module: str, top: int):
+    times = import_times(module)
+    print(f'import {module}: {times[0][0] / 1e3:.1f} ms')
+    for cumulative, own, name in times[:top]:
+        print(f'  {cumulative / 1e3:>9.1f} {own / 1e3:>8.1f}  {name.strip()}')
+
+
+def read_response(process):
+    line = process.stdout.readline()
+    if not line:
+        raise RuntimeError('main.py exited: ' + process.stderr.read())
+    return json.loads(line)
+
+
+def measure_main(workers: int, prewarm: bool, delay: float):
+    """Returns tuple(seconds until ready message, seconds from sending the first request until its response)"""
+
+    command = [sys.executable, 'main.py', '', '--workers', str(workers)] + (['--prewarm'] if prewarm else [])
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=SRC_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, text=True)
+    try:
+        assert read_response(process)['command'] == 'ready'
+        ready = time.perf_counter() - start
+        time.sleep(delay)
+
+        start = time.perf_counter()
+        process.stdin.write(json.dumps(FIRST_REQUEST) + '\n')
+        process.stdin.flush()
+        read_response(process)
+        return ready, time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        process.wait()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    print_imports('dispatcher', args.top)
+    print()
+    print_imports('parsers.latex_parser', args.top)
+    print()
+
+    print(f'{"mode":>10} {"ready, ms":>10} {"first response, ms":>19}')
+    for prewarm in (False, True):
+        ready, first = measure_main(args.workers, prewarm, args.delay)
+        print(f'{"prewarm" if prewarm else "lazy":>10} {ready * 1e3:>10.1f} {first * 1e3:>19.1f}')
@@ -0,0 +1,209 @@
+r"""
+Benchmark of every command on generated matrices of different size, density, numeric or
+symbolic entries and \matrix or \ematrix. Requests are executed by Dispatcher without workers
+and without result cache, the same way main.py executes them.
+
+Run from the src directory:
+    python -m benchmarks.suite --save baseline.json
+    python -m benchmarks.suite --compare baseline.json --threshold 1.2
+
+Every case is repeated on different random matrices, so caches of parsed cells don't hide
+the cost of parsing. Matrices of a case depend only on its name and --seed, and caches are
+cleared before every case, so results don't depend on which cases are selected.
+Cases which don't fit into --budget are reported as timeouts.
+"""
+
+from dispatcher import Dispatcher
+from sympy.core.cache import clear_cache
+from parsers.matrix_parser import parse_normalized_cell
+from utils import latex_cell
+
+import argparse
+import io
+import json
+import random
+import sys
+import time
+
+
+COMMANDS = ('el_ops', 'simplify', 'matrix_info', 'transpose', 'inverse', 'ref', 'rref')
+# \ematrix makes difference only for commands which transform rows
+EMATRIX_COMMANDS = ('el_ops', 'ref', 'rref')
+SYMBOLS = 'abc'
+
+# Preset sets of sizes, symbolic matrices are much slower, so they get smaller sizes
+PRESETS = {
+    'quick': {'numeric': (2, 10, 50), 'symbolic': (2, 4, 6), 'densities': (1.0, 0.1)},
+    'full': {'numeric': (2, 10, 50, 100, 200), 'symbolic': (2, 4, 8, 12), 'densities': (1.0, 0.5, 0.1)},
+}
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--preset', choices=PRESETS, default='quick')
+    arg_parser.add_argument('--commands', nargs='+', choices=COMMANDS, default=COMMANDS)
+    arg_parser.add_argument('--repeat', type=int, default=5, help="Amount of requests in every case")
+    arg_parser.add_argument('--budget', type=float, default=30, help="Time budget of one request in seconds")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--save', type=str, help="Save results as JSON baseline")
+    arg_parser.add_argument('--compare', type=str, help="Compare results with JSON baseline")
+    arg_parser.add_argument('--threshold', type=float, default=1.2,
+                            help="Median latency ratio to baseline which is reported as slowdown")
+    arg_parser.add_argument('--min-diff', type=float, default=1,
+                            help="Differences of median latency less than this amount of ms are ignored as noise")
+    return arg_parser.parse_args()
+
+
+def random_entry(symbolic: bool, density: float):
+    if random.random() >= density:
+        return '0'
+    if not symbolic or random.random() < 0.5:
+        return str(random.choice([i for i in range(-9, 10) if i]))
+    symbol = random.choice(SYMBOLS)
+    return random.choice((symbol, f'{random.randint(2, 5)}{symbol}', f'{symbol} + {random.randint(1, 5)}',
+                          f'{symbol}{random.choice(SYMBOLS)}', r'\frac{' + symbol + '}{2}'))
+
+
+def random_matrix(size: int, symbolic: bool, density: float):
+    """LaTeX of square matrix, diagonal has no zeros, so matrices are almost always invertible"""
+
+    rows = []
+    for i in range(size):
+        row = [random_entry(symbolic, density) for _ in range(size)]
+        if row[i] == '0':
+            row[i] = str(random.randint(1, 9))
+        rows.append(' & '.join(row))
+    return r' \\ '.join(rows)
+
+
+def identity(size: int):
+    return r' \\ '.join(' & '.join('1' if i == j else '0' for j in range(size)) for i in range(size))
+
+
+def random_ops(size: int, count: int):
+    ops = []
+    for _ in range(count):
+        n, m = random.sample(range(1, size + 1), 2) if size > 1 else (1, 1)
+        kind = random.randrange(3) if size > 1 else 1
+        if kind == 0:
+            ops.append(f'({n}) \\lra ({m})')
+        elif kind == 1:
+            ops.append(f'({n}) \\cdot {random.randint(2, 9)}')
+        else:
+            ops.append(f'({n}) + {random.randint(-9, 9) or 1}({m})')
+    return r'\simop{' + r' \\ '.join(ops) + '}'
+
+
+def case_text(command: str, size: int, symbolic: bool, density: float, ematrix: bool):
+    matrix = random_matrix(size, symbolic, density)
+    text = r'\ematrix{' + matrix + '}{' + identity(size) + '}' if ematrix else r'\matrix{' + matrix + '}'
+    if command == 'el_ops':
+        return text + ' ' + random_ops(size, size)
+    if command == 'simplify':
+        other = random_matrix(size, symbolic, density)
+        return text + r'^{-1} \matrix{' + other + r'} + \matrix{' + other + '}^T'
+    return text
+
+
+def cases(preset: dict, commands):
+    """Yields tuple(case name, command, size, symbolic, density, ematrix)"""
+
+    for command in commands:
+        for symbolic in (False, True):
+            for size in preset['symbolic' if symbolic else 'numeric']:
+                for density in preset['densities']:
+                    for ematrix in (False, True) if command in EMATRIX_COMMANDS else (False,):
+                        name = (f"{command} {'symbolic' if symbolic else 'numeric'} n={size} density={density}"
+                                f"{' ematrix' if ematrix else ''}")
+                        yield name, command, size, symbolic, density, ematrix
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+def run_case(dispatcher: Dispatcher, output: io.StringIO, args, case):
+    """
+    Executes requests of case one by one.
+
+    Returns:
+        dict: latency percentiles in seconds, throughput in requests per second and amount of errors.
+    """
+
+    name, command, size, symbolic, density, ematrix = case
+    random.seed(f'{args.seed} {name}')
+    clear_cache()
+    parse_normalized_cell.cache_clear()
+    latex_cell.cache_clear()
+
+    latencies = []
+    errors = []
+    for i in range(args.repeat):
+        text = case_text(command, size, symbolic, density, ematrix)
+        output.seek(0)
+        output.truncate()
+        start = time.perf_counter()
+        dispatcher.submit({'command': command, 'text': text, 'id': i, 'budget': args.budget})
+        latencies.append(time.perf_counter() - start)
+        response = json.loads(output.getvalue())
+        if response['command'] == 'error':
+            errors.append(response['error'])
+            if response['error'] == 'timeout':
+                break
+    return {
+        'p50': percentile(latencies, 50),
+        'p90': percentile(latencies, 90),
+        'p99': percentile(latencies, 99),
+        'throughput': len(latencies) / sum(latencies),
+        'requests': len(latencies),
+        'errors': errors,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_diff: float):
+    """Prints cases which are slower than baseline and returns their amount"""
+
+    slower = 0
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result['p50'] / base['p50'] if base['p50'] else 1
+        if abs(result['p50'] - base['p50']) * 1e3 < min_diff:
+            ratio = 1
+        if ratio > threshold or (result['errors'] and not base['errors']):
+            slower += 1
+            print(f'SLOWER {ratio:6.2f}x  {name}: {base["p50"] * 1e3:.2f} -> {result["p50"] * 1e3:.2f} ms'
+                  f'{"  errors: " + ", ".join(result["errors"]) if result["errors"] else ""}')
+        elif ratio < 1 / threshold:
+            print(f'faster {ratio:6.2f}x  {name}: {base["p50"] * 1e3:.2f} -> {result["p50"] * 1e3:.2f} ms')
+    return slower
+
+
+if __name__ == '__main__':
+    args = parse_args()
+
+    output = io.StringIO()
+    dispatcher = Dispatcher(workers=0, output=output)
+    # Import of sympy shouldn't be counted in the first case
+    dispatcher.submit({'command': 'transpose', 'text': r'\matrix{1}', 'id': None})
+
+    results = {}
+    print(f'{"case":<58} {"p50, ms":>10} {"p90, ms":>10} {"p99, ms":>10} {"req/s":>8}')
+    for case in cases(PRESETS[args.preset], args.commands):
+        result = results[case[0]] = run_case(dispatcher, output, args, case)
+        print(f'{case[0]:<58} {result["p50"] * 1e3:>10.2f} {result["p90"] * 1e3:>10.2f} '
+              f'{result["p99"] * 1e3:>10.2f} {result["throughput"]:>8.1f}'
+              f'{"  errors: " + ", ".join(result["errors"]) if result["errors"] else ""}', flush=True)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'preset': args.preset, 'repeat': args.repeat, 'results': results}, f, indent=1)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        print()
+        slower = compare(results, baseline, args.threshold, args.min_diff)
+        print(f'{slower} slower cases')
+        sys.exit(1 if slower else 0)
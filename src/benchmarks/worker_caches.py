@@ -0,0 +1,100 @@
+r"""
+Measures hit rates of the per-process caches of parsed cells and of el_ops chains when requests go
+through main.py with different amounts of worker processes. Every worker has its own caches and
+a request goes to any idle worker, so with more workers fewer requests find their cells or the
+previous matrix of their chain in the worker which serves them.
+
+The workload is what an editor sends: chains of el_ops requests, each of them applies new operations
+to the result of the previous one, and ref/matrix_info requests of matrices which share most cells.
+Results cache of main.py is disabled, so every request is computed.
+
+Run from the src directory:
+    python -m benchmarks.worker_caches --workers 0 1 2 4
+"""
+
+from benchmarks.startup import SRC_DIR, read_response
+
+import argparse
+import json
+import random
+import subprocess
+import sys
+
+
+# Cells are drawn from a few hundred numbers, so most cell hits come from matrices which are sent again
+CELLS = [str(a) for a in range(-20, 21)] + [r'\frac{%d}{%d}' % (a, b) for a in range(1, 31) for b in range(2, 9)]
+
+
+def parse_args():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    arg_parser.add_argument('--chains', type=int, default=6, help="Amount of el_ops chains")
+    arg_parser.add_argument('--steps', type=int, default=5, help="Requests in every chain")
+    arg_parser.add_argument('--size', type=int, default=5, help="Size of matrices")
+    arg_parser.add_argument('--seed', type=int, default=0)
+    return arg_parser.parse_args()
+
+
+def random_matrix(size: int):
+    return r'\matrix{' + r'\\ '.join(' & '.join(random.choice(CELLS) for _ in range(size))
+                                     for _ in range(size)) + '}'
+
+
+def random_ops(size: int):
+    n, m = random.sample(range(1, size + 1), 2)
+    return random.choice((f'({n})+{random.randint(2, 5)}({m})', f'({n})\\lra({m})', f'({n})\\cdot {random.randint(2, 5)}'))
+
+
+class Server:
+    def __init__(self, workers: int):
+        command = [sys.executable, 'main.py', '', '--workers', str(workers), '--cache-size', '0']
+        self.process = subprocess.Popen(command, cwd=SRC_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE, text=True)
+        assert read_response(self.process)['command'] == 'ready'
+        self.counters = {}
+        self.requests = 0
+
+    def request(self, command: str, text: str):
+        self.requests += 1
+        inp = {'command': command, 'text': text, 'id': self.requests, 'profile': True}
+        self.process.stdin.write(json.dumps(inp) + '\n')
+        self.process.stdin.flush()
+        response = read_response(self.process)
+        for name, value in response.get('profile', {}).get('counters', {}).items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        return response.get('res')
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def run(workers: int, args):
+    random.seed(args.seed)
+    server = Server(workers)
+    try:
+        chained = 0
+        for _ in range(args.chains):
+            matrix = random_matrix(args.size)
+            for _ in range(args.steps):
+                matrix = server.request('el_ops', matrix + r' \simop{' + random_ops(args.size) + '}')
+                server.request('ref', matrix)
+            chained += args.steps - 1
+        for _ in range(args.chains * args.steps):
+            server.request('matrix_info', random_matrix(args.size))
+    finally:
+        server.close()
+
+    counters = server.counters
+    cells = counters.get('cells_hits', 0) + counters.get('cells_misses', 0)
+    # Every request but the first one of a chain can start from the cached result of the previous one
+    chain_hits = counters.get('el_ops_states_hits', 0)
+    return (counters.get('cells_hits', 0) / cells if cells else 0.0), (chain_hits / chained if chained else 0.0)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(f'{"workers":>8} {"cell hits":>10} {"chain hits":>11}')
+    for workers in args.workers:
+        cell_rate, chain_rate = run(workers, args)
+        print(f'{workers:>8} {cell_rate:>10.1%} {chain_rate:>11.1%}')
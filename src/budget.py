@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+
+import signal
+import threading
+import time
+
+
+class BudgetExceeded(BaseException):
+    """Raised inside computation when its time budget is over"""
+
+
+class Cancelled(BaseException):
+    """Raised inside computation when its request is cancelled"""
+
+
+# Deadline of the innermost active time budget
+deadline = None
+
+
+def supported():
+    """Time budgets interrupt computation with SIGALRM, so they work only in the main thread on Unix"""
+
+    return hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread()
+
+
+def on_alarm(signum, frame):
+    raise BudgetExceeded()
+
+
+def remaining():
+    """Returns seconds left in the innermost active time budget or None"""
+
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def start_timer(until):
+    signal.setitimer(signal.ITIMER_REAL, max(until - time.monotonic(), 1e-3))
+
+
+@contextmanager
+def time_budget(seconds: float = None):
+    """
+    Raises BudgetExceeded inside the block when it runs longer than seconds.
+    Nested budgets can't outlive the outer one.
+
+    Args:
+        seconds (float): time budget, None or 0 disables it.
+    """
+
+    global deadline
+    if not seconds or not supported():
+        yield
+        return
+
+    outer = deadline
+    deadline = time.monotonic() + seconds
+    if outer is not None:
+        deadline = min(deadline, outer)
+    previous = signal.signal(signal.SIGALRM, on_alarm)
+    start_timer(deadline)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        deadline = outer
+        signal.signal(signal.SIGALRM, previous)
+        if outer is not None:
+            start_timer(outer)
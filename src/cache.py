@@ -0,0 +1,198 @@
+from collections import OrderedDict
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# Commands whose result depends only on the text, options and custom commands
+CACHED_COMMANDS = ('inverse', 'matrix_info', 'ref', 'rref', 'transpose')
+# Request fields which change the result of cached commands and their default values
+CACHED_OPTIONS = {'approximate': False, 'engine': 'sympy', 'backend': 'auto'}
+# Fields of responses which are cached, a cached response has the same fields as the computed one
+CACHED_FIELDS = ('res', 'backend')
+# Format of cached values, it's a part of the key, so values of older formats in the SQLite file aren't read
+CACHE_FORMAT = 2
+
+
+class LRUCache:
+    """Dictionary which keeps at most maxsize recently used items"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+    def clear(self):
+        self.items.clear()
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.items), 'maxsize': self.maxsize}
+
+
+class DiskCache:
+    """SQLite table of results which keeps total size of values under max_bytes by removing least recently used"""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                                    'size INTEGER NOT NULL, used REAL NOT NULL)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        self.size = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        row = self.connection.execute('SELECT value FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.connection:
+            self.connection.execute('UPDATE results SET used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, value: str):
+        size = len(key) + len(value.encode())
+        if size > self.max_bytes:
+            return
+        with self.connection:
+            old = self.connection.execute('SELECT size FROM results WHERE key = ?', (key,)).fetchone()
+            self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                                    (key, value, size, time.time()))
+            self.size += size - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Removes least recently used results until they take at most 3/4 of max_bytes"""
+
+        target = self.max_bytes * 3 // 4
+        removed = 0
+        keys = []
+        for key, size in self.connection.execute('SELECT key, size FROM results ORDER BY used'):
+            if self.size - removed <= target:
+                break
+            keys.append((key,))
+            removed += size
+        self.connection.executemany('DELETE FROM results WHERE key = ?', keys)
+        self.size -= removed
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': self.size, 'max_bytes': self.max_bytes}
+
+    def close(self):
+        self.connection.close()
+
+
+class ResultCache:
+    """
+    Content-addressed cache of results of deterministic commands. Results are looked up in memory first
+    and then in the optional SQLite file, which keeps them between sessions.
+    """
+
+    def __init__(self, size: int = 1024, command_file: str = '', path: str = None, max_bytes: int = 64 * 2 ** 20):
+        """
+        Args:
+            size (int): amount of results kept in memory.
+            command_file (str): file with custom latex commands, its content is a part of the key.
+            path (str): SQLite file for results or None to keep them only in memory.
+            max_bytes (int): maximum size of results in the SQLite file.
+        """
+
+        self.lock = threading.Lock()
+        self.memory = LRUCache(size)
+        self.disk = DiskCache(path, max_bytes) if path else None
+        self.command_file = command_file.strip()
+        self.command_file_mtime = None
+        self.command_file_hash = ''
+
+    def preamble_hash(self):
+        """Hash of content of the command file, it's recomputed when the file is changed"""
+
+        if not self.command_file:
+            return ''
+        try:
+            mtime = os.stat(self.command_file).st_mtime_ns
+            if mtime != self.command_file_mtime:
+                with open(self.command_file, 'rb') as f:
+                    self.command_file_hash = hashlib.sha1(f.read()).hexdigest()
+                self.command_file_mtime = mtime
+        except OSError:
+            pass
+        return self.command_file_hash
+
+    def key(self, inp: dict):
+        """Key of request or None if its result can't be cached"""
+
+        command = inp.get('command')
+        text = inp.get('text')
+        if command not in CACHED_COMMANDS or not isinstance(text, str):
+            return None
+        options = [inp.get(option, default) for option, default in CACHED_OPTIONS.items()]
+        with self.lock:
+            preamble = self.preamble_hash()
+        data = json.dumps([CACHE_FORMAT, command, ' '.join(text.split()), options, preamble])
+        return hashlib.sha1(data.encode()).hexdigest()
+
+    def get(self, key: str):
+        """
+        Returns:
+            tuple: tuple({field: value} of CACHED_FIELDS, 'memory' or 'disk') or None if result isn't cached.
+        """
+
+        with self.lock:
+            fields = self.memory.get(key)
+            if fields is not None:
+                return dict(fields), 'memory'
+            if self.disk is None:
+                return None
+            value = self.disk.get(key)
+            if value is None:
+                return None
+            fields = json.loads(value)
+            self.memory.put(key, fields)
+            return dict(fields), 'disk'
+
+    def put(self, key: str, response: dict):
+        """Caches CACHED_FIELDS of response"""
+
+        fields = {field: response[field] for field in CACHED_FIELDS if field in response}
+        with self.lock:
+            self.memory.put(key, fields)
+            if self.disk is not None:
+                self.disk.put(key, json.dumps(fields))
+
+    def info(self):
+        with self.lock:
+            return {'memory': self.memory.info(), 'disk': self.disk.info() if self.disk is not None else None}
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
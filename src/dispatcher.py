@@ -0,0 +1,627 @@
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+
+import budget
+import profiling
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from parsers.latex_parser import Parser
+
+
+# Signal which interrupts request running in worker process
+CANCEL_SIGNAL = getattr(signal, 'SIGUSR1', None)
+
+# Default size of chunks of streamed results in characters
+STREAM_CHUNK_SIZE = 65536
+
+# Requests which are executed by pre-warm to load sympy, ANTLR runtime and caches before real requests
+PREWARM_REQUESTS = (
+    {'command': 'simplify', 'text': r'\frac{x^2 - 1}{x - 1} + \sin(x)^2'},
+    {'command': 'simplify', 'text': r'\matrix{1 & 2 \\ 3 & 4}^{-1} \matrix{1 & 0 \\ 0 & a}'},
+    {'command': 'matrix_info', 'text': r'\matrix{1 & 2 \\ 3 & 4}'},
+    {'command': 'rref', 'text': r'\matrix{a & 1 \\ 1 & a}'},
+    {'command': 'el_ops', 'text': r'\matrix{1 & 2 \\ 3 & 4} \simop{(2) - 3(1)}'},
+)
+
+# Parser of the current worker process, it's created by the first request unless worker is pre-warmed
+worker_parser = None
+# File with custom commands for parser of the current worker process
+worker_command_file = ''
+# Queue for notifying dispatcher which worker started which request
+worker_events = None
+# Id of request running in the current worker process
+current_request = None
+
+
+def create_parser(command_file: str):
+    """Creates parser with custom commands or without them if command file can't be read"""
+
+    # Imported here, because sympy takes most of the startup time
+    from parsers.latex_parser import Parser
+
+    try:
+        return Parser(command_file)
+    except OSError:
+        return Parser()
+
+
+def on_cancel(signum, frame):
+    # Signal may come late, when worker is already idle
+    if current_request is not None:
+        raise budget.Cancelled()
+
+
+def prewarm(parser: 'Parser'):
+    """Executes PREWARM_REQUESTS, so imports and caches are loaded before the first real request"""
+
+    for inp in PREWARM_REQUESTS:
+        execute(parser, inp)
+
+
+def init_worker(command_file: str, events, warm: bool = False, profile_threshold: float = None,
+                profile_dir: str = None, simplify_workers: int = 0, modular_workers: int = 0,
+                modular_threshold: int = None):
+    global worker_parser, worker_events, worker_command_file
+    worker_command_file = command_file
+    worker_events = events
+    profiling.configure(profile_threshold, profile_dir)
+    configure_simplify(simplify_workers)
+    configure_modular(modular_workers, modular_threshold)
+    if simplify_workers or modular_workers:
+        signal.signal(signal.SIGTERM, on_terminate)
+    if CANCEL_SIGNAL is not None:
+        signal.signal(CANCEL_SIGNAL, on_cancel)
+    if warm:
+        worker_parser = create_parser(command_file)
+        prewarm(worker_parser)
+
+
+def configure_simplify(workers: int):
+    """Sets amount of processes which simplify entries of matrices, sympy isn't imported if it's 0"""
+
+    if workers:
+        from engines import simplify
+        simplify.configure(workers)
+
+
+def stop_simplify():
+    """Stops processes which simplify entries of matrices if they were started"""
+
+    simplify = sys.modules.get('engines.simplify')
+    if simplify is not None:
+        simplify.stop()
+
+
+def configure_modular(workers: int, threshold: int = None):
+    """
+    Sets amount of processes which compute det and rank of large integer matrices modulo primes
+    and the smallest size of such matrices, None keeps the default size.
+    """
+
+    if workers or threshold is not None:
+        from engines import modular
+        modular.configure(workers, threshold)
+
+
+def stop_modular():
+    modular = sys.modules.get('engines.modular')
+    if modular is not None:
+        modular.stop()
+
+
+def on_terminate(signum, frame):
+    # Dispatcher terminates workers on shutdown, their own processes have to be stopped too
+    stop_simplify()
+    stop_modular()
+    os._exit(0)
+
+
+def get_worker_parser():
+    global worker_parser
+    if worker_parser is None:
+        worker_parser = create_parser(worker_command_file)
+    return worker_parser
+
+
+def start_worker():
+    """Empty task, submitting it makes executor start a worker process"""
+
+
+def error_response(request_id, message: str, error: str = 'exception'):
+    return {'command': 'error', 'id': request_id, 'error': error, 'res': message}
+
+
+def stream_chunk_size(value):
+    """Chunk size for 'stream' field of request: true for STREAM_CHUNK_SIZE, positive number or None"""
+
+    if value is True:
+        return STREAM_CHUNK_SIZE
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    return None
+
+
+def split_chunks(text: str, size: int):
+    """Yields pieces of text of at most size characters, cut after line breaks (rows of matrices) where possible"""
+
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            cut = text.rfind('\n', start, end)
+            if cut >= start:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+def execute(parser: 'Parser', inp: dict, time_budget: float = None):
+    """
+    Executes one protocol request. If request has 'profile' field, response gets 'profile' with
+    wall time and amount of calls of every stage and hits and misses of parser caches.
+
+    Args:
+        parser (Parser): parser with loaded custom commands.
+        inp (dict): request with 'command', 'text', 'id' and optional 'approximate', 'engine', 'backend',
+            'budget' and 'profile' fields.
+        time_budget (float): default time budget in seconds for the request.
+
+    Returns:
+        dict: response for the request.
+    """
+
+    traced = bool(inp.get('profile'))
+    before = parser.cache_info() if traced else None
+    with profiling.request(inp, traced) as profile, parser.request_scope():
+        response = execute_command(parser, inp, time_budget)
+    if traced:
+        counters = profile['profile']['counters']
+        for name, info in parser.cache_info().items():
+            for key in ('hits', 'misses'):
+                counters[f'{name}_{key}'] = info[key] - before[name][key]
+    response.update(profile)
+    return response
+
+
+def execute_command(parser: 'Parser', inp: dict, time_budget: float = None):
+    request_id = inp.get('id')
+    try:
+        command = inp['command']
+        text = inp['text']
+        approximate = inp.get('approximate', False)
+        engine = inp.get('engine', 'sympy')
+        backend = inp.get('backend', 'auto')
+        time_budget = inp.get('budget', time_budget)
+
+        response = {
+            'command': command,
+            'id': request_id,
+        }
+
+        if command == 'simplify':
+            response['res'], response['partial'] = parser.simplify_expr_with_budget(text, time_budget)
+            return response
+
+        with budget.time_budget(time_budget):
+            if command == 'el_ops':
+                response['res'] = text + '\n' + parser.apply_elementary_operations(text, backend)
+                if inp.get('transforms'):
+                    left, right = parser.elementary_transforms(text)
+                    response['transforms'] = {'left': left, 'right': right}
+            elif command == 'matrix_info':
+                response['res'] = parser.info(text, approximate, engine, backend)
+            elif command == 'transpose':
+                response['res'] = parser.transpose(text, backend)
+            elif command == 'inverse':
+                response['res'] = parser.inv(text, approximate, engine, backend)
+            elif command == 'ref':
+                response['res'] = parser.ref(text, False, approximate, engine, backend)
+            elif command == 'rref':
+                response['res'] = parser.ref(text, True, approximate, engine, backend)
+            else:
+                return error_response(request_id, f'Unknown command: {command}', 'unknown_command')
+            used = parser.used_backend()
+            if used is not None:
+                response['backend'] = used
+    except budget.BudgetExceeded:
+        return error_response(request_id, f'Request exceeded its time budget of {time_budget} seconds', 'timeout')
+    except budget.Cancelled:
+        return error_response(request_id, 'Request was cancelled', 'cancelled')
+    except Exception as e:
+        return error_response(request_id, str(e))
+    return response
+
+
+def run_request(inp: dict, time_budget: float = None):
+    """Executes request in worker process"""
+
+    global current_request
+    current_request = inp.get('id')
+    try:
+        worker_events.put((current_request, os.getpid()))
+        return execute(get_worker_parser(), inp, time_budget)
+    except budget.Cancelled:
+        return error_response(current_request, 'Request was cancelled', 'cancelled')
+    finally:
+        current_request = None
+
+
+class Dispatcher:
+    """
+    Executes requests concurrently in a pool of worker processes and writes responses
+    as soon as they are ready, so responses may come out of order.
+    """
+
+    def __init__(self, command_file: str = '', workers: int = 1, timeout: float = None, time_budget: float = None,
+                 output=sys.stdout, warm: bool = False, cache=None, stats=None, profile: bool = False,
+                 profile_threshold: float = None, profile_dir: str = None, simplify_workers: int = 0,
+                 modular_workers: int = 0, modular_threshold: int = None):
+        """
+        Args:
+            command_file (str): file with custom latex commands.
+            workers (int): amount of worker processes, 0 executes requests in the current process one by one.
+            timeout (float): default time limit for one request in seconds, None or 0 disables it.
+            time_budget (float): default time budget for one request in seconds, after which the request
+                returns partial result or timeout error by itself, None or 0 disables it.
+            output: stream to write JSON responses to.
+            warm (bool): start workers and execute PREWARM_REQUESTS in background, otherwise parser is
+                created by the first request.
+            cache (ResultCache): cache of results of deterministic commands or None.
+            stats (Stats): statistics of completed requests for 'stats' command and trace file or None.
+            profile (bool): attach time of stages to every response, otherwise only to requests with
+                'profile' field. Stages are also recorded for every request if stats have trace file.
+            profile_threshold (float): dump cProfile of requests which run longer than this amount of seconds.
+            profile_dir (str): directory for cProfile dumps.
+            simplify_workers (int): amount of processes which simplify entries of matrices for every worker
+                (or for the current process if there are no workers), 0 simplifies them in the worker.
+            modular_workers (int): amount of processes which compute det and rank of large integer matrices
+                modulo different primes for every worker, 0 computes them in the worker.
+            modular_threshold (int): smallest size of integer matrices which det and rank are computed
+                modulo primes, 0 disables it, None keeps the default.
+        """
+
+        self.command_file = command_file
+        self.warm = warm
+        self.workers = workers
+        self.timeout = timeout or None
+        self.time_budget = time_budget or None
+        self.output = output
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.pending = {}
+        self.requests = {}
+        self.futures = {}
+        self.running = {}
+        self.cancelling = set()
+        self.batches = {}
+        self.cache = cache
+        self.cache_keys = {}
+        self.stats = stats
+        self.profile = profile
+        # Request id -> tuple(start time, command, flag that indicates whether to attach profile to response)
+        self.started = {}
+        # Request id -> size of chunks of its streamed result
+        self.streams = {}
+
+        self.parser = None
+        self.parser_lock = threading.Lock()
+        # Parser isn't thread-safe, pre-warm thread and requests of the main process use it in turn
+        self.execute_lock = threading.Lock()
+        if workers:
+            self.events = multiprocessing.Queue()
+            self.pool = ProcessPoolExecutor(workers, initializer=init_worker,
+                                            initargs=(command_file, self.events, warm, profile_threshold,
+                                                      profile_dir, simplify_workers, modular_workers,
+                                                      modular_threshold))
+            self.listener = threading.Thread(target=self.listen, daemon=True)
+            self.listener.start()
+            if warm:
+                # Executor starts worker processes on demand, one for every task which finds no idle worker
+                for _ in range(workers):
+                    self.pool.submit(start_worker)
+        else:
+            self.pool = None
+            profiling.configure(profile_threshold, profile_dir)
+            configure_simplify(simplify_workers)
+            configure_modular(modular_workers, modular_threshold)
+            if warm:
+                threading.Thread(target=self.prewarm, daemon=True).start()
+
+    def get_parser(self):
+        """Parser of the main process, it's created by the first request or by pre-warm"""
+
+        with self.parser_lock:
+            if self.parser is None:
+                self.parser = create_parser(self.command_file)
+            return self.parser
+
+    def prewarm(self):
+        """Pre-warms parser of the main process, requests wait until it's done"""
+
+        with self.execute_lock:
+            prewarm(self.get_parser())
+
+    def ready(self):
+        """Writes handshake message, requests sent before it are read from the input after it"""
+
+        self.write({'command': 'ready', 'res': {'workers': self.workers, 'warm': self.warm}})
+
+    def write(self, response: dict):
+        with self.lock:
+            self.output.write(json.dumps(response) + '\n')
+            self.output.flush()
+
+    def write_stream(self, response: dict, size: int):
+        """
+        Writes result longer than size as ordered 'chunk' messages with 'seq' numbers, followed by
+        the response without 'res' and with amount of 'chunks'. Messages of one result aren't interleaved
+        with other responses.
+        """
+
+        res = response.get('res')
+        if not isinstance(res, str) or len(res) <= size:
+            self.write(response)
+            return
+        response = {key: value for key, value in response.items() if key != 'res'}
+        head = {'command': 'chunk', 'id': response.get('id')}
+        if 'sub_id' in response:
+            head['sub_id'] = response['sub_id']
+        with self.lock:
+            seq = 0
+            for seq, chunk in enumerate(split_chunks(res, size)):
+                self.output.write(json.dumps({**head, 'seq': seq, 'res': chunk}) + '\n')
+            response['chunks'] = seq + 1
+            self.output.write(json.dumps(response) + '\n')
+            self.output.flush()
+
+    def finish(self, request_id, response: dict):
+        """Writes response if request is still pending"""
+
+        batch_done = None
+        with self.lock:
+            if request_id not in self.pending:
+                return
+            timer = self.pending.pop(request_id)
+            self.requests.pop(request_id, None)
+            cache_key = self.cache_keys.pop(request_id, None)
+            started = self.started.pop(request_id, None)
+            stream = self.streams.pop(request_id, None)
+            if isinstance(request_id, tuple):
+                # Batch item, its id is tuple(batch id, sub-id)
+                response['id'], response['sub_id'] = request_id
+                self.batches[request_id[0]] -= 1
+                if not self.batches[request_id[0]]:
+                    batch_done = request_id[0]
+                    self.batches.pop(batch_done)
+            if not self.pending:
+                self.idle.notify_all()
+        if timer is not None:
+            timer.cancel()
+        if cache_key is not None and response['command'] != 'error':
+            self.cache.put(cache_key, response)
+            response['cached'] = False
+        if started is not None:
+            start, command, attach = started
+            if self.stats is not None:
+                self.stats.record(command, time.perf_counter() - start, response)
+            if not attach:
+                response.pop('profile', None)
+        if stream is not None:
+            self.write_stream(response, stream)
+        else:
+            self.write(response)
+        if batch_done is not None:
+            self.write({'command': 'batch', 'id': batch_done, 'res': 'done'})
+
+    def submit(self, inp: dict):
+        """Schedules request, response is written when request is completed, cancelled or timed out"""
+
+        request_id = inp.get('id')
+        if inp.get('command') == 'cancel':
+            self.write({'command': 'cancel', 'id': request_id, 'target': inp.get('target'),
+                        'res': self.cancel(inp.get('target'))})
+            return
+        if inp.get('command') == 'batch':
+            self.submit_batch(inp)
+            return
+        if inp.get('command') == 'stats':
+            self.write({'command': 'stats', 'id': request_id, 'res': {
+                'commands': self.stats.summary() if self.stats is not None else {},
+                'cache': self.cache.info() if self.cache is not None else None,
+            }})
+            return
+
+        attach = bool(inp.get('profile')) or self.profile
+        if attach or (self.stats is not None and self.stats.trace_file is not None):
+            inp = {**inp, 'profile': True}
+        with self.lock:
+            self.started[request_id] = (time.perf_counter(), inp.get('command'), attach)
+            stream = stream_chunk_size(inp.get('stream'))
+            if stream is not None:
+                self.streams[request_id] = stream
+
+        cache_key = self.cache.key(inp) if self.cache is not None else None
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                with self.lock:
+                    self.pending[request_id] = None
+                self.finish(request_id, {'command': inp['command'], 'id': request_id, **cached[0],
+                                         'cached': cached[1]})
+                return
+
+        if self.pool is None:
+            with self.lock:
+                self.pending[request_id] = None
+                if cache_key is not None:
+                    self.cache_keys[request_id] = cache_key
+            with self.execute_lock:
+                response = execute(self.get_parser(), inp, self.time_budget)
+            self.finish(request_id, response)
+            return
+
+        timeout = inp.get('timeout', self.timeout)
+        timer = None
+        if timeout:
+            timer = threading.Timer(timeout, self.on_timeout, (request_id, timeout))
+            timer.daemon = True
+        with self.lock:
+            self.pending[request_id] = timer
+            self.requests[request_id] = inp
+            if cache_key is not None:
+                self.cache_keys[request_id] = cache_key
+        self.schedule(request_id, inp)
+        if timer is not None:
+            timer.start()
+
+    def submit_batch(self, inp: dict):
+        """
+        Schedules every item of batch request as separate request. Items are executed in parallel,
+        their responses carry batch id and 'sub_id' (item 'id' or its index), and 'batch' response
+        is written after the last item.
+
+        Args:
+            inp (dict): request with 'items' list of {'command', 'text'} dicts, fields other than 'items'
+                (like 'approximate' or 'timeout') are defaults for the items.
+        """
+
+        batch_id = inp.get('id')
+        items = inp.get('items') or []
+        defaults = {key: value for key, value in inp.items() if key not in ('command', 'id', 'items')}
+        with self.lock:
+            duplicate = batch_id in self.batches
+            if items and not duplicate:
+                self.batches[batch_id] = len(items)
+        if duplicate:
+            self.write(error_response(batch_id, 'Batch with this id is already running', 'bad_request'))
+            return
+        if not items:
+            self.write({'command': 'batch', 'id': batch_id, 'res': 'done'})
+        for index, item in enumerate(items):
+            self.submit({**defaults, **item, 'id': (batch_id, item.get('id', index))})
+
+    def schedule(self, request_id, inp: dict):
+        future = self.pool.submit(run_request, inp, self.time_budget)
+        with self.lock:
+            self.futures[request_id] = future
+        future.add_done_callback(lambda f: self.on_done(request_id, f))
+
+    def listen(self):
+        """Tracks which worker runs which request"""
+
+        while True:
+            try:
+                event = self.events.get()
+            except (EOFError, OSError):
+                return
+            if event is None:
+                return
+            request_id, pid = event
+            with self.lock:
+                future = self.futures.get(request_id)
+                if future is None or future.done():
+                    continue
+                self.running[request_id] = pid
+                cancel = request_id in self.cancelling
+            if cancel:
+                self.interrupt(pid)
+
+    def interrupt(self, pid):
+        try:
+            os.kill(pid, CANCEL_SIGNAL)
+        except OSError:
+            pass
+
+    def stop(self, request_id):
+        """
+        Stops request which is waiting in the queue or running in worker process.
+
+        Returns:
+            bool: False if request is already completed or can't be interrupted.
+        """
+
+        with self.lock:
+            future = self.futures.get(request_id)
+            if future is None:
+                return False
+            if future.cancel():
+                return True
+            if CANCEL_SIGNAL is None:
+                return False
+            self.cancelling.add(request_id)
+            pid = self.running.get(request_id)
+        if pid is not None:
+            self.interrupt(pid)
+        return True
+
+    def cancel(self, request_id):
+        """Cancels request or every item of batch request and writes cancelled error for it"""
+
+        with self.lock:
+            items = [key for key in self.pending if isinstance(key, tuple) and key[0] == request_id]
+        if items:
+            return any([self.cancel(item) for item in items])
+
+        with self.lock:
+            if request_id not in self.pending:
+                return False
+        if not self.stop(request_id):
+            return False
+        self.finish(request_id, error_response(request_id, 'Request was cancelled', 'cancelled'))
+        return True
+
+    def on_done(self, request_id, future):
+        with self.lock:
+            self.futures.pop(request_id, None)
+            self.running.pop(request_id, None)
+            requested = request_id in self.cancelling
+            self.cancelling.discard(request_id)
+            inp = self.requests.get(request_id)
+        try:
+            response = future.result()
+        except CancelledError:
+            return
+        except Exception as e:
+            response = error_response(request_id, str(e))
+
+        # Cancel signal was meant for the previous request of this worker
+        if response.get('error') == 'cancelled' and not requested and inp is not None:
+            self.schedule(request_id, inp)
+            return
+        self.finish(request_id, response)
+
+    def on_timeout(self, request_id, timeout):
+        self.finish(request_id, error_response(request_id, f'Request took longer than {timeout} seconds', 'timeout'))
+        self.stop(request_id)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops worker processes.
+
+        Args:
+            wait (bool): write responses for pending requests (or their timeouts) before stopping.
+        """
+
+        if self.pool is not None:
+            if wait:
+                with self.idle:
+                    self.idle.wait_for(lambda: not self.pending)
+            # Executor can't stop running tasks, so workers are terminated directly
+            for process in list((self.pool._processes or {}).values()):
+                process.terminate()
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.events.put(None)
+            self.listener.join()
+        stop_simplify()
+        stop_modular()
+        if self.cache is not None:
+            self.cache.close()
+        if self.stats is not None:
+            self.stats.close()
@@ -0,0 +1,363 @@
+from engines import numeric, sparse, domain, lu, modular, block
+from sympy.matrices.exceptions import NonSquareMatrixError, NonInvertibleMatrixError
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from math import prod
+
+import sympy as sp
+import threading
+
+try:
+    import flint
+except ImportError:
+    flint = None
+
+
+# Smallest size (the larger side) of numeric matrix which is sent to python-flint by 'auto' when it's installed,
+# smaller matrices are eliminated faster than they are converted
+FLINT_MIN_SIZE = 10
+
+# Names of backends selected for the current request, see request_scope
+local = threading.local()
+
+
+class Backend(ABC):
+    """
+    Engine which serves operations on one matrix: det, rank, inv, ref, rref, T and elementary operations.
+    Numeric backends get the matrix as list of rows of Fractions too, symbolic ones get None instead.
+    Results are sympy numbers and sympy matrices. Subclasses have to implement every abstract method,
+    otherwise they can't be instantiated.
+    """
+
+    name = None
+    # Products of elementary operations can be applied at once, see Matrix.apply_operations
+    combines_operations = True
+
+    def __init__(self, engine: str = 'sympy', sparse_matrix: bool = False):
+        """
+        Args:
+            engine (str): engine for symbolic matrices, one of domain.ENGINES.
+            sparse_matrix (bool): matrix is eliminated by sparse algorithms.
+        """
+
+        self.engine = engine
+        self.sparse = sparse_matrix
+
+    @staticmethod
+    def available():
+        return True
+
+    @abstractmethod
+    def det(self, matrix: sp.Matrix, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def rank(self, matrix: sp.Matrix, rows):
+        raise NotImplementedError
+
+    def det_rank(self, matrix: sp.Matrix, rows):
+        """
+        Returns:
+            tuple: tuple(determinant or 0 if matrix isn't square, rank)
+        """
+
+        square = matrix.shape[0] == matrix.shape[1]
+        return (self.det(matrix, rows) if square else 0), self.rank(matrix, rows)
+
+    @abstractmethod
+    def inv(self, matrix: sp.Matrix, rows):
+        raise NotImplementedError
+
+    @abstractmethod
+    def echelon_form(self, matrix: sp.Matrix, rows, reduced: bool):
+        raise NotImplementedError
+
+    @abstractmethod
+    def block_echelon_form(self, left: sp.Matrix, right: sp.Matrix, rows, erows, reduced: bool):
+        """
+        Row echelon form of block matrix [left | right] of \\ematrix.
+
+        Returns:
+            tuple: tuple(left block, right block)
+        """
+
+        raise NotImplementedError
+
+    def transpose(self, matrix: sp.Matrix):
+        return matrix.T
+
+
+class SympyBackend(Backend):
+    """Matrices with any entries: DomainMatrix over polynomial rings and fraction fields or sympy Matrix methods"""
+
+    name = 'sympy'
+    # Simplification of combined entries gives other (equal) forms, so operations are replayed in order
+    combines_operations = False
+
+    def symbolic(self, operation: str, matrix: sp.Matrix):
+        """
+        Runs operation with DomainMatrix engine if it's selected and matrix entries fit polynomial ring
+        or fraction field, otherwise with sympy Matrix.
+
+        Args:
+            operation (str): 'det', 'rank', 'inv' or 'rref'.
+            matrix (sp.Matrix): matrix to run operation on.
+        """
+
+        if self.engine == 'domain':
+            result = getattr(domain, operation)(matrix)
+            if result is not None:
+                return result
+        if operation == 'rref':
+            return matrix.rref()[0]
+        return getattr(matrix, operation)()
+
+    def det(self, matrix, rows):
+        return self.symbolic('det', matrix)
+
+    def rank(self, matrix, rows):
+        return self.symbolic('rank', matrix)
+
+    def det_rank(self, matrix, rows):
+        # Matrices which fit polynomial ring or fraction field are factorized once for both
+        if self.engine == 'domain':
+            factorization = lu.Factorization(matrix)
+            if factorization.lu is not None:
+                return factorization.det(), factorization.rank()
+        return super().det_rank(matrix, rows)
+
+    def inv(self, matrix, rows):
+        return self.symbolic('inv', matrix)
+
+    def echelon_form(self, matrix, rows, reduced):
+        return matrix.echelon_form() if not reduced else self.symbolic('rref', matrix)
+
+    def block_echelon_form(self, left, right, rows, erows, reduced):
+        width = left.shape[1]
+        lines = self.echelon_form(sp.Matrix.hstack(left, right), None, reduced).tolist()
+        return (sp.ImmutableMatrix(len(lines), width, [x for line in lines for x in line[:width]]),
+                sp.ImmutableMatrix(len(lines), right.shape[1], [x for line in lines for x in line[width:]]))
+
+
+class PythonBackend(Backend):
+    """
+    Exact arithmetic over Fractions in pure Python: fraction-free Bareiss elimination of dense matrices,
+    Markowitz elimination of sparse ones and det and rank of large integer matrices modulo primes.
+    """
+
+    name = 'python'
+
+    def det(self, matrix, rows):
+        if self.sparse:
+            return sp.Rational(sparse.det(sparse.from_rows(rows), len(rows)))
+        return sp.Rational(numeric.det(rows))
+
+    def rank(self, matrix, rows):
+        if self.sparse:
+            return sparse.rank(sparse.from_rows(rows))
+        return numeric.rank(rows)
+
+    def det_rank(self, matrix, rows):
+        square = matrix.shape[0] == matrix.shape[1]
+        if self.sparse:
+            if not square:
+                return 0, sparse.rank(sparse.from_rows(rows))
+            det, rank = sparse.det_rank(sparse.from_rows(rows), len(rows))
+            return sp.Rational(det), rank
+        if modular.applies(rows):
+            int_rows, scales = numeric.integer_rows(rows)
+            det, rank = modular.det_rank(int_rows)
+            return (sp.Rational(det, prod(scales)) if square else 0), rank
+        det, rank = numeric.det_rank(rows)
+        return (sp.Rational(det) if square else 0), rank
+
+    def inv(self, matrix, rows):
+        if matrix.shape[0] != matrix.shape[1]:
+            raise NonSquareMatrixError("A Matrix must be square to invert.")
+        if self.sparse:
+            n = len(rows)
+            return numeric.to_matrix(sparse.to_rows(sparse.inv(sparse.from_rows(rows), n), n), matrix.shape)
+        return numeric.to_matrix(numeric.inv(rows), matrix.shape)
+
+    def echelon_form(self, matrix, rows, reduced):
+        if self.sparse and reduced:
+            # Not reduced echelon form isn't unique, so it is left to dense engine to keep the same output
+            width = matrix.shape[1]
+            return numeric.to_matrix(sparse.to_rows(sparse.rref(sparse.from_rows(rows), width), width), matrix.shape)
+        return numeric.to_matrix(numeric.echelon_form(rows, reduced), matrix.shape)
+
+    def block_echelon_form(self, left, right, rows, erows, reduced):
+        width, right_width = left.shape[1], right.shape[1]
+        if self.sparse and reduced:
+            rows, erows = block.sparse_rref(sparse.from_rows(rows), sparse.from_rows(erows), width, right_width)
+            rows, erows = sparse.to_rows(rows, width), sparse.to_rows(erows, right_width)
+        else:
+            rows, erows = block.echelon_form(rows, erows, reduced)
+        return numeric.to_matrix(rows, left.shape), numeric.to_matrix(erows, right.shape)
+
+
+class NumpyBackend(Backend):
+    """Float64 arithmetic with partial pivoting for approximate mode"""
+
+    name = 'numpy'
+
+    @staticmethod
+    def available():
+        return numeric.np is not None
+
+    def det(self, matrix, rows):
+        return sp.Float(numeric.float_det(rows))
+
+    def rank(self, matrix, rows):
+        return numeric.float_rank(rows)
+
+    def inv(self, matrix, rows):
+        return numeric.to_matrix(numeric.float_inv(rows), matrix.shape)
+
+    def echelon_form(self, matrix, rows, reduced):
+        return numeric.to_matrix(numeric.float_echelon_form(rows, reduced), matrix.shape)
+
+    def block_echelon_form(self, left, right, rows, erows, reduced):
+        rows, erows = block.float_echelon_form(rows, erows, reduced)
+        return numeric.to_matrix(rows, left.shape), numeric.to_matrix(erows, right.shape)
+
+
+class FlintBackend(PythonBackend):
+    """
+    Exact arithmetic of python-flint (fmpz_mat and fmpq_mat). REF isn't unique and FLINT has no REF
+    of the same form, so it's computed by the Python backend.
+    """
+
+    name = 'flint'
+
+    @staticmethod
+    def available():
+        return flint is not None
+
+    @staticmethod
+    def to_fmpq_mat(rows, width: int):
+        return flint.fmpq_mat(len(rows), width, [flint.fmpq(x.numerator, x.denominator) for row in rows for x in row])
+
+    @staticmethod
+    def to_matrix(fmpq_mat, shape):
+        return sp.ImmutableMatrix(*shape, [sp.Rational(int(x.p), int(x.q)) for x in fmpq_mat.entries()])
+
+    @staticmethod
+    def to_fmpz_mat(rows, width: int):
+        """Integer matrix with rows multiplied by their denominators and the multipliers"""
+
+        int_rows, scales = numeric.integer_rows(rows)
+        return flint.fmpz_mat(len(rows), width, [x for row in int_rows for x in row]), scales
+
+    def det(self, matrix, rows):
+        int_matrix, scales = self.to_fmpz_mat(rows, matrix.shape[1])
+        return sp.Rational(int(int_matrix.det()), prod(scales))
+
+    def rank(self, matrix, rows):
+        return self.to_fmpz_mat(rows, matrix.shape[1])[0].rank()
+
+    def det_rank(self, matrix, rows):
+        int_matrix, scales = self.to_fmpz_mat(rows, matrix.shape[1])
+        rank = int_matrix.rank()
+        if matrix.shape[0] != matrix.shape[1]:
+            return 0, rank
+        if rank < matrix.shape[0]:
+            return sp.S.Zero, rank
+        return sp.Rational(int(int_matrix.det()), prod(scales)), rank
+
+    def inv(self, matrix, rows):
+        if matrix.shape[0] != matrix.shape[1]:
+            raise NonSquareMatrixError("A Matrix must be square to invert.")
+        try:
+            return self.to_matrix(self.to_fmpq_mat(rows, matrix.shape[1]).inv(), matrix.shape)
+        except ZeroDivisionError:
+            raise NonInvertibleMatrixError("Matrix det == 0; not invertible.")
+
+    def echelon_form(self, matrix, rows, reduced):
+        if not reduced:
+            return super().echelon_form(matrix, rows, reduced)
+        return self.to_matrix(self.to_fmpq_mat(rows, matrix.shape[1]).rref()[0], matrix.shape)
+
+    def block_echelon_form(self, left, right, rows, erows, reduced):
+        if not reduced:
+            return super().block_echelon_form(left, right, rows, erows, reduced)
+        if left.shape[0] == left.shape[1]:
+            # RREF of [A | B] with invertible A is [I | A^-1 B]
+            try:
+                solution = self.to_fmpq_mat(rows, left.shape[1]).solve(self.to_fmpq_mat(erows, right.shape[1]))
+                return sp.ImmutableMatrix(sp.eye(left.shape[0])), self.to_matrix(solution, right.shape)
+            except ZeroDivisionError:
+                pass
+        width = left.shape[1]
+        joined = [row + erow for row, erow in zip(rows, erows)]
+        reduced_rows = self.to_fmpq_mat(joined, width + right.shape[1]).rref()[0]
+        lines = self.to_matrix(reduced_rows, (len(rows), width + right.shape[1])).tolist()
+        return (sp.ImmutableMatrix(len(lines), width, [x for line in lines for x in line[:width]]),
+                sp.ImmutableMatrix(len(lines), right.shape[1], [x for line in lines for x in line[width:]]))
+
+
+REGISTRY = {backend.name: backend for backend in (SympyBackend, PythonBackend, NumpyBackend, FlintBackend)}
+# Backends which can be requested, 'auto' selects one by entries and size of matrix
+BACKENDS = ('auto',) + tuple(REGISTRY)
+
+
+def select(rational: bool, shape: tuple, approximate: bool = False, engine: str = 'sympy',
+           sparse_matrix: bool = False, requested: str = 'auto'):
+    """
+    Chooses backend for matrix. Requested backend is used if it supports the entries, symbolic matrices
+    are always served by SymPy. 'auto' takes NumPy for approximate mode, python-flint for large numeric
+    matrices when it's installed and the Python backend otherwise.
+
+    Args:
+        rational (bool): all entries are rational numbers.
+        shape (tuple): shape of matrix.
+        approximate (bool): use float arithmetic for numeric matrices.
+        engine (str): engine for symbolic matrices, one of domain.ENGINES.
+        sparse_matrix (bool): matrix is sparse, see engines.sparse.
+        requested (str): one of BACKENDS.
+
+    Returns:
+        Backend: backend for the matrix.
+    """
+
+    if requested not in BACKENDS:
+        raise ValueError(f"Unknown backend: {requested}")
+    if requested != 'auto' and not REGISTRY[requested].available():
+        raise ValueError(f"Backend {requested} is not installed")
+
+    if requested != 'auto' and (rational or requested == 'sympy'):
+        backend = REGISTRY[requested]
+    elif not rational:
+        backend = SympyBackend
+    elif approximate and NumpyBackend.available():
+        backend = NumpyBackend
+    elif FlintBackend.available() and min(shape) > 0 and max(shape) >= FLINT_MIN_SIZE:
+        backend = FlintBackend
+    else:
+        backend = PythonBackend
+
+    used = getattr(local, 'used', None)
+    if used is not None:
+        used.append(backend.name)
+    return backend(engine, sparse_matrix)
+
+
+@contextmanager
+def request_scope():
+    """Records names of backends selected until the end of the block, see used"""
+
+    if getattr(local, 'used', None) is not None:
+        yield
+        return
+    local.used = []
+    try:
+        yield
+    finally:
+        local.used = None
+
+
+def used():
+    """Name of the last backend selected in the current request or None"""
+
+    names = getattr(local, 'used', None)
+    return names[-1] if names else None
@@ -0,0 +1,127 @@
+from engines import numeric, sparse
+from engines.lu import FractionFreeLU
+from fractions import Fraction
+from math import lcm
+
+
+def integer_blocks(left, right):
+    """
+    Multiplies every row of block matrix [left | right] by the lcm of denominators of the whole row.
+
+    Returns:
+        tuple: tuple(left rows of ints, right rows of ints)
+    """
+
+    int_left = []
+    int_right = []
+    for l_row, r_row in zip(left, right):
+        scale = lcm(*(x.denominator for x in l_row), *(x.denominator for x in r_row))
+        int_left.append([x.numerator * (scale // x.denominator) for x in l_row])
+        int_right.append([x.numerator * (scale // x.denominator) for x in r_row])
+    return int_left, int_right
+
+
+def eliminate(left, right, reduced: bool = False, factors: list = None):
+    """
+    Fraction-free (Bareiss) elimination of block matrix [left | right] of ints, modifies both blocks in place.
+    Pivots are searched in the left block only, rows of the right block get the same row operations.
+    If the left block runs out of pivots before rows, the remaining rows are eliminated on the right block,
+    so the result is the echelon form of the joined matrix.
+
+    Args:
+        left (list): list of rows of ints.
+        right (list): list of rows of ints, the same amount as left.
+        reduced (bool): eliminate above pivots too (Gauss-Jordan).
+        factors (list): optional row multipliers, updated in place, see numeric.sympy_factors.
+
+    Returns:
+        int: last pivot value.
+    """
+
+    n = len(left)
+    width = len(left[0]) if left else 0
+    m = width + (len(right[0]) if right else 0)
+    prev = 1
+    r = 0
+    for c in range(m):
+        if r == n:
+            break
+        # Pivot column is taken from the left block first
+        block, j = (left, c) if c < width else (right, c - width)
+        p = next((i for i in range(r, n) if block[i][j]), None)
+        if p is None:
+            continue
+        if p != r:
+            left[r], left[p] = left[p], left[r]
+            right[r], right[p] = right[p], right[r]
+            if factors is not None:
+                factors[r], factors[p] = factors[p], factors[r]
+
+        pivot_left = left[r]
+        pivot_right = right[r]
+        piv = block[r][j]
+        for i in range(0 if reduced else r + 1, n):
+            if i == r:
+                continue
+            a = block[i][j]
+            if a:
+                left[i] = [(piv * x - a * y) // prev for x, y in zip(left[i], pivot_left)]
+                right[i] = [(piv * x - a * y) // prev for x, y in zip(right[i], pivot_right)]
+            elif piv != prev:
+                left[i] = [piv * x // prev for x in left[i]]
+                right[i] = [piv * x // prev for x in right[i]]
+            if factors is not None:
+                numeric.sympy_factors(factors, i, r, a, piv, prev)
+        prev = piv
+        r += 1
+    return prev
+
+
+def echelon_form(left, right, reduced: bool = False):
+    """
+    Row echelon form of block matrix [left | right] given as two lists of rows of Fractions.
+    RREF of a square invertible left block is [I | left^-1 right], it's computed by
+    fraction-free LU of the left block and substitution of the right block.
+
+    Returns:
+        tuple: tuple(left rows, right rows), REF of the same form as Matrix.echelon_form of sympy
+        or RREF, rows of Fractions.
+    """
+
+    if not left:
+        return left, right
+    if not reduced:
+        factors = [Fraction(1, lcm(*(x.denominator for x in l_row), *(x.denominator for x in r_row)))
+                   for l_row, r_row in zip(left, right)]
+        left, right = integer_blocks(left, right)
+        eliminate(left, right, False, factors)
+        return ([[factor * x for x in row] for factor, row in zip(factors, left)],
+                [[factor * x for x in row] for factor, row in zip(factors, right)])
+    left, right = integer_blocks(left, right)
+    n = len(left)
+    if n == len(left[0]):
+        lu = FractionFreeLU(left, 1)
+        if lu.rank() == n:
+            y, d = lu.solve(right)
+            identity = [[Fraction(int(i == j)) for j in range(n)] for i in range(n)]
+            return identity, [[Fraction(x, d) for x in row] for row in y]
+    last = eliminate(left, right, True)
+    return [[Fraction(x, last) for x in row] for row in left], [[Fraction(x, last) for x in row] for row in right]
+
+
+def float_echelon_form(left, right, reduced: bool = False):
+    """Row echelon form of block matrix [left | right] with partial pivoting in float64"""
+
+    width = len(left[0]) if left else 0
+    rows = numeric.float_echelon_form([l_row + r_row for l_row, r_row in zip(left, right)], reduced)
+    return [row[:width] for row in rows], [row[width:] for row in rows]
+
+
+def sparse_rref(left, right, width: int, right_width: int):
+    """Reduced row echelon form of sparse block matrix [left | right], blocks are lists of {column: Fraction} dicts"""
+
+    joined = [{**l_row, **{width + j: x for j, x in r_row.items()}} for l_row, r_row in zip(left, right)]
+    rows = sparse.rref(joined, width + right_width)
+    left = [{j: x for j, x in row.items() if j < width} for row in rows]
+    right = [{j - width: x for j, x in row.items() if j >= width} for row in rows]
+    return left, right
@@ -0,0 +1,101 @@
+from sympy.polys.matrices import DomainMatrix
+from sympy.polys.matrices.exceptions import DMNonInvertibleMatrixError
+from sympy.matrices.exceptions import NonSquareMatrixError, NonInvertibleMatrixError
+
+import sympy as sp
+
+
+# Engines for symbolic matrices: plain sympy Matrix (default) or DomainMatrix over polynomial rings and fraction fields
+ENGINES = ('sympy', 'domain')
+
+
+def to_domain(matrix: sp.Matrix):
+    """
+    Converts matrix to DomainMatrix over the tightest domain (ZZ, QQ, ZZ[x,...], ZZ(x,...), ...).
+
+    Returns:
+        DomainMatrix: converted matrix or None if entries don't fit exact polynomial domain.
+    """
+
+    dm = DomainMatrix.from_Matrix(matrix)
+    domain = dm.domain
+    if domain.is_EX or domain.is_EXRAW or not domain.is_Exact:
+        return None
+    return dm
+
+
+def clear_denominators(dm: DomainMatrix):
+    """
+    Multiplies rows by their denominators.
+
+    Returns:
+        tuple: tuple(diagonal DomainMatrix of multipliers or None, DomainMatrix over ring)
+    """
+
+    if not dm.domain.is_Field or not dm.domain.has_assoc_Ring:
+        return None, dm
+    return dm.clear_denoms_rowwise(convert=True)
+
+
+def quotient(ring, numerator, denominator):
+    """Quotient of elements of ring as sympy expression, cancelled in its fraction field"""
+
+    field = ring.get_field()
+    return field.to_sympy(field.quo(field.convert_from(numerator, ring), field.convert_from(denominator, ring)))
+
+
+def divide(dm: DomainMatrix, denominator):
+    """Divides every entry of matrix over ring by ring element and returns result as sympy matrix"""
+
+    field = dm.to_field()
+    domain = field.domain
+    return field.mul(domain.quo(domain.one, domain.convert_from(denominator, dm.domain))).to_Matrix()
+
+
+def det(matrix: sp.Matrix):
+    """Fraction-free determinant over the tightest domain or None if matrix doesn't fit one"""
+
+    dm = to_domain(matrix)
+    if dm is None:
+        return None
+    multipliers, dm = clear_denominators(dm)
+    result = dm.det()
+    if multipliers is None:
+        return dm.domain.to_sympy(result)
+    return quotient(dm.domain, result, multipliers.det())
+
+
+def rank(matrix: sp.Matrix):
+    dm = to_domain(matrix)
+    if dm is None:
+        return None
+    return clear_denominators(dm)[1].rank()
+
+
+def rref(matrix: sp.Matrix):
+    """Reduced row echelon form computed by fraction-free Gauss-Jordan elimination or None"""
+
+    dm = to_domain(matrix)
+    if dm is None:
+        return None
+    numerator, denominator, _ = clear_denominators(dm)[1].rref_den()
+    return divide(numerator, denominator)
+
+
+def inv(matrix: sp.Matrix):
+    """Inverse computed by fraction-free elimination or None if matrix doesn't fit exact domain"""
+
+    if matrix.shape[0] != matrix.shape[1]:
+        raise NonSquareMatrixError("A Matrix must be square to invert.")
+    dm = to_domain(matrix)
+    if dm is None:
+        return None
+    multipliers, dm = clear_denominators(dm)
+    try:
+        numerator, denominator = dm.inv_den()
+    except DMNonInvertibleMatrixError:
+        raise NonInvertibleMatrixError("Matrix det == 0; not invertible.")
+    if multipliers is not None:
+        # A = D^-1 N, so A^-1 = N^-1 D
+        numerator = numerator.matmul(multipliers.convert_to(numerator.domain))
+    return divide(numerator, denominator)
@@ -0,0 +1,197 @@
+from sympy.polys.matrices import DomainMatrix
+from sympy.polys.polyerrors import CoercionFailed
+from sympy.matrices.exceptions import NonInvertibleMatrixError
+from engines import numeric, domain
+from fractions import Fraction
+from math import lcm, prod
+
+import sympy as sp
+
+
+class FractionFreeLU:
+    """
+    Fraction-free LU factorization of matrix over integral domain (ints, polynomials, ...).
+    Matrix is eliminated by Bareiss algorithm once, the row swaps and multipliers of every step are kept,
+    so systems with any right-hand side are solved by replaying them and back substitution
+    without eliminating the matrix again. Every division is exact, entries stay in the domain.
+    """
+
+    def __init__(self, rows, one):
+        """
+        Args:
+            rows (list): list of rows of domain elements, it isn't modified.
+            one: unit of the domain.
+        """
+
+        self.n = len(rows)
+        self.m = len(rows[0]) if rows else 0
+        self.u = [list(row) for row in rows]
+        # tuple(row swapped with pivot row, pivot, previous pivot, entries of rows below in pivot column)
+        self.steps = []
+        self.pivots = []
+        self.sign = 1
+
+        u = self.u
+        prev = one
+        r = 0
+        for c in range(self.m):
+            if r == self.n:
+                break
+            p = next((i for i in range(r, self.n) if u[i][c]), None)
+            if p is None:
+                continue
+            if p != r:
+                u[r], u[p] = u[p], u[r]
+                self.sign = -self.sign
+
+            pivot_row = u[r]
+            piv = pivot_row[c]
+            multipliers = []
+            for i in range(r + 1, self.n):
+                row = u[i]
+                a = row[c]
+                multipliers.append(a)
+                if a:
+                    u[i] = [(piv * x - a * y) // prev for x, y in zip(row, pivot_row)]
+                elif piv != prev:
+                    u[i] = [piv * x // prev for x in row]
+            self.steps.append((p, piv, prev, multipliers))
+            self.pivots.append(c)
+            prev = piv
+            r += 1
+        self.last = prev
+
+    def rank(self):
+        return len(self.pivots)
+
+    def det(self):
+        """Determinant of square matrix, zero of the domain is returned as 0"""
+
+        if self.rank() != self.n:
+            return 0
+        return self.last if self.sign > 0 else -self.last
+
+    def solve(self, rhs):
+        """
+        Solves A X = rhs for invertible A.
+
+        Args:
+            rhs (list): list of rows of domain elements.
+
+        Returns:
+            tuple: tuple(list of rows of domain elements Y, denominator d), X = Y / d.
+        """
+
+        if self.n != self.m or self.rank() != self.n:
+            raise NonInvertibleMatrixError("Matrix det == 0; not invertible.")
+        b = [list(row) for row in rhs]
+        for r, (p, piv, prev, multipliers) in enumerate(self.steps):
+            if p != r:
+                b[r], b[p] = b[p], b[r]
+            pivot_row = b[r]
+            for i, a in enumerate(multipliers, r + 1):
+                if a:
+                    b[i] = [(piv * x - a * y) // prev for x, y in zip(b[i], pivot_row)]
+                elif piv != prev:
+                    b[i] = [piv * x // prev for x in b[i]]
+
+        # The last pivot is determinant of eliminated matrix, so d * X has entries in the domain
+        d = self.last
+        for i in range(self.n - 1, -1, -1):
+            row = self.u[i]
+            acc = [d * x for x in b[i]]
+            for j in range(i + 1, self.n):
+                if row[j]:
+                    acc = [s - row[j] * y for s, y in zip(acc, b[j])]
+            b[i] = [s // row[i] for s in acc]
+        return b, d
+
+
+class Factorization:
+    """
+    Factorization of sympy matrix shared by all operations with it: over integers for numeric matrices,
+    over polynomial ring for matrices which fit one (rows are multiplied by their denominators first).
+    Matrices with other entries fall back to sympy Matrix methods.
+    """
+
+    def __init__(self, matrix: sp.Matrix):
+        self.matrix = matrix
+        self.shape = matrix.shape
+        self.lu = None
+        self.inverse_matrix = None
+        # Row multipliers which clear denominators: list of ints or diagonal DomainMatrix
+        self.scales = None
+        self.ring = None
+
+        rows = numeric.to_rows(matrix)
+        if rows is not None:
+            int_rows, self.scales = numeric.integer_rows(rows)
+            self.lu = FractionFreeLU(int_rows, 1)
+            return
+        dm = domain.to_domain(matrix)
+        if dm is not None:
+            self.scales, dm = domain.clear_denominators(dm)
+            self.ring = dm.domain
+            self.lu = FractionFreeLU(dm.to_list(), self.ring.one)
+
+    def det(self):
+        if self.shape[0] != self.shape[1]:
+            return 0
+        if self.lu is None:
+            return self.matrix.det()
+        det = self.lu.det()
+        if self.ring is None:
+            return sp.Rational(det, prod(self.scales))
+        det = self.ring.convert(det)
+        if self.scales is None:
+            return self.ring.to_sympy(det)
+        return domain.quotient(self.ring, det, self.scales.det())
+
+    def rank(self):
+        if self.lu is None:
+            return self.matrix.rank()
+        return self.lu.rank()
+
+    def solve(self, rhs: sp.Matrix):
+        """Returns A^-1 rhs computed by the factorization without inverting A"""
+
+        if self.lu is not None:
+            if self.ring is None:
+                result = self.solve_numeric(rhs)
+            else:
+                result = self.solve_domain(rhs)
+            if result is not None:
+                return sp.ImmutableMatrix(result)
+        return self.inverse() * rhs
+
+    def solve_numeric(self, rhs: sp.Matrix):
+        rows = numeric.to_rows(rhs)
+        if rows is None:
+            return None
+        # A X = B is solved as (S A) X = S B q with integer right side
+        rows = [[x * scale for x in row] for row, scale in zip(rows, self.scales)]
+        q = lcm(*(x.denominator for row in rows for x in row)) if rhs.shape[1] else 1
+        y, d = self.lu.solve([[int(x * q) for x in row] for row in rows])
+        return numeric.to_matrix([[Fraction(x, d * q) for x in row] for row in y], rhs.shape)
+
+    def solve_domain(self, rhs: sp.Matrix):
+        field = self.ring.get_field()
+        try:
+            b = DomainMatrix.from_Matrix(rhs).convert_to(field)
+        except (CoercionFailed, ValueError):
+            # Entries of rhs don't fit the field of the matrix (e.g. sqrt(2) over ZZ(a)), so A^-1 is multiplied
+            return None
+        if self.scales is not None:
+            b = self.scales.convert_to(field).matmul(b)
+        q, b = b.clear_denoms(convert=True)
+        y, d = self.lu.solve(b.convert_to(self.ring).to_list())
+        q = self.ring.convert_from(q.element, q.domain)
+        return domain.divide(DomainMatrix(y, rhs.shape, self.ring), self.ring.convert(d) * q)
+
+    def inverse(self):
+        if self.inverse_matrix is None:
+            if self.lu is None:
+                self.inverse_matrix = sp.ImmutableMatrix(self.matrix.inv())
+            else:
+                self.inverse_matrix = self.solve(sp.eye(self.shape[0]))
+        return self.inverse_matrix
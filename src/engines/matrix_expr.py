@@ -0,0 +1,206 @@
+from engines.lu import Factorization
+from sympy.matrices.expressions import MatrixExpr, MatrixSymbol, MatMul, MatAdd, MatPow, Transpose, Inverse, \
+    Identity, ZeroMatrix
+
+import sympy as sp
+
+
+def chain_order(dims):
+    """
+    Finds the cheapest order of multiplication of matrix chain by dynamic programming.
+
+    Args:
+        dims (list): dims[i] x dims[i + 1] is the shape of the i-th matrix.
+
+    Returns:
+        tuple: tuple(amount of scalar multiplications, table where split[i][j] is the index of the last matrix
+        of the left part of the cheapest product of matrices i..j).
+    """
+
+    n = len(dims) - 1
+    cost = [[0] * n for _ in range(n)]
+    split = [[0] * n for _ in range(n)]
+    for length in range(1, n):
+        for i in range(n - length):
+            j = i + length
+            best = None
+            for k in range(i, j):
+                current = cost[i][k] + cost[k + 1][j] + dims[i] * dims[k + 1] * dims[j + 1]
+                if best is None or current < best:
+                    best, split[i][j] = current, k
+            cost[i][j] = best
+    return (cost[0][n - 1] if n else 0), split
+
+
+def explicit(expr):
+    """Explicit matrix of Identity or ZeroMatrix"""
+
+    if isinstance(expr, Identity):
+        return sp.ImmutableMatrix(sp.eye(*expr.shape))
+    return sp.ImmutableMatrix(sp.zeros(*expr.shape))
+
+
+def explicit_constants(expr):
+    """Replaces Identity and ZeroMatrix, which sympy folds products and sums of matrices into, with explicit matrices"""
+
+    if isinstance(expr, (Identity, ZeroMatrix)):
+        return explicit(expr)
+    if not isinstance(expr, sp.Basic) or not expr.has(Identity, ZeroMatrix):
+        return expr
+    return expr.replace(lambda x: isinstance(x, (Identity, ZeroMatrix)), explicit)
+
+
+def substitute(expr, symbols: dict):
+    """
+    Replaces symbols in expression like xreplace, but powers of replaced matrices become MatPow:
+    sympy's Pow takes M^0 for scalar 1 before it sees that M is a matrix.
+
+    Args:
+        expr: sympy expression.
+        symbols (dict): {Symbol: matrix expression or other replacement}.
+
+    Returns:
+        expression with replaced symbols.
+    """
+
+    if expr in symbols:
+        return symbols[expr]
+    if not expr.args:
+        return expr
+    args = [substitute(arg, symbols) for arg in expr.args]
+    if expr.is_Pow and isinstance(args[0], MatrixExpr):
+        return MatPow(*args)
+    if all(new is old for new, old in zip(args, expr.args)):
+        return expr
+    return expr.func(*args)
+
+
+def flatten_product(expr: MatMul):
+    """
+    Splits nested product into scalar coefficient and list of matrix factors.
+
+    Returns:
+        tuple: tuple(scalar coefficient, list of matrix expressions).
+    """
+
+    coeff = sp.S.One
+    factors = []
+    for arg in expr.args:
+        if isinstance(arg, MatMul):
+            arg_coeff, arg_factors = flatten_product(arg)
+            coeff *= arg_coeff
+            factors.extend(arg_factors)
+        elif isinstance(arg, MatrixExpr):
+            factors.append(arg)
+        else:
+            coeff *= arg
+    return coeff, factors
+
+
+class Evaluator:
+    """
+    Evaluates matrix expression with MatrixSymbol placeholders. Products are computed in the cheapest
+    order for shapes of factors, and every subexpression (and every part of a product) is computed once.
+    Inverses are never multiplied: A^-1 B is computed as solution of A X = B by LU factorization of A,
+    which is computed once for every matrix and shared by all its inverses.
+    """
+
+    def __init__(self, values: dict):
+        """
+        Args:
+            values (dict): {MatrixSymbol: explicit matrix}.
+        """
+
+        self.values = values
+        self.memo = {}
+        self.factorizations = {}
+
+    def factorization(self, expr) -> Factorization:
+        """LU factorization of evaluated matrix expression, computed once per expression and per explicit matrix"""
+
+        key = self.values.get(expr, expr)
+        result = self.factorizations.get(key)
+        if result is None:
+            result = self.factorizations[key] = Factorization(self.evaluate(expr))
+        return result
+
+    def partial(self, expr):
+        """
+        Expression with explicit matrices in place of placeholders and of subexpressions evaluated so far,
+        the rest of operations stays unevaluated. It's the result of evaluation interrupted by time budget.
+        """
+
+        known = {key: value for key, value in self.memo.items() if isinstance(key, sp.Basic)}
+        return explicit_constants(expr.xreplace({**self.values, **known}))
+
+    def evaluate(self, expr):
+        result = self.memo.get(expr)
+        if result is None:
+            result = self.memo[expr] = self.compute(expr)
+        return result
+
+    def compute(self, expr):
+        if isinstance(expr, MatrixSymbol) and expr in self.values:
+            return self.values[expr]
+        if isinstance(expr, (Identity, ZeroMatrix)):
+            return explicit(expr)
+        if isinstance(expr, MatMul):
+            coeff, factors = flatten_product(expr)
+            result = self.product(tuple(factors))
+            return result if coeff == 1 else coeff * result
+        if isinstance(expr, MatAdd):
+            result = None
+            for arg in expr.args:
+                value = self.evaluate(arg)
+                result = value if result is None else result + value
+            return result
+        if isinstance(expr, MatPow) and expr.exp.is_Integer:
+            return self.evaluate(expr.base) ** expr.exp
+        if isinstance(expr, Transpose):
+            return self.evaluate(expr.arg).T
+        if isinstance(expr, Inverse):
+            return self.factorization(expr.arg).inverse()
+        # Functions of matrices, scalar expressions, ...: sympy evaluates them after substitution
+        return explicit_constants(expr.xreplace(self.values))
+
+    def product(self, factors: tuple):
+        """Product of matrix expressions in the cheapest order"""
+
+        dims = [factors[0].shape[0]] + [factor.shape[1] for factor in factors]
+        if any(not isinstance(d, (int, sp.Integer)) for d in dims):
+            result = self.evaluate(factors[0])
+            for factor in factors[1:]:
+                result = result * self.evaluate(factor)
+            return result
+        split = chain_order([int(d) for d in dims])[1]
+        return self.split_product(factors, split, 0, len(factors) - 1)
+
+    def split_product(self, factors: tuple, split: list, i: int, j: int):
+        if i == j:
+            return self.evaluate(factors[i])
+        key = ('product', factors[i:j + 1])
+        result = self.memo.get(key)
+        if result is None:
+            k = split[i][j]
+            right = self.split_product(factors, split, k + 1, j)
+            if i == k and isinstance(factors[i], Inverse):
+                result = self.factorization(factors[i].arg).solve(right)
+            else:
+                result = self.split_product(factors, split, i, k) * right
+            self.memo[key] = result
+        return result
+
+
+def evaluate(expr, values: dict):
+    """
+    Substitutes explicit matrices into expression with MatrixSymbol placeholders and evaluates it.
+
+    Args:
+        expr: sympy expression.
+        values (dict): {MatrixSymbol: explicit matrix}.
+
+    Returns:
+        evaluated expression.
+    """
+
+    return Evaluator(values).evaluate(expr)
@@ -0,0 +1,171 @@
+from sympy import prevprime
+from math import log2, prod
+
+import multiprocessing
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Primes are below 2^31, so product of two residues fits int64
+PRIME_LIMIT = 2 ** 31
+# Smallest size of integer matrix (the smaller side) which det and rank are computed modulo primes
+threshold = 40
+# Amount of processes which eliminate matrix modulo different primes, 0 eliminates in the current process
+workers = 0
+
+pool = None
+primes = []
+
+
+def configure(amount: int, size: int = None):
+    """Sets amount of processes and threshold size of matrices, threshold 0 disables modular engine"""
+
+    global workers, threshold
+    if size is not None:
+        threshold = size
+    if amount != workers:
+        stop()
+        workers = amount
+
+
+def get_pool():
+    global pool
+    if pool is None:
+        pool = multiprocessing.Pool(workers)
+    return pool
+
+
+def stop():
+    global pool
+    if pool is None:
+        return
+    pool.terminate()
+    pool.join()
+    pool = None
+
+
+def applies(rows):
+    """Checks whether det and rank of matrix given as list of rows are computed by modular engine"""
+
+    return np is not None and threshold > 0 and bool(rows) and min(len(rows), len(rows[0])) >= threshold
+
+
+def get_primes(amount: int):
+    """The largest primes below PRIME_LIMIT"""
+
+    while len(primes) < amount:
+        primes.append(prevprime(primes[-1] if primes else PRIME_LIMIT))
+    return primes[:amount]
+
+
+def line_bits(lines, k: int):
+    """Amount of bits of the product of the k largest Euclidean norms of non-zero lines"""
+
+    logs = sorted((log2(sum(x * x for x in line)) / 2 for line in lines if any(line)), reverse=True)
+    return sum(logs[:k])
+
+
+def hadamard_bits(rows):
+    """
+    Amount of bits of the Hadamard bound of every minor of integer matrix. Minor of size up to k (the smaller
+    side) has k rows which are parts of rows of the matrix, so its |value| doesn't exceed the product of
+    the k largest norms of non-zero rows, and the same holds for columns. The smaller bound is taken.
+    For square matrix without zero rows it's the Hadamard bound of |det|.
+    """
+
+    k = min(len(rows), len(rows[0]))
+    return int(min(line_bits(rows, k), line_bits(zip(*rows), k))) + 1
+
+
+def det_rank_mod(rows, p: int):
+    """
+    Determinant and rank of integer matrix modulo prime p by Gaussian elimination over int64 numpy array.
+
+    Returns:
+        tuple: tuple(determinant modulo p or None if matrix isn't square, rank modulo p)
+    """
+
+    a = rows % p if isinstance(rows, np.ndarray) else np.array([[x % p for x in row] for row in rows], dtype=np.int64)
+    n, m = a.shape
+    det = 1
+    r = 0
+    for c in range(m):
+        if r == n:
+            break
+        nonzero = np.flatnonzero(a[r:, c])
+        if not len(nonzero):
+            det = 0
+            continue
+        k = r + int(nonzero[0])
+        if k != r:
+            a[[r, k]] = a[[k, r]]
+            det = -det
+        piv = int(a[r, c])
+        det = det * piv % p
+        inverse = pow(piv, -1, p)
+        factors = a[r + 1:, c] * inverse % p
+        # Residues are below 2^31, so the difference fits int64 before reduction
+        a[r + 1:, c:] = (a[r + 1:, c:] - np.outer(factors, a[r, c:])) % p
+        r += 1
+    if n != m:
+        return None, r
+    return (det % p if r == n else 0), r
+
+
+def det_rank_primes(rows, chunk):
+    return [det_rank_mod(rows, p) for p in chunk]
+
+
+def crt(residues, moduli):
+    """Integer x from [-M / 2, M / 2) with x = residues[i] modulo moduli[i], M is product of moduli"""
+
+    modulus = prod(moduli)
+    x = 0
+    for r, p in zip(residues, moduli):
+        q = modulus // p
+        x += r * q * pow(q, -1, p)
+    x %= modulus
+    return x - modulus if 2 * x >= modulus else x
+
+
+def det_rank(rows):
+    """
+    Exact determinant and rank of integer matrix given as list of rows. Matrix is eliminated modulo
+    enough primes to exceed twice the Hadamard bound of its minors, in parallel if there are workers,
+    and determinant is rebuilt by the Chinese remainder theorem. Rank is the largest rank modulo the primes:
+    a non-zero minor of the size of rank is smaller than the product of the primes, so some prime
+    doesn't divide it and keeps the rank.
+
+    Returns:
+        tuple: tuple(determinant or None if matrix isn't square, rank)
+    """
+
+    square = len(rows) == len(rows[0])
+    amount = (hadamard_bits(rows) + 2) // 30 + 1
+    if max(abs(x) for row in rows for x in row) < 2 ** 63:
+        # Matrix is converted once, and every prime reduces the array
+        rows = np.array(rows, dtype=np.int64)
+    moduli = get_primes(amount)
+    if workers and amount > 1:
+        chunks = [moduli[i::workers] for i in range(min(workers, amount))]
+        try:
+            results = get_pool().starmap_async(det_rank_primes, [(rows, chunk) for chunk in chunks]).get()
+        except BaseException:
+            # Time budget is exceeded or request is cancelled, processes shouldn't keep eliminating
+            stop()
+            raise
+        order = [p for chunk in chunks for p in chunk]
+        results = dict(zip(order, (result for chunk in results for result in chunk)))
+        results = [results[p] for p in moduli]
+    else:
+        results = det_rank_primes(rows, moduli)
+
+    rank = max(rank for _, rank in results)
+    if not square:
+        return None, rank
+    if rank < len(rows):
+        return 0, rank
+    return crt([det for det, _ in results], moduli), rank
@@ -0,0 +1,280 @@
+from fractions import Fraction
+from sympy.matrices.exceptions import NonSquareMatrixError, NonInvertibleMatrixError
+from math import lcm
+
+import sympy as sp
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Relative tolerance used to decide whether a float pivot is zero
+FLOAT_TOLERANCE = 1e-12
+
+
+def to_rows(matrix: sp.Matrix):
+    """
+    Converts sympy matrix to list of rows of Fractions if every entry is a rational number.
+
+    Args:
+        matrix (sp.Matrix): parsed matrix.
+
+    Returns:
+        list: list of rows of Fractions or None if matrix has non-numeric entries.
+    """
+
+    return lists_to_rows(matrix.tolist())
+
+
+def lists_to_rows(lines):
+    """Converts list of rows of sympy entries to list of rows of Fractions, None if some entry isn't rational"""
+
+    rows = []
+    for line in lines:
+        row = []
+        for entry in line:
+            if not entry.is_Rational:
+                return None
+            row.append(Fraction(int(entry.p), int(entry.q)))
+        rows.append(row)
+    return rows
+
+
+def to_sympy(x):
+    """Converts Fraction, int or float to sympy number"""
+
+    if isinstance(x, Fraction):
+        return sp.Rational(x.numerator, x.denominator)
+    elif isinstance(x, int):
+        return sp.Integer(x)
+    return sp.Float(float(x))
+
+
+def to_matrix(rows, shape=None):
+    """Converts list of rows of Fractions (or floats) back to sympy matrix"""
+
+    if not rows:
+        return sp.zeros(*shape) if shape else sp.Matrix(rows)
+    return sp.Matrix([[to_sympy(x) for x in row] for row in rows])
+
+
+def integer_rows(rows):
+    """
+    Multiplies every row by the lcm of its denominators.
+
+    Returns:
+        tuple: tuple(list of rows of ints, list of row multipliers)
+    """
+
+    result = []
+    scales = []
+    for row in rows:
+        scale = lcm(*(x.denominator for x in row)) if row else 1
+        result.append([x.numerator * (scale // x.denominator) for x in row])
+        scales.append(scale)
+    return result, scales
+
+
+def bareiss(rows, reduced: bool = False, factors: list = None):
+    """
+    Fraction-free (Bareiss) Gauss or Gauss-Jordan elimination of integer matrix, modifies rows in place.
+    Every division in the algorithm is exact, so entries stay integers of bounded size.
+
+    Args:
+        rows (list): list of rows of ints.
+        reduced (bool): eliminate above pivots too (Gauss-Jordan).
+        factors (list): optional row multipliers, updated in place, see sympy_factors.
+
+    Returns:
+        tuple: tuple(list of pivot columns, last pivot value, sign of applied row permutation)
+    """
+
+    n = len(rows)
+    m = len(rows[0]) if rows else 0
+    pivots = []
+    prev = 1
+    sign = 1
+    r = 0
+    for c in range(m):
+        if r == n:
+            break
+        p = next((i for i in range(r, n) if rows[i][c]), None)
+        if p is None:
+            continue
+        if p != r:
+            rows[r], rows[p] = rows[p], rows[r]
+            sign = -sign
+            if factors is not None:
+                factors[r], factors[p] = factors[p], factors[r]
+
+        pivot_row = rows[r]
+        piv = pivot_row[c]
+        for i in range(0 if reduced else r + 1, n):
+            if i == r:
+                continue
+            row = rows[i]
+            a = row[c]
+            if a:
+                rows[i] = [(piv * x - a * y) // prev for x, y in zip(row, pivot_row)]
+            elif piv != prev:
+                rows[i] = [piv * x // prev for x in row]
+            if factors is not None:
+                sympy_factors(factors, i, r, a, piv, prev)
+        pivots.append(c)
+        prev = piv
+        r += 1
+    return pivots, prev, sign
+
+
+def sympy_factors(factors: list, i: int, r: int, a: int, piv: int, prev: int):
+    """
+    Updates multiplier of row i after Bareiss step with pivot row r. Matrix.echelon_form of sympy replaces
+    row i by pivot * row_i - a * row_r without division and leaves rows with zero a as they are, so its row
+    is factors[i] * Bareiss row. Initial factors are 1 / (multiplier of integer_rows).
+    """
+
+    if a:
+        factors[i] *= factors[r] * prev
+    elif piv != prev:
+        factors[i] *= Fraction(prev, piv)
+
+
+def det(rows):
+    """Exact determinant of square matrix given as list of rows of Fractions"""
+
+    if not rows:
+        return Fraction(1)
+    if len(rows) != len(rows[0]):
+        return Fraction(0)
+    int_rows, scales = integer_rows(rows)
+    pivots, last, sign = bareiss(int_rows)
+    if len(pivots) != len(rows):
+        return Fraction(0)
+    denominator = 1
+    for scale in scales:
+        denominator *= scale
+    return Fraction(sign * last, denominator)
+
+
+def rank(rows):
+    """Exact rank of matrix given as list of rows of Fractions"""
+
+    if not rows:
+        return 0
+    return len(bareiss(integer_rows(rows)[0])[0])
+
+
+def det_rank(rows):
+    """
+    Exact determinant and rank of matrix given as list of rows of Fractions, computed by one elimination.
+
+    Returns:
+        tuple: tuple(determinant or None if matrix isn't square, rank)
+    """
+
+    if not rows:
+        return Fraction(1), 0
+    int_rows, scales = integer_rows(rows)
+    pivots, last, sign = bareiss(int_rows)
+    if len(rows) != len(rows[0]):
+        return None, len(pivots)
+    if len(pivots) != len(rows):
+        return Fraction(0), len(pivots)
+    denominator = 1
+    for scale in scales:
+        denominator *= scale
+    return Fraction(sign * last, denominator), len(pivots)
+
+
+def echelon_form(rows, reduced: bool = False):
+    """
+    Row echelon form of matrix given as list of rows of Fractions.
+
+    Args:
+        rows (list): list of rows of Fractions.
+        reduced (bool): REF or RREF.
+
+    Returns:
+        list: REF of the same form as Matrix.echelon_form of sympy or RREF, rows of Fractions.
+    """
+
+    if not rows:
+        return rows
+    int_rows, scales = integer_rows(rows)
+    if not reduced:
+        factors = [Fraction(1, scale) for scale in scales]
+        bareiss(int_rows, False, factors)
+        return [[factor * x for x in row] for factor, row in zip(factors, int_rows)]
+    pivots, last, _ = bareiss(int_rows, reduced)
+    return [[Fraction(x, last) for x in row] for row in int_rows]
+
+
+def inv(rows):
+    """Exact inverse of matrix given as list of rows of Fractions"""
+
+    n = len(rows)
+    if any(len(row) != n for row in rows):
+        raise NonSquareMatrixError("A Matrix must be square to invert.")
+    augmented = [row + [Fraction(int(i == j)) for j in range(n)] for i, row in enumerate(rows)]
+    int_rows, _ = integer_rows(augmented)
+    pivots, last, _ = bareiss(int_rows, True)
+    if pivots[:n] != list(range(n)):
+        raise NonInvertibleMatrixError("Matrix det == 0; not invertible.")
+    return [[Fraction(x, last) for x in row[n:]] for row in int_rows]
+
+
+def float_array(rows):
+    """Converts list of rows of Fractions to float64 numpy array"""
+
+    if np is None:
+        raise ImportError("Approximate mode requires numpy")
+    return np.array([[float(x) for x in row] for row in rows], dtype=np.float64).reshape(len(rows), -1)
+
+
+def float_det(rows):
+    a = float_array(rows)
+    if a.shape[0] != a.shape[1]:
+        return 0.0
+    return float(np.linalg.det(a))
+
+
+def float_rank(rows):
+    return int(np.linalg.matrix_rank(float_array(rows)))
+
+
+def float_inv(rows):
+    if any(len(row) != len(rows) for row in rows):
+        raise NonSquareMatrixError("A Matrix must be square to invert.")
+    try:
+        return np.linalg.inv(float_array(rows)).tolist()
+    except np.linalg.LinAlgError:
+        raise NonInvertibleMatrixError("Matrix det == 0; not invertible.")
+
+
+def float_echelon_form(rows, reduced: bool = False):
+    """Row echelon form with partial pivoting in float64"""
+
+    a = float_array(rows)
+    n, m = a.shape
+    tolerance = FLOAT_TOLERANCE * max(1.0, float(np.abs(a).max()) if a.size else 1.0)
+    r = 0
+    for c in range(m):
+        if r == n:
+            break
+        p = r + int(np.argmax(np.abs(a[r:, c])))
+        if abs(a[p, c]) <= tolerance:
+            a[r:, c] = 0.0
+            continue
+        a[[r, p]] = a[[p, r]]
+        if reduced:
+            a[r] /= a[r, c]
+            others = np.arange(n) != r
+        else:
+            others = np.arange(n) > r
+        a[others] -= np.outer(a[others, c] / a[r, c], a[r])
+        a[others, c] = 0.0
+        r += 1
+    a[np.abs(a) <= tolerance] = 0.0
+    return a.tolist()
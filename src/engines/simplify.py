@@ -0,0 +1,211 @@
+from contextlib import contextmanager
+
+import multiprocessing
+import threading
+import sympy as sp
+
+
+# Amount of processes which simplify entries of matrices, 0 simplifies them in the current process
+workers = 0
+# Entries which need sympy simplify are sent to processes only if there are at least this amount of them
+PARALLEL_MIN_ENTRIES = 4
+
+pool = None
+
+# Interned entries and memoized simplification results of the current request, see request_scope
+local = threading.local()
+# Hits and misses of memoized simplification, they are counted from the start of the process
+memo_hits = 0
+memo_misses = 0
+
+
+def configure(amount: int):
+    """Sets amount of processes which simplify entries of matrices"""
+
+    global workers
+    if amount != workers:
+        stop()
+        workers = amount
+
+
+def get_pool():
+    # Processes of multiprocessing pool are daemonic, so they are stopped when worker process exits,
+    # unlike processes of ProcessPoolExecutor
+    global pool
+    if pool is None:
+        pool = multiprocessing.Pool(workers)
+    return pool
+
+
+def stop():
+    """Stops processes of the pool, tasks which are being executed are abandoned"""
+
+    global pool
+    if pool is None:
+        return
+    pool.terminate()
+    pool.join()
+    pool = None
+
+
+@contextmanager
+def request_scope():
+    """
+    Identical entries share one object and every unique expression is simplified once until the end
+    of the block. Nested scopes use the outer one, outside of any scope nothing is kept.
+    """
+
+    if getattr(local, 'memo', None) is not None:
+        yield
+        return
+    local.interned = {}
+    local.memo = {}
+    try:
+        yield
+    finally:
+        local.interned = local.memo = None
+
+
+def intern(entry):
+    """Returns the first entry equal to entry which was seen in the current request"""
+
+    interned = getattr(local, 'interned', None)
+    if interned is None:
+        return entry
+    return interned.setdefault(entry, entry)
+
+
+def recall(operation, entry):
+    """Returns result of operation on entry memoized in the current request or None"""
+
+    global memo_hits, memo_misses
+    memo = getattr(local, 'memo', None)
+    if memo is None:
+        return None
+    result = memo.get((operation, entry))
+    if result is None:
+        memo_misses += 1
+    else:
+        memo_hits += 1
+    return result
+
+
+def remember(operation, results: dict):
+    """Memoizes results of operation given as {entry: result} in the current request"""
+
+    memo = getattr(local, 'memo', None)
+    if memo is not None:
+        for entry, result in results.items():
+            memo[(operation, entry)] = intern(result)
+
+
+def memoized(operation, entry):
+    """Returns operation(entry), which is computed once for every unique entry in the current request"""
+
+    result = recall(operation, entry)
+    if result is None:
+        result = operation(entry)
+        remember(operation, {entry: result})
+        result = intern(result)
+    return result
+
+
+def memo_info():
+    return {'hits': memo_hits, 'misses': memo_misses}
+
+
+def evaluated(entry: sp.Expr):
+    """Rebuilds entry with evaluation, parse_latex leaves sums, products and powers unevaluated (2 + 3, a b + a b)"""
+
+    if not entry.args:
+        return entry
+    return entry.func(*(evaluated(arg) for arg in entry.args))
+
+
+def has_constants(entry: sp.Expr):
+    """Checks whether entry has irrational or complex constants (sqrt(2), pi, I, floats, ...)"""
+
+    return (entry.has(sp.NumberSymbol, sp.I) or any(not x.is_Rational for x in entry.atoms(sp.Number))
+            or any(not x.free_symbols for x in entry.atoms(sp.Pow)))
+
+
+def is_cheap(entry: sp.Expr):
+    """
+    Checks whether expanded entry is a rational number or polynomial with rational coefficients, which don't
+    need simplification. Constants like sqrt(2) are left to sympy simplify, which rationalizes them.
+    """
+
+    return entry.is_Rational or (entry.is_polynomial() and not has_constants(entry))
+
+
+def simplify_entry(entry: sp.Expr):
+    """
+    Simplifies expanded entry. Rational functions with rational coefficients are cancelled and factored,
+    and the shortest of the entry and these forms is taken like sympy simplify does. Other entries
+    (with radicals, functions, ...) are simplified by sympy simplify, which rationalizes denominators too.
+    """
+
+    if is_cheap(entry):
+        return entry
+    if entry.is_rational_function() and not has_constants(entry):
+        cancelled = sp.cancel(entry)
+        if cancelled.is_polynomial():
+            return cancelled
+        result = cancelled
+        for candidate in (sp.factor(cancelled), entry):
+            if sp.count_ops(candidate) < sp.count_ops(result):
+                result = candidate
+        return result
+    return entry.simplify()
+
+
+def simplify_entries(entries: list):
+    """
+    Simplifies list of expanded entries. Entries are evaluated first, then numbers and polynomials are returned
+    as they are, other entries are simplified once for every unique entry in the request (see request_scope),
+    by the process pool if there are enough of them.
+    """
+
+    entries = [evaluated(entry) for entry in entries]
+    result = list(entries)
+    hard = [i for i, entry in enumerate(entries) if not is_cheap(entry)]
+    known = {}
+    pending = []
+    for entry in dict.fromkeys(entries[i] for i in hard):
+        simplified = recall(simplify_entry, entry)
+        if simplified is None:
+            pending.append(entry)
+        else:
+            known[entry] = simplified
+
+    if not workers or len(pending) < PARALLEL_MIN_ENTRIES:
+        simplified = [simplify_entry(entry) for entry in pending]
+    else:
+        try:
+            chunksize = max(1, len(pending) // (4 * workers))
+            simplified = get_pool().map_async(simplify_entry, pending, chunksize).get()
+        except BaseException:
+            # Time budget is exceeded or request is cancelled, processes shouldn't keep simplifying its entries
+            stop()
+            raise
+    computed = dict(zip(pending, simplified))
+    remember(simplify_entry, computed)
+    known.update(computed)
+    for i in hard:
+        result[i] = intern(known[entries[i]])
+    return result
+
+
+def simplify_expanded(expr):
+    """
+    Simplifies expanded expression or matrix entry by entry.
+
+    Returns:
+        expression or matrix equal to expr.simplify().
+    """
+
+    if isinstance(expr, sp.MatrixBase):
+        return sp.ImmutableMatrix(*expr.shape, simplify_entries(list(expr)))
+    if isinstance(expr, sp.Expr) and not isinstance(expr, sp.MatrixExpr):
+        return simplify_entries([expr])[0]
+    return expr.simplify()
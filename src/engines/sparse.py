@@ -0,0 +1,208 @@
+from fractions import Fraction
+from sympy.matrices.exceptions import NonInvertibleMatrixError
+
+
+# Matrices with smaller share of non-zero entries are stored and eliminated as sparse
+SPARSE_DENSITY = 0.25
+# Matrices with less rows are always dense
+SPARSE_MIN_SIZE = 8
+
+
+def density(matrix):
+    """Share of non-zero entries of sympy matrix"""
+
+    size = matrix.shape[0] * matrix.shape[1]
+    return len(matrix.todok()) / size if size else 1
+
+
+def is_sparse(matrix):
+    return matrix.shape[0] >= SPARSE_MIN_SIZE and density(matrix) < SPARSE_DENSITY
+
+
+def from_rows(rows):
+    """Converts list of rows of Fractions to list of {column: value} dicts without zeros"""
+
+    return [{j: x for j, x in enumerate(row) if x} for row in rows]
+
+
+def to_rows(rows, width: int):
+    """Converts list of {column: value} dicts back to list of rows of Fractions"""
+
+    result = []
+    for row in rows:
+        dense = [Fraction(0)] * width
+        for j, x in row.items():
+            dense[j] = x
+        result.append(dense)
+    return result
+
+
+class Elimination:
+    """
+    Gaussian elimination of sparse matrix over rationals. Keeps index of rows by column,
+    so rows with non-zero entry in a column are found without scanning the matrix.
+    """
+
+    def __init__(self, rows):
+        self.rows = {i: dict(row) for i, row in enumerate(rows)}
+        self.columns = {}
+        for i, row in self.rows.items():
+            for j in row:
+                self.columns.setdefault(j, set()).add(i)
+
+    def replace(self, i, row):
+        old = self.rows[i]
+        for j in old.keys() - row.keys():
+            self.columns[j].discard(i)
+        for j in row.keys() - old.keys():
+            self.columns.setdefault(j, set()).add(i)
+        self.rows[i] = row
+
+    def remove(self, i):
+        for j in self.rows.pop(i):
+            self.columns[j].discard(i)
+
+    def eliminate(self, pivot_row: dict, c: int, targets):
+        """Subtracts pivot row from target rows to zero their entries in column c"""
+
+        pivot = pivot_row[c]
+        for i in targets:
+            row = dict(self.rows[i])
+            factor = row[c] / pivot
+            for j, x in pivot_row.items():
+                value = row.get(j, 0) - factor * x
+                if value:
+                    row[j] = value
+                else:
+                    row.pop(j, None)
+            self.replace(i, row)
+
+    def markowitz_pivot(self):
+        """Returns non-zero entry (row, column) with minimal (row count - 1) * (column count - 1)"""
+
+        best = None
+        best_cost = None
+        for i, row in self.rows.items():
+            row_cost = len(row) - 1
+            for j in row:
+                cost = row_cost * (len(self.columns[j]) - 1)
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = (i, j), cost
+                    if not cost:
+                        return best
+        return best
+
+    def run(self):
+        """
+        Eliminates matrix choosing pivots by Markowitz criterion to reduce fill-in.
+
+        Returns:
+            list: list of tuple(row, column, pivot value).
+        """
+
+        pivots = []
+        while True:
+            pivot = self.markowitz_pivot()
+            if pivot is None:
+                return pivots
+            i, c = pivot
+            pivot_row = self.rows[i]
+            self.remove(i)
+            self.eliminate(pivot_row, c, list(self.columns.get(c, ())))
+            pivots.append((i, c, pivot_row[c]))
+
+
+def permutation_sign(permutation):
+    sign = 1
+    seen = set()
+    for start in range(len(permutation)):
+        if start in seen:
+            continue
+        length = 0
+        i = start
+        while i not in seen:
+            seen.add(i)
+            i = permutation[i]
+            length += 1
+        if length % 2 == 0:
+            sign = -sign
+    return sign
+
+
+def det(rows, size: int):
+    """Exact determinant of square sparse matrix given as list of {column: Fraction} dicts"""
+
+    pivots = Elimination(rows).run()
+    if len(pivots) != size:
+        return Fraction(0)
+    result = Fraction(permutation_sign({i: c for i, c, _ in pivots}))
+    for _, _, value in pivots:
+        result *= value
+    return result
+
+
+def rank(rows):
+    """Exact rank of sparse matrix given as list of {column: Fraction} dicts"""
+
+    return len(Elimination(rows).run())
+
+
+def det_rank(rows, size: int):
+    """
+    Exact determinant and rank of square sparse matrix given as list of {column: Fraction} dicts,
+    computed by one elimination.
+    """
+
+    pivots = Elimination(rows).run()
+    if len(pivots) != size:
+        return Fraction(0), len(pivots)
+    result = Fraction(permutation_sign({i: c for i, c, _ in pivots}))
+    for _, _, value in pivots:
+        result *= value
+    return result, len(pivots)
+
+
+def rref(rows, width: int):
+    """
+    Reduced row echelon form of sparse matrix. Pivot columns are taken from left to right,
+    and in every column the row with the least amount of non-zero entries becomes the pivot.
+
+    Returns:
+        list: list of {column: Fraction} dicts.
+    """
+
+    elimination = Elimination(rows)
+    reduced = []
+    for c in range(width):
+        candidates = elimination.columns.get(c)
+        if not candidates:
+            continue
+        i = min(candidates, key=lambda r: (len(elimination.rows[r]), r))
+        pivot_row = elimination.rows[i]
+        elimination.remove(i)
+        pivot = pivot_row[c]
+        pivot_row = {j: x / pivot for j, x in pivot_row.items()}
+        elimination.eliminate(pivot_row, c, list(candidates))
+        for k, (row_c, row) in enumerate(reduced):
+            if c in row:
+                factor = row[c]
+                row = dict(row)
+                for j, x in pivot_row.items():
+                    value = row.get(j, 0) - factor * x
+                    if value:
+                        row[j] = value
+                    else:
+                        row.pop(j, None)
+                reduced[k] = (row_c, row)
+        reduced.append((c, pivot_row))
+    return [row for _, row in reduced] + [{} for _ in range(len(rows) - len(reduced))]
+
+
+def inv(rows, size: int):
+    """Exact inverse of square sparse matrix given as list of {column: Fraction} dicts"""
+
+    augmented = [{**row, size + i: Fraction(1)} for i, row in enumerate(rows)]
+    reduced = rref(augmented, 2 * size)
+    if any(min(row, default=size) != i for i, row in enumerate(reduced)):
+        raise NonInvertibleMatrixError("Matrix det == 0; not invertible.")
+    return [{j - size: x for j, x in row.items() if j >= size} for row in reduced]
@@ -0,0 +1,105 @@
+import sympy as sp
+
+
+class Transform:
+    """
+    Product of elementary matrices of one side of a matrix, kept as sparse rows of the product.
+    Only rows which differ from the identity matrix are stored. Row operations are accumulated
+    into the left multiplier L (A -> L A), column operations into the transposed right multiplier
+    R^T (A -> A R), so both are built by the same row operations.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        # Row index -> {column: coefficient}
+        self.rows = {}
+        self.ops = 0
+
+    def row(self, i: int):
+        row = self.rows.get(i)
+        return {i: sp.S.One} if row is None else row
+
+    def apply(self, op: str, n: int, k=None, m=None):
+        """Applies elementary operation to rows of the product, arguments are the ones of Matrix.row_op"""
+
+        if op == 'n->kn':
+            self.rows[n] = {j: k * x for j, x in self.row(n).items()}
+        elif op == 'n<->m':
+            self.rows[n], self.rows[m] = self.row(m), self.row(n)
+        elif op == 'n->n+km':
+            row = dict(self.row(n))
+            for j, x in self.row(m).items():
+                value = row.get(j, 0) + k * x
+                if value == 0:
+                    row.pop(j, None)
+                else:
+                    row[j] = value
+            self.rows[n] = row
+        self.ops += op != 'n<->m'
+
+    def changed(self):
+        """Yields tuple(index, sparse row) of rows which differ from the identity matrix"""
+
+        for i, row in self.rows.items():
+            if row != {i: 1}:
+                yield i, row
+
+    @staticmethod
+    def is_permutation(row: dict):
+        return len(row) == 1 and next(iter(row.values())) == 1
+
+    def cost(self):
+        """Amount of multiplications of one line by a coefficient needed to apply the product"""
+
+        return sum(len(row) for _, row in self.changed() if not self.is_permutation(row))
+
+    def touched(self, touched: set):
+        """Lines which have to be simplified after applying the product, if touched lines had to be before"""
+
+        result = set(i for i in touched if i not in self.rows)
+        for i, row in self.rows.items():
+            # Lines which are only moved stay simplified
+            if not self.is_permutation(row) or next(iter(row)) in touched:
+                result.add(i)
+        return result
+
+    def to_matrix(self, transpose: bool = False):
+        """Product as explicit sympy matrix, R^T is transposed back if transpose is set"""
+
+        entries = {(i, i): sp.S.One for i in range(self.size)}
+        for i, row in self.rows.items():
+            entries.pop((i, i))
+            entries.update(((j, i) if transpose else (i, j), x) for j, x in row.items())
+        return sp.ImmutableMatrix(sp.SparseMatrix(self.size, self.size, entries))
+
+    def is_rational(self):
+        return all(sp.sympify(x).is_Rational for _, row in self.changed() for x in row.values())
+
+    def apply_left(self, rows: list):
+        """Computes rows of L A in place, A is given as list of rows"""
+
+        new = {}
+        for i, row in self.changed():
+            line = None
+            for j, x in row.items():
+                source = rows[j]
+                if line is None:
+                    line = list(source) if x == 1 else [x * y for y in source]
+                else:
+                    line = [a + x * y for a, y in zip(line, source)] if x != 1 else [a + y for a, y in zip(line, source)]
+            new[i] = line if line is not None else [0 * y for y in rows[i]]
+        for i, line in new.items():
+            rows[i] = line
+
+    def apply_right(self, rows: list):
+        """Computes rows of A R in place from the transposed product R^T"""
+
+        changed = list(self.changed())
+        for r, source in enumerate(rows):
+            line = list(source)
+            for i, row in changed:
+                value = 0
+                for j, x in row.items():
+                    value += source[j] if x == 1 else x * source[j]
+                line[i] = value
+            rows[r] = line
@@ -1,53 +1,79 @@
-from parsers.latex_parser import Parser
-from sympy.parsing.latex.errors import LaTeXParsingError
+from dispatcher import Dispatcher
+from cache import ResultCache
+from profiling import Stats
 
 import argparse
 import json
+import os
 
 
 def parse_args():
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('file', type=str, help="File with custom latex commands ('\\newcommand' commands)")
+    arg_parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                            help="Amount of worker processes, 0 executes requests one by one in the main process")
+    arg_parser.add_argument('--timeout', type=float, default=120,
+                            help="Time limit for one request in seconds, 0 disables it")
+    arg_parser.add_argument('--budget', type=float, default=60,
+                            help="Time budget for one request in seconds, after which simplify returns partial result "
+                                 "and other commands stop with timeout error, 0 disables it")
+    arg_parser.add_argument('--prewarm', action='store_true',
+                            help="Load sympy and parse a few expressions in background before the first request")
+    arg_parser.add_argument('--cache-size', type=int, default=1024,
+                            help="Amount of results of inverse, matrix_info, ref, rref and transpose kept in memory, "
+                                 "0 disables the cache")
+    arg_parser.add_argument('--cache-file', type=str, default='',
+                            help="SQLite file which keeps cached results between sessions")
+    arg_parser.add_argument('--cache-file-size', type=float, default=64, help="Maximum size of cached results in MB")
+    arg_parser.add_argument('--profile', action='store_true',
+                            help="Attach wall time and amount of calls of every stage to every response")
+    arg_parser.add_argument('--trace-file', type=str, default='',
+                            help="JSONL file which gets latency and time of stages of every request")
+    arg_parser.add_argument('--profile-threshold', type=float, default=0,
+                            help="Dump cProfile of requests which run longer than this amount of seconds, 0 disables it")
+    arg_parser.add_argument('--profile-dir', type=str, default='profiles', help="Directory for cProfile dumps")
+    arg_parser.add_argument('--simplify-workers', type=int, default=0,
+                            help="Amount of processes which simplify entries of matrices in parallel for every worker, "
+                                 "0 simplifies them in the worker")
+    arg_parser.add_argument('--modular-workers', type=int, default=0,
+                            help="Amount of processes which compute det and rank of large integer matrices modulo "
+                                 "different primes for every worker, 0 computes them in the worker")
+    arg_parser.add_argument('--modular-threshold', type=int, default=None,
+                            help="Smallest size of integer matrices which det and rank are computed modulo primes "
+                                 "(40 by default, requires numpy), 0 disables it")
     return arg_parser.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_args()
-    try:
-        parser = Parser(args.file)
-    except OSError as e:
-        parser = Parser()
-        print(e)
-
-    while True:
-        s = ''
-        while s.strip() == '':
-            s = input()
+    if args.file.strip() and not os.access(args.file.strip(), os.R_OK):
+        print(f"Unable to open/read file: {args.file.strip()}")
 
-        inp = json.loads(s)
-        command = inp['command']
-        text = inp['text']
-
-        response = {
-            'command': command,
-            'id': inp['id'],
-        }
+    cache = None
+    if args.cache_size > 0:
+        cache = ResultCache(args.cache_size, args.file, args.cache_file or None, int(args.cache_file_size * 2 ** 20))
+    stats = Stats(args.trace_file or None)
+    dispatcher = Dispatcher(args.file, args.workers, args.timeout, args.budget, warm=args.prewarm, cache=cache,
+                            stats=stats, profile=args.profile, profile_threshold=args.profile_threshold,
+                            profile_dir=args.profile_dir, simplify_workers=args.simplify_workers,
+                            modular_workers=args.modular_workers, modular_threshold=args.modular_threshold)
+    dispatcher.ready()
+    try:
+        while True:
+            s = ''
+            while s.strip() == '':
+                s = input()
 
-        try:
-            if command == 'el_ops':
-                response['res'] = text + '\n' + parser.apply_elementary_operations(text)
-            elif command == 'simplify':
-                response['res'] = parser.simplify_expr_with_matrices(text)
-            elif command == 'matrix_info':
-                response['res'] = parser.info(text)
-            elif command == 'transpose':
-                response['res'] = parser.transpose(text)
-            elif command == 'inverse':
-                response['res'] = parser.inv(text)
-            elif command == 'ref':
-                response['res'] = parser.ref(text, False)
-            elif command == 'rref':
-                response['res'] = parser.ref(text, True)
-            print(json.dumps(response))
-        except Exception as e:
-            print(json.dumps({'command': 'error', 'res': str(e)}))
+            try:
+                inp = json.loads(s)
+            except ValueError as e:
+                dispatcher.write({'command': 'error', 'error': 'bad_request', 'res': str(e)})
+                continue
+            if not isinstance(inp, dict):
+                dispatcher.write({'command': 'error', 'error': 'bad_request', 'res': 'Request must be a JSON object'})
+                continue
+            dispatcher.submit(inp)
+    except EOFError:
+        dispatcher.shutdown()
+    except KeyboardInterrupt:
+        dispatcher.shutdown(wait=False)
@@ -1,5 +1,6 @@
-from sympy.parsing.latex import parse_latex, LaTeXParsingError
+from sympy.parsing.latex import LaTeXParsingError
 from parsers.matrix_parser import parse_matrix
+from parsers.expression_parser import parse_expression
 from utils import find_close_bracket, Command
 
 import re
@@ -16,7 +17,7 @@ def parse_operation(text):
     elif re.match(r'\(\s*\d+\s*(?:col)?\s*\)\s*\\cdot', text):
         n, k = text.split(r'\cdot', 1)
         n = int(re.search(r'\d+', n).group(0))
-        k = parse_latex(k)
+        k = parse_expression(k)
         if text.find('col') != -1:
             return {'axis': 'col', 'op': "n->kn", 'n': n - 1, 'k': k}
         else:
@@ -27,7 +28,7 @@ def parse_operation(text):
         k = text[len(temp[0]):len(text) - len(temp[-1])].strip()
         if k in '+-':
             k += '1'
-        k = parse_latex(k)
+        k = parse_expression(k)
         if text.find('col') != -1:
             return {'axis': 'col', 'op': "n->n+km", 'n': n - 1, 'm': m - 1, 'k': k}
         else:
@@ -36,33 +37,46 @@ def parse_operation(text):
         raise LaTeXParsingError(f"Cannot parse ({text}) as elementary operation")
 
 
+def split_latex_ops(text):
+    """Splits text of elementary operation command into normalized operation lines"""
+
+    lines = (' '.join(line.split()) for line in text.split(r'\\'))
+    return [line for line in lines if line != '']
+
+
 def parse_latex_ops(text):
-    lines = text.split(r'\\')
-    operations = []
-    for line in lines:
-        line = line.strip()
-        if line == '':
-            continue
-        else:
-            operations.append(parse_operation(line))
-    return operations
+    return [parse_operation(line) for line in split_latex_ops(text)]
 
 
-def parse_el_ops(command: Command):
+def el_op_lines(command: Command):
     r"""
-    Parses elementary operation command and returns them as list of kwargs for Matrix.row(col)_op.
+    Returns normalized lines of elementary operation command without parsing them.
 
     Args:
         command (Command): elementary operation command such as the following: \simop, \eqop, \arrop.
 
     Returns:
-        list: list of kwargs for Matrix.row(col)_op
+        list: list of operation strings.
     """
 
     if command is None:
         raise LaTeXParsingError('Elementary operation command not found')
 
     if command.name in (r'\simop', r'\arrop', r'\eqop'):
-        return parse_latex_ops(command[0].inner)
+        return split_latex_ops(command[0].inner)
     else:
         raise LaTeXParsingError("Cannot find correct elementary operation LaTeX command")
+
+
+def parse_el_ops(command: Command):
+    r"""
+    Parses elementary operation command and returns them as list of kwargs for Matrix.row(col)_op.
+
+    Args:
+        command (Command): elementary operation command such as the following: \simop, \eqop, \arrop.
+
+    Returns:
+        list: list of kwargs for Matrix.row(col)_op
+    """
+
+    return [parse_operation(line) for line in el_op_lines(command)]
@@ -0,0 +1,192 @@
+from sympy.parsing.latex import parse_latex
+
+import sympy as sp
+import re
+
+
+GREEK_LETTERS = {
+    'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'varepsilon', 'zeta', 'eta', 'theta', 'vartheta', 'iota', 'kappa',
+    'lambda', 'mu', 'nu', 'xi', 'rho', 'sigma', 'tau', 'upsilon', 'phi', 'varphi', 'chi', 'psi', 'omega',
+    'Gamma', 'Delta', 'Theta', 'Lambda', 'Xi', 'Sigma', 'Upsilon', 'Phi', 'Psi', 'Omega',
+}
+
+MULTIPLICATION = (r'\cdot', r'\times', '*')
+DIVISION = (r'\div', '/')
+
+# Like in sympy's LaTeX grammar, digits of a number may be separated by whitespace: '1 2' is 12, '3 .5' is 3.5.
+# A number has to start with a digit and a point has to be followed by a digit, anything else goes to parse_latex
+TOKEN_PATTERN = re.compile(r'\s*(?:(?P<number>\d(?:\s*\d)*(?:\s*\.\s*\d(?:\s*\d)*)?)|(?P<command>\\[a-zA-Z]+)|(?P<symbol>\S))')
+
+
+class UnsupportedLaTeX(Exception):
+    """Raised when fast parser meets construct it doesn't support"""
+
+
+def tokenize(text: str):
+    """Splits text into numbers, commands and single symbols"""
+
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN_PATTERN.match(text, pos)
+        if match is None:
+            break
+        token = match.group(match.lastgroup)
+        tokens.append(re.sub(r'\s', '', token) if match.lastgroup == 'number' else token)
+        pos = match.end()
+    return tokens
+
+
+class ExpressionParser:
+    r"""
+    Recursive descent parser for the subset of LaTeX which is used in matrix cells and elementary operations:
+    numbers, letters, greek letters, + - \cdot \times / \div, \frac, ^, \sqrt and brackets.
+
+    Precedence follows sympy's LaTeX grammar, so implicit multiplication binds tighter than explicit one.
+    """
+
+    def __init__(self, text: str):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise UnsupportedLaTeX('Unexpected end of expression')
+        self.pos += 1
+        return token
+
+    def expect(self, token):
+        if self.next() != token:
+            raise UnsupportedLaTeX(f'Expected {token}')
+
+    def parse(self):
+        if not self.tokens:
+            raise UnsupportedLaTeX('Empty expression')
+        expr = self.expr()
+        if self.peek() is not None:
+            raise UnsupportedLaTeX(f'Unexpected token {self.peek()}')
+        return expr
+
+    def expr(self):
+        terms = [self.mp()]
+        while self.peek() in ('+', '-'):
+            sign = self.next()
+            term = self.mp()
+            terms.append(term if sign == '+' else -term)
+        return sp.Add(*terms)
+
+    def mp(self):
+        expr = self.unary()
+        while self.peek() in MULTIPLICATION + DIVISION:
+            op = self.next()
+            operand = self.unary()
+            expr = expr * operand if op in MULTIPLICATION else expr / operand
+        return expr
+
+    def unary(self):
+        if self.peek() == '-':
+            self.next()
+            return -self.unary()
+        elif self.peek() == '+':
+            self.next()
+            return self.unary()
+        factors = [self.exp()]
+        while self.starts_atom():
+            factors.append(self.exp())
+        return sp.Mul(*factors)
+
+    def starts_atom(self):
+        token = self.peek()
+        if token is None:
+            return False
+        return (token[0].isdigit() or token.isalpha() or token in ('(', '{', '[', r'\left')
+                or token[1:] in GREEK_LETTERS or token in (r'\frac', r'\sqrt'))
+
+    def exp(self):
+        expr = self.comp()
+        while self.peek() == '^':
+            self.next()
+            if self.peek() == '{':
+                self.next()
+                exponent = self.expr()
+                self.expect('}')
+            else:
+                exponent = self.atom()
+            expr = sp.Pow(expr, exponent)
+        return expr
+
+    def comp(self):
+        token = self.peek()
+        if token in ('(', '[', '{'):
+            self.next()
+            expr = self.expr()
+            self.expect({'(': ')', '[': ']', '{': '}'}[token])
+            return expr
+        elif token == r'\left':
+            self.next()
+            bracket = self.next()
+            if bracket not in ('(', '['):
+                raise UnsupportedLaTeX(f'Unsupported bracket {bracket}')
+            expr = self.expr()
+            self.expect(r'\right')
+            self.expect({'(': ')', '[': ']'}[bracket])
+            return expr
+        elif token == r'\frac':
+            self.next()
+            numerator = self.group()
+            denominator = self.group()
+            return numerator / denominator
+        elif token == r'\sqrt':
+            self.next()
+            if self.peek() == '[':
+                self.next()
+                degree = self.expr()
+                self.expect(']')
+                return sp.root(self.group(), degree)
+            return sp.sqrt(self.group())
+        return self.atom()
+
+    def group(self):
+        self.expect('{')
+        expr = self.expr()
+        self.expect('}')
+        return expr
+
+    def atom(self):
+        token = self.next()
+        if token[0].isdigit():
+            return sp.Number(token)
+        elif len(token) == 1 and token.isalpha():
+            return sp.Symbol(token)
+        elif token[1:] in GREEK_LETTERS:
+            return sp.Symbol(token[1:])
+        raise UnsupportedLaTeX(f'Unsupported token {token}')
+
+
+def parse_fast(text: str):
+    """Parses text with ExpressionParser, raises UnsupportedLaTeX if text is out of supported subset"""
+
+    return ExpressionParser(text).parse()
+
+
+def parse_expression(text: str):
+    """
+    Parses LaTeX expression with fast recursive descent parser and falls back to sympy's parse_latex
+    when the expression uses unsupported constructs.
+
+    Args:
+        text (str): LaTeX expression.
+
+    Returns:
+        sympy expression.
+    """
+
+    try:
+        return parse_fast(text)
+    except (UnsupportedLaTeX, sp.SympifyError):
+        return parse_latex(text)
@@ -1,13 +1,36 @@
 from sympy.parsing.latex import parse_latex
-from parsers.matrix_parser import parse_matrix
-from parsers.el_op_parser import parse_el_ops
-from utils import normalize_string, find_close_bracket, read_command, Command, skip_spaces, expression_to_string
-
+from sympy.parsing.latex.errors import LaTeXParsingError
+from parsers.matrix_parser import Matrix, parse_matrix, matrix_blocks, cell_cache_info, MATRIX_BLOCKS
+from parsers.el_op_parser import el_op_lines, parse_operation
+from parsers.preamble import parse_commands, load_commands
+from engines.simplify import simplify_expanded, memo_info
+from engines import simplify, backends
+from engines.matrix_expr import Evaluator, substitute
+from utils import normalize_string, read_command, Command, Group, skip_spaces, \
+    expression_to_string, latex_cache_info, parse_tree
+from sympy.matrices.exceptions import NonSquareMatrixError
+from cache import LRUCache
+from contextlib import contextmanager
+
+import budget
+import profiling
 import sympy as sp
+import hashlib
+import os
 import re
 import json
 
 
+# Share of the time budget given to fallback strategies when simplification runs out of time
+FALLBACK_BUDGET_SHARE = 0.25
+
+# Maximum amount of cached matrices of elementary operation chains
+EL_OPS_CACHE_SIZE = 512
+
+# Maximum nesting of custom commands, protects from recursive definitions
+MAX_EXPANSION_DEPTH = 64
+
+
 def transpose_replacer(ind, matrices):
     """Tranposes matrix with ^T"""
 
@@ -17,45 +40,86 @@ def transpose_replacer(ind, matrices):
     return replace
 
 
-def inverse_replacer(ind, matrices):
-    """Inverses matrix with ^{-1}"""
+def inverse_replacer(ind, matrices, inverted):
+    """
+    Marks matrix with ^{-1} as inverted. It isn't inverted here: products with its inverse
+    are computed as solutions of linear systems when the expression is evaluated.
+    """
 
     replace = 'M_{r_{e_{p_{l_{' + ind + '}}}}}'
     ind = int(ind)
-    matrices[ind][1] = matrices[ind][1].inv()
+    if not matrices[ind][1].is_square:
+        raise NonSquareMatrixError("A Matrix must be square to invert.")
+    inverted.add(matrices[ind][0])
     return replace
 
 
-class Parser:
-    custom_commands = {}
+def state_key(matrix_text: str):
+    """Hash of matrix LaTeX with normalized whitespaces"""
+
+    return hashlib.sha1(' '.join(matrix_text.split()).encode()).hexdigest()
+
 
-    def replace_custom_commands_in_command(self, command: Command, matrices: list = None):
+class Parser:
+    def expand_command(self, command: Command, out: list, matrices: list = None, depth: int = 0):
         """
-        Replaces all custom commands in provided command's blocks and replaces itself if it's in
-        self.custom_commands list. If matrices is not None, replaces them with "M_{r_{e_{p_{l_{index}}}}}"
-        and appends parsed matrix in matrices.
+        Appends expansion of command to out. Custom commands are substituted with their bodies, which are
+        expanded again. If matrices is not None, matrix commands are replaced with "M_{r_{e_{p_{l_{index}}}}}"
+        and parsed matrices are appended in matrices.
 
         Args:
-            command (Command): command with it's blocks.
+            command (Command): command from parse_tree with it's blocks.
+            out (list): list of string chunks to append expansion to.
             matrices (list): either list of matrices to append matrix if the command is matrix or None.
-
-        Returns:
-            str: text with performed replaces.
+            depth (int): amount of custom commands which are being expanded.
         """
 
-        for i in range(len(command)):
-            command[i].inner = self.replace_custom_commands(command[i].inner, matrices is not None)[0]
-        if command.name in (r'\matrix', r'\dmatrix', r'\ematrix', r'\pmatrix') and matrices is not None:
+        if command.name in MATRIX_BLOCKS and matrices is not None:
+            for block in command.blocks:
+                block.inner = self.expand(block.children, matrices, depth)
             unrel, matrix = parse_matrix(command)
             replace = 'M_{r_{e_{p_{l_{' + str(len(matrices)) + '}}}}}'
-            expr = replace
+            out.append(replace)
             matrices.append([replace, matrix.calculate()])
+        elif command.name in self.custom_commands:
+            if depth >= MAX_EXPANSION_DEPTH:
+                raise LaTeXParsingError(f"Too deep expansion of custom commands: {command.name}")
+            unrel, template = self.custom_commands[command.name]
+            body = ''.join(command[chunk].inner if isinstance(chunk, int) else chunk for chunk in template)
+            self.expand_nodes(parse_tree(body), out, matrices, depth + 1)
         else:
-            unrel, replace = self.custom_commands.get(command.name, (0, command.name))
-            expr = re.sub(r'#(?P<id>\d+)', lambda x: command[int(x['id']) - 1].inner, replace)
-        for i in range(unrel, len(command)):
-            expr += '{' + command[i].inner + '}'
-        return expr
+            unrel = 0
+            out.append(command.name)
+        for block in command.blocks[unrel:]:
+            out.append('{')
+            self.expand_nodes(block.children, out, matrices, depth)
+            out.append('}')
+
+    def expand_nodes(self, nodes: list, out: list, matrices: list = None, depth: int = 0):
+        """Appends expansion of nodes from parse_tree to out"""
+
+        for node in nodes:
+            if isinstance(node, str):
+                out.append(node)
+            elif isinstance(node, Group):
+                out.append('{')
+                self.expand_nodes(node.children, out, matrices, depth)
+                if node.closed:
+                    out.append('}')
+            else:
+                self.expand_command(node, out, matrices, depth)
+
+    def expand(self, nodes: list, matrices: list = None, depth: int = 0):
+        out = []
+        self.expand_nodes(nodes, out, matrices, depth)
+        return ''.join(out)
+
+    def normalize_matrix_text(self, text: str):
+        """Normalizes whitespaces and replaces custom commands in text of matrix command"""
+
+        with profiling.stage('normalize_string'):
+            text = normalize_string(text).strip()
+        return self.replace_custom_commands(text, False)[0]
 
     def replace_custom_commands(self, text: str, extract_matrices=True):
         """
@@ -64,6 +128,9 @@ class Parser:
         with M_{r_{e_{p_{l_{id}}}}}, and stores parsed matrices
         in dict {Symbol: Matrix}.
 
+        Text is split by parse_tree in one pass and expansion is collected in list of chunks,
+        so time is linear in size of text and its expansion.
+
         Args:
             text (str): string with normalized LaTeX.
             extract_matrices (bool): flag that indicates whether matrices need to be replaced.
@@ -72,119 +139,197 @@ class Parser:
             tuple: tuple(text with performed replaces, list of extracted matrices).
         """
 
+        self.reload_command_file()
         matrices = [] if extract_matrices else None
-        normalized_expr = ''
-        pos = 0
-        while True:
-            nxt = text.find("\\", pos)
-            normalized_expr += text[pos: nxt if nxt != -1 else len(text)]
-            if nxt == -1:
-                return normalized_expr, matrices
-            elif nxt != len(text) - 1 and text[nxt + 1] == '\\':
-                normalized_expr += '\\\\'
-                pos = nxt + 2
-                continue
-            command = read_command(text, nxt)
-            normalized_expr += self.replace_custom_commands_in_command(command, matrices)
-            pos = command.end + 1
+        with profiling.stage('replace_custom_commands'):
+            return self.expand(parse_tree(text), matrices), matrices
 
-    def simplify_expr_with_matrices(self, text: str):
+    def parse_expr_with_matrices(self, text: str):
         """
-        Parses text to expression and simplifies it
+        Parses text to expression with MatrixSymbol placeholders of extracted matrices.
 
         Args:
             text (str): string with raw LaTeX.
 
         Returns:
-            str: simplified expression as LaTeX string.
+            tuple: tuple(sympy expression, {MatrixSymbol: explicit matrix}), see engines.matrix_expr.
         """
 
-        text = normalize_string(text)
+        with profiling.stage('normalize_string'):
+            text = normalize_string(text)
         text, matrices = self.replace_custom_commands(text)
 
         text = re.sub(r'M_{r_{e_{p_{l_{(?P<ind>\d+)}}}}}\^{?\s*T\s*}?',
                       lambda x: transpose_replacer(x['ind'], matrices), text)
-        text = re.sub(r'M_{r_{e_{p_{l_{(?P<ind>\d+)}}}}}\^{\s*-1\s*}', lambda x: inverse_replacer(x['ind'], matrices),
-                      text)
+        inverted = set()
+        text = re.sub(r'M_{r_{e_{p_{l_{(?P<ind>\d+)}}}}}\^{\s*-1\s*}',
+                      lambda x: inverse_replacer(x['ind'], matrices, inverted), text)
+
+        with profiling.stage('parse_latex'):
+            expr = parse_latex(text)
+        # Every matrix gets its own symbol even if it's equal to another one, otherwise sympy folds A^{-1} A
+        # and A - A into Identity and ZeroMatrix while the expression is built. Equal matrices still share
+        # their LU factorization, see Evaluator.factorization
+        symbols, values = {}, {}
+        for name, matrix in matrices:
+            symbol = sp.MatrixSymbol(name, *matrix.shape)
+            values[symbol] = matrix
+            symbols[sp.Symbol(name)] = sp.Inverse(symbol) if name in inverted else symbol
+        with profiling.stage('subs'):
+            return substitute(expr, symbols), values
+
+    def simplify_expr_with_matrices(self, text: str):
+        """
+        Parses text to expression and simplifies it
+
+        Args:
+            text (str): string with raw LaTeX.
+
+        Returns:
+            str: simplified expression as LaTeX string.
+        """
+
+        return self.simplify_expr_with_budget(text)[0]
+
+    def simplify_expr_with_budget(self, text: str, time_budget: float = None):
+        """
+        Parses text to expression and simplifies it within time budget. Expression is expanded, then numbers
+        and polynomials are kept, rational functions are cancelled and only other entries are simplified
+        by sympy simplify (see engines.simplify). If simplification doesn't fit into the budget, returns
+        expanded expression or, if expand() doesn't fit too, expression with together() applied to it
+        (or to every entry of matrix) within FALLBACK_BUDGET_SHARE of the budget. If the budget is over
+        while matrices are multiplied, inverted or raised to powers, returns the expression with the matrices
+        and subexpressions computed so far and the rest of matrix operations unevaluated.
 
-        expr = parse_latex(text).subs(
-            [(sp.Symbol(m[0]), sp.MatrixSymbol(m[0], *m[1].shape)) for m in reversed(matrices)])
-        expr = expr.subs([(sp.MatrixSymbol(m[0], *m[1].shape), m[1]) for m in matrices])
+        Args:
+            text (str): string with raw LaTeX.
+            time_budget (float): time budget in seconds, None or 0 disables it.
 
-        return expression_to_string(expr.expand().simplify())
+        Returns:
+            tuple: tuple(simplified expression as LaTeX string, flag that indicates partial result).
+        """
 
-    def inv(self, text: str):
+        expr = expanded = evaluator = None
+        try:
+            with budget.time_budget(time_budget):
+                unevaluated, values = self.parse_expr_with_matrices(text)
+                evaluator = Evaluator(values)
+                with profiling.stage('evaluate'):
+                    expr = evaluator.evaluate(unevaluated)
+                with profiling.stage('expand'):
+                    expanded = expr.expand()
+                with profiling.stage('simplify'):
+                    simplified = simplify_expanded(expanded)
+                with profiling.stage('expression_to_string'):
+                    return expression_to_string(simplified), False
+        except budget.BudgetExceeded:
+            if evaluator is None:
+                raise
+
+        if expr is None:
+            with profiling.stage('expression_to_string'):
+                return expression_to_string(evaluator.partial(unevaluated)), True
+        if expanded is None:
+            expanded = expr
+            try:
+                with budget.time_budget(time_budget * FALLBACK_BUDGET_SHARE), profiling.stage('together'):
+                    expanded = expr.applyfunc(sp.together) if isinstance(expr, sp.MatrixBase) else sp.together(expr)
+            except budget.BudgetExceeded:
+                pass
+        with profiling.stage('expression_to_string'):
+            return expression_to_string(expanded), True
+
+    def inv(self, text: str, approximate: bool = False, engine: str = 'sympy', backend: str = 'auto'):
         """
         Parses text with matrix from LaTeX, inverses matrix and returns it as LaTeX string.
 
         Args:
             text (str): raw LaTeX code with matrix.
-
+            approximate (bool): use float arithmetic for purely numeric matrices.
+            engine (str): 'domain' to compute over polynomial ring or fraction field, 'sympy' to use sympy Matrix.
+            backend (str): requested backend, one of engines.backends.BACKENDS.
 
         Returns:
             str: inverse matrix.
         """
 
-        text = normalize_string(text).strip()
-        text = self.replace_custom_commands(text, False)[0]
+        text = self.normalize_matrix_text(text)
         command = read_command(text, 0)
-        matrix = parse_matrix(command)[1]
-        return str(matrix.inv())
-
-    def transpose(self, text: str):
+        with profiling.stage('parse_matrix'):
+            matrix = parse_matrix(command, approximate, engine, backend)[1]
+        with profiling.stage('inv'):
+            matrix = matrix.inv()
+        with profiling.stage('to_latex'):
+            return str(matrix)
+
+    def transpose(self, text: str, backend: str = 'auto'):
         """
         Parses text with matrix from LaTeX, transposes matrix and returns it as LaTeX string.
 
         Args:
             text (str): raw LaTeX code with matrix.
+            backend (str): requested backend, one of engines.backends.BACKENDS.
 
         Returns:
             str: transposed matrix.
         """
 
-        text = normalize_string(text).strip()
-        text = self.replace_custom_commands(text, False)[0]
+        text = self.normalize_matrix_text(text)
         command = read_command(text, 0)
-        matrix = parse_matrix(command)[1]
-        return str(matrix.T())
+        with profiling.stage('parse_matrix'):
+            matrix = parse_matrix(command, backend=backend)[1]
+        with profiling.stage('to_latex'):
+            return str(matrix.T())
 
-    def ref(self, text: str, reduced: bool = False):
+    def ref(self, text: str, reduced: bool = False, approximate: bool = False, engine: str = 'sympy',
+            backend: str = 'auto'):
         """
         Parses text with matrix from LaTeX and returns it's REF or RREF as LaTeX string.
 
         Args:
             reduced (bool): REF or RREF
             text (str): raw LaTeX code with matrix.
+            approximate (bool): use float arithmetic for purely numeric matrices.
+            engine (str): 'domain' to compute over polynomial ring or fraction field, 'sympy' to use sympy Matrix.
+            backend (str): requested backend, one of engines.backends.BACKENDS.
 
         Returns:
             str: REF matrix.
         """
 
-        text = normalize_string(text).strip()
-        text = self.replace_custom_commands(text, False)[0]
+        text = self.normalize_matrix_text(text)
         command = read_command(text, 0)
-        matrix = parse_matrix(command)[1]
-        return str(matrix.ref(reduced))
-
-    def info(self, text: str):
+        with profiling.stage('parse_matrix'):
+            matrix = parse_matrix(command, approximate, engine, backend)[1]
+        with profiling.stage('rref' if reduced else 'ref'):
+            matrix = matrix.ref(reduced)
+        with profiling.stage('to_latex'):
+            return str(matrix)
+
+    def info(self, text: str, approximate: bool = False, engine: str = 'sympy', backend: str = 'auto'):
         """
         Parses text with matrix from LaTeX and returns matrix' determinant and rank.
 
         Args:
             text (str): raw LaTeX code with matrix.
+            approximate (bool): use float arithmetic for purely numeric matrices.
+            engine (str): 'domain' to compute over polynomial ring or fraction field, 'sympy' to use sympy Matrix.
+            backend (str): requested backend, one of engines.backends.BACKENDS.
 
         Returns:
             str: string which contains determinant and rank.
         """
 
-        text = normalize_string(text).strip()
-        text = self.replace_custom_commands(text, False)[0]
+        text = self.normalize_matrix_text(text)
         command = read_command(text, 0)
-        matrix = parse_matrix(command)[1]
+        with profiling.stage('parse_matrix'):
+            matrix = parse_matrix(command, approximate, engine, backend)[1]
 
-        return f'det: {matrix.det()}, rank: {matrix.rank()}'
+        with profiling.stage('det_rank'):
+            det, rank = matrix.det_rank()
+        return f'det: {det}, rank: {rank}'
 
-    def apply_elementary_operations(self, text: str):
+    def apply_elementary_operations(self, text: str, backend: str = 'auto'):
         r"""
         Applies elementary operations to matrix.
 
@@ -198,60 +343,135 @@ class Parser:
 
         Args:
             text (str): raw LaTeX code with matrix and elementary operations such as \\simop, \\eqop, \\arrop.
+            backend (str): requested backend, one of engines.backends.BACKENDS.
+
+        Matrices after every request are cached under matrix and operations, so a request which extends
+        a known chain of operations (or starts from the previous result) continues from the cached matrix.
+        Only rows and columns changed by the operations are simplified.
 
         Returns:
             str: matrix with applied ops as LaTeX string.
         """
 
-        text = normalize_string(text).strip()
-        text = self.replace_custom_commands(text, False)[0]
-
+        text = self.normalize_matrix_text(text)
         command = read_command(text, 0)
-        blocks, matrix = parse_matrix(command)
+        blocks = matrix_blocks(command)
         pos = command[blocks - 1].end + 1
-        pos = skip_spaces(text, pos)
-        ops = parse_el_ops(read_command(text, pos))
+        matrix_key = state_key(text[command.begin:pos])
+        lines = el_op_lines(read_command(text, skip_spaces(text, pos)))
+
+        done, matrix = 0, None
+        for prefix in range(len(lines), -1, -1):
+            matrix = self.el_ops_states.get((matrix_key, tuple(lines[:prefix])))
+            if matrix is not None:
+                done, matrix = prefix, matrix.copy()
+                matrix.backend = backend
+                break
+        profiling.count('el_ops_cached_ops', done)
+        if matrix is None:
+            with profiling.stage('parse_matrix'):
+                matrix = parse_matrix(command, backend=backend)[1]
+            self.el_ops_states.put((matrix_key, ()), matrix.copy())
+
+        with profiling.stage('el_ops'):
+            matrix.apply_operations([parse_operation(line) for line in lines[done:]])
+        if done < len(lines):
+            self.el_ops_states.put((matrix_key, tuple(lines)), matrix.copy())
+        with profiling.stage('simplify'):
+            matrix.simplify(touched=True)
+
+        with profiling.stage('to_latex'):
+            result = str(matrix)
+        self.el_ops_states.put((state_key(result), ()), matrix.copy())
+        return result
+
+    def elementary_transforms(self, text: str):
+        r"""
+        Combines elementary operations into transformation matrices: product L of row operations
+        and product R of column operations, which turn matrix A into L A R.
 
-        for op in ops:
-            axis = op.pop('axis')
-            if axis == 'col':
-                matrix.col_op(**op)
-            else:
-                matrix.row_op(**op)
-        matrix.simplify()
+        Args:
+            text (str): raw LaTeX code with matrix and elementary operations such as \\simop, \\eqop, \\arrop.
+
+        Returns:
+            tuple: tuple(L as LaTeX string, R as LaTeX string)
+        """
 
-        return str(matrix)
+        text = self.normalize_matrix_text(text)
+        command = read_command(text, 0)
+        pos = command[matrix_blocks(command) - 1].end + 1
+        lines = el_op_lines(read_command(text, skip_spaces(text, pos)))
+        with profiling.stage('parse_matrix'):
+            matrix = parse_matrix(command)[1]
+        with profiling.stage('compile_el_ops'):
+            left, right = matrix.compile_operations([parse_operation(line) for line in lines])
+        with profiling.stage('to_latex'):
+            return str(Matrix(r'\matrix', left.to_matrix())), str(Matrix(r'\matrix', right.to_matrix(True)))
 
     def parse_command_file(self, text):
         r"""
-        Reads, parses and stores in self.custom_commands all "\\newcommand" tags from text.
+        Reads, compiles and stores in self.custom_commands all "\\newcommand" tags from text.
 
         Args:
             text (str): content of file with custom commands.
         """
 
-        text = text.replace('\n', '')
-        pattern = re.compile(r"\\newcommand\s*{\s*(?P<name>\\[a-zA-Z]+)\s*}\s*(?:\[(?P<args_cnt>[0-9]+)])?\s*")
-        for i in pattern.finditer(text):
-            closing = find_close_bracket(text, i.end(), not_found_exception=False)
-            if closing != -1:
-                self.custom_commands[i['name']] = (
-                    int(i['args_cnt']) if i['args_cnt'] else 0, text[i.end() + 1: closing])
-        matrices = (r'\dmatrix', r'\ematrix', r'\matrix', r'\pmatrix')
-        el_ops = (r'\arrop', r'\eqop', r'\simop')
-        for m in matrices + el_ops:
-            if m in self.custom_commands:
-                self.custom_commands.pop(m)
+        self.custom_commands.update(parse_commands(text))
 
-    def __init__(self, custom_command_file: str = ''):
-        """Initialization with custom command file"""
+    def load_command_file(self):
+        """Loads compiled custom commands of self.custom_command_file through the on-disk cache"""
+
+        self.command_file_mtime, commands = load_commands(self.custom_command_file)
+        self.custom_commands = commands
 
-        custom_command_file = custom_command_file.strip()
-        if custom_command_file:
+    def reload_command_file(self):
+        """Reloads custom commands if the command file was changed since it was loaded"""
+
+        if not self.custom_command_file:
+            return
+        try:
+            mtime = os.stat(self.custom_command_file).st_mtime_ns
+        except OSError:
+            # File is being replaced or was removed, keep commands which were loaded
+            return
+        if mtime != self.command_file_mtime:
             try:
-                f = open(custom_command_file, 'r', encoding='utf-8')
-            except OSError:
-                raise OSError(f"Unable to open/read file: {custom_command_file}")
+                self.load_command_file()
+            except (OSError, UnicodeDecodeError):
+                pass
+
+    def cache_info(self):
+        """Hits and misses of caches of parser, they are counted from the start of the process"""
+
+        cells = cell_cache_info()
+        latex = latex_cache_info()
+        return {
+            'cells': {'hits': cells['hits'], 'misses': cells['misses']},
+            'latex_cells': {'hits': latex['hits'], 'misses': latex['misses']},
+            'el_ops_states': {'hits': self.el_ops_states.hits, 'misses': self.el_ops_states.misses},
+            'simplify_memo': memo_info(),
+        }
+
+    @staticmethod
+    @contextmanager
+    def request_scope():
+        """Shares interned entries and simplification results and records selected backends within one request"""
+
+        with simplify.request_scope(), backends.request_scope():
+            yield
+
+    @staticmethod
+    def used_backend():
+        """Name of the backend which served the current request or None"""
+
+        return backends.used()
+
+    def __init__(self, custom_command_file: str = ''):
+        """Initialization with custom command file"""
 
-            with f:
-                self.parse_command_file(f.read())
+        self.el_ops_states = LRUCache(EL_OPS_CACHE_SIZE)
+        self.custom_commands = {}
+        self.custom_command_file = custom_command_file.strip()
+        self.command_file_mtime = None
+        if self.custom_command_file:
+            self.load_command_file()
@@ -1,70 +1,242 @@
-from sympy.parsing.latex import parse_latex, LaTeXParsingError
-from utils import find_close_bracket, read_command, Command
+from sympy.parsing.latex import LaTeXParsingError
+from parsers.expression_parser import parse_expression
+from utils import find_close_bracket, read_command, latex_cell, Command
+from engines import numeric, sparse, domain, backends
+from engines.transform import Transform
+from engines.simplify import intern, memoized
+from functools import lru_cache
 
 import sympy as sp
+import re
+
+
+# Maximum amount of parsed cells kept in memory between requests
+CELL_CACHE_SIZE = 4096
+
+INTEGER_PATTERN = re.compile(r'-?\d+')
+DECIMAL_PATTERN = re.compile(r'-?\d+\.\d+')
+IDENTIFIER_PATTERN = re.compile(r'[a-zA-Z]')
+
+# Amount of blocks of every matrix command
+MATRIX_BLOCKS = {r'\matrix': 1, r'\pmatrix': 1, r'\dmatrix': 1, r'\ematrix': 2}
 
 
 # Matrix wrapper
 class Matrix:
-    """Matrix wrapper"""
+    """
+    Matrix wrapper.
 
-    def __init__(self, mtype: str, matrix: sp.Matrix, ematrix: sp.Matrix = None):
+    Elementary operations are applied in place to lists of rows, which are converted back
+    to sympy matrices only when matrix or ematrix is accessed.
+    """
+
+    def __init__(self, mtype: str, matrix: sp.Matrix, ematrix: sp.Matrix = None, approximate: bool = False,
+                 engine: str = 'sympy', backend: str = 'auto'):
+        self.rows = None
+        self.erows = None
         self.matrix = matrix
         self.ematrix = ematrix
         self.mtype = mtype
+        self.approximate = approximate
+        self.engine = engine
+        # Requested backend, see engines.backends
+        self.backend = backend
+        self.sparse = False
+        self.touched_rows = set()
+        self.touched_cols = set()
 
     def __str__(self):
-        s = self.mtype + '{\n'
+        return ''.join(self.lines())
+
+    def lines(self):
+        """Yields LaTeX of matrix line by line"""
+
+        yield self.mtype + '{\n'
         for row in range(self.matrix.shape[0]):
-            s += self.row_to_string(row) + '\n'
-        s += '}'
+            yield self.row_to_string(row) + '\n'
+        yield '}'
         if self.mtype == r'\ematrix':
-            s += '{\n'
+            yield '{\n'
             for row in range(self.ematrix.shape[0]):
-                s += self.row_to_string(row, False) + '\n'
-            s += '}'
-        return s
+                yield self.row_to_string(row, False) + '\n'
+            yield '}'
 
     def row_to_string(self, row: int, main_matrix=True):
         mrow = (self.matrix if main_matrix else self.ematrix).row(row)
-        s = ''
-        for i in range(len(mrow)):
-            parsed = sp.latex(mrow[i])
-            s += parsed + ('\\\\' if i == len(mrow) - 1 else '&')
-        return s
+        return '&'.join(latex_cell(entry) for entry in mrow) + '\\\\'
+
+    @property
+    def matrix(self):
+        if self.rows is not None:
+            self._matrix = sp.ImmutableMatrix(self.rows)
+            self.rows = None
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, value):
+        self._matrix = value
+        self.rows = None
+
+    @property
+    def ematrix(self):
+        if self.erows is not None:
+            self._ematrix = sp.ImmutableMatrix(self.erows)
+            self.erows = None
+        return self._ematrix
+
+    @ematrix.setter
+    def ematrix(self, value):
+        self._ematrix = value
+        self.erows = None
+
+    def row_lists(self):
+        """Returns mutable lists of rows of matrix and ematrix (None if there is no ematrix)"""
+
+        if self.rows is None:
+            self.rows = self._matrix.tolist()
+        if self.erows is None and self._ematrix:
+            self.erows = self._ematrix.tolist()
+        return self.rows, self.erows
 
     def shape(self):
+        if self.rows is not None:
+            return len(self.rows), len(self.rows[0]) if self.rows else 0
         return self.matrix.shape
 
+    def width(self):
+        """Amount of columns column operations can use, the smaller width of matrix and ematrix"""
+
+        return min(len(rows[0]) if rows else 0 for rows in self.row_lists() if rows is not None)
+
+    def copy(self):
+        matrix = Matrix(self.mtype, self._matrix, self._ematrix, self.approximate, self.engine, self.backend)
+        matrix.sparse = self.sparse
+        if self.rows is not None:
+            matrix.rows = [row[:] for row in self.rows]
+        if self.erows is not None:
+            matrix.erows = [row[:] for row in self.erows]
+        matrix.touched_rows = set(self.touched_rows)
+        matrix.touched_cols = set(self.touched_cols)
+        return matrix
+
+    @staticmethod
+    def touch(touched: set, op, n, m):
+        """Marks line n as changed by operation or moves marks of swapped lines"""
+
+        if op == 'n<->m':
+            swapped = {n, m} & touched
+            touched -= swapped
+            touched |= {m if i == n else n for i in swapped}
+        else:
+            touched.add(n)
+
     def row_op(self, op, n=None, k=None, m=None):
         """Applies row operations to matrix"""
 
-        kwargs = {'op': op, 'k': k, 'row2': m}
-        if op == 'n->kn':
-            kwargs['row'] = n
-        elif op == 'n<->m':
-            kwargs['row1'] = n
-        elif op == 'n->n+km':
-            kwargs['row'] = n
-
-        self.matrix = self.matrix.elementary_row_op(**kwargs)
-        if self.ematrix:
-            self.ematrix = self.ematrix.elementary_row_op(**kwargs)
+        self.check_index(n, m, self.shape()[0], 'Row')
+        for rows in self.row_lists():
+            if rows is None:
+                continue
+            if op == 'n->kn':
+                rows[n] = [k * x for x in rows[n]]
+            elif op == 'n<->m':
+                rows[n], rows[m] = rows[m], rows[n]
+            elif op == 'n->n+km':
+                rows[n] = [x + k * y for x, y in zip(rows[n], rows[m])]
+        self.touch(self.touched_rows, op, n, m)
 
     def col_op(self, op, n=None, k=None, m=None):
         """Applies col operations to matrix"""
 
-        kwargs = {'op': op, 'k': k, 'col2': m}
-        if op == 'n->kn':
-            kwargs['col'] = n
-        elif op == 'n<->m':
-            kwargs['col1'] = n
-        elif op == 'n->n+km':
-            kwargs['col'] = n
+        self.check_index(n, m, self.width(), 'Column')
+        for rows in self.row_lists():
+            if rows is None:
+                continue
+            for row in rows:
+                if op == 'n->kn':
+                    row[n] = k * row[n]
+                elif op == 'n<->m':
+                    row[n], row[m] = row[m], row[n]
+                elif op == 'n->n+km':
+                    row[n] = row[n] + k * row[m]
+        self.touch(self.touched_cols, op, n, m)
+
+    def compile_operations(self, ops: list):
+        """
+        Combines parsed elementary operations into products of elementary matrices L and R,
+        such that the operations turn matrix A into L A R.
+
+        Returns:
+            tuple: tuple(Transform of rows L, Transform of columns R^T)
+        """
+
+        height, width = self.shape()
+        left, right = Transform(height), Transform(width)
+        # Column operations change ematrix too, so its columns must exist as well
+        col_count = self.width()
+        for op in ops:
+            op = dict(op)
+            if op.pop('axis') == 'col':
+                self.check_index(op['n'], op.get('m'), col_count, 'Column')
+                right.apply(**op)
+            else:
+                self.check_index(op['n'], op.get('m'), height, 'Row')
+                left.apply(**op)
+        return left, right
+
+    def apply_operations(self, ops: list):
+        """
+        Applies parsed elementary operations. Row operations are combined into one left multiplier and
+        column operations into one right multiplier. If backend of the matrix combines operations (numeric
+        backends do), a multiplier is applied at once if it takes less arithmetic than applying its
+        operations one by one (e.g. when many operations mix a few lines). Symbolic matrices are changed
+        by the operations one by one in the given order, because simplification of combined entries
+        gives other (equal) forms.
+
+        Args:
+            ops (list): list of kwargs for row_op/col_op with 'axis' key.
+
+        Returns:
+            tuple: tuple(Transform of rows, Transform of columns)
+        """
 
-        self.matrix = self.matrix.elementary_col_op(**kwargs)
-        if self.ematrix:
-            self.ematrix = self.ematrix.elementary_col_op(**kwargs)
+        left, right = self.compile_operations(ops)
+        rational = all(isinstance(x, sp.Rational) for rows in self.row_lists() if rows is not None
+                       for row in rows for x in row)
+        backend = self.select_backend(rational)
+        for transform, axis in ((left, 'row'), (right, 'col')):
+            if not backend.combines_operations or not transform.is_rational() or transform.cost() >= transform.ops:
+                continue
+            self.transform(transform, axis)
+            ops = [op for op in ops if op['axis'] != axis]
+        for op in ops:
+            op = dict(op)
+            (self.col_op if op.pop('axis') == 'col' else self.row_op)(**op)
+        return left, right
+
+    def transform(self, transform: Transform, axis: str):
+        """
+        Multiplies rows of matrix and ematrix by accumulated product of row (from the left)
+        or column (from the right) operations.
+        """
+
+        for rows in self.row_lists():
+            if rows is None:
+                continue
+            if axis == 'row':
+                transform.apply_left(rows)
+            else:
+                transform.apply_right(rows)
+        if axis == 'row':
+            self.touched_rows = transform.touched(self.touched_rows)
+        else:
+            self.touched_cols = transform.touched(self.touched_cols)
+
+    @staticmethod
+    def check_index(n, m, size, axis):
+        for i in (n, m):
+            if i is not None and not 0 <= i < size:
+                raise ValueError(f'{axis} {i + 1} is out of matrix')
 
     def calculate(self):
         """Calculates matrix as part of expression"""
@@ -76,51 +248,137 @@ class Matrix:
         else:
             return self.matrix
 
-    def simplify(self):
-        self.matrix = self.matrix.simplify()
-        if self.ematrix:
-            self.ematrix = self.ematrix.simplify()
+    def simplify(self, touched: bool = False):
+        """Simplifies all entries or only entries of rows and columns changed by elementary operations"""
 
-    def det(self):
-        if self.matrix.shape[0] == self.matrix.shape[1]:
-            return self.matrix.det()
+        if touched:
+            self.matrix = simplify_lines(self.matrix, self.touched_rows, self.touched_cols)
+            if self.ematrix:
+                self.ematrix = simplify_lines(self.ematrix, self.touched_rows, self.touched_cols)
         else:
+            self.matrix = simplify_lines(self.matrix, set(range(self.matrix.shape[0])), set())
+            if self.ematrix:
+                self.ematrix = simplify_lines(self.ematrix, set(range(self.ematrix.shape[0])), set())
+        self.touched_rows = set()
+        self.touched_cols = set()
+
+    def numeric_rows(self, matrix: sp.Matrix = None):
+        """Returns matrix as list of rows of Fractions if all entries are numbers, otherwise None"""
+
+        return numeric.to_rows(self.matrix if matrix is None else matrix)
+
+    def select_backend(self, rational: bool):
+        """Chooses backend for the matrix by its entries and size, see engines.backends.select"""
+
+        return backends.select(rational, self.shape(), self.approximate, self.engine, self.sparse, self.backend)
+
+    def det(self):
+        if self.matrix.shape[0] != self.matrix.shape[1]:
             return 0
+        rows = self.numeric_rows()
+        return self.select_backend(rows is not None).det(self.matrix, rows)
 
     def rank(self):
-        return self.matrix.rank()
+        rows = self.numeric_rows()
+        return self.select_backend(rows is not None).rank(self.matrix, rows)
+
+    def det_rank(self):
+        """
+        Determinant and rank computed by one elimination: one Bareiss elimination for numeric matrices
+        (or eliminations modulo primes for large ones, see engines.modular), one factorization for symbolic
+        ones which fit polynomial ring or fraction field.
+
+        Returns:
+            tuple: tuple(determinant, rank)
+        """
+
+        rows = self.numeric_rows()
+        return self.select_backend(rows is not None).det_rank(self.matrix, rows)
 
     def inv(self):
         if self.mtype == '\\ematrix':
             raise LaTeXParsingError('Cannot inverse \\ematrix')
-        self.matrix = self.matrix.inv()
+        rows = self.numeric_rows()
+        self.matrix = self.select_backend(rows is not None).inv(self.matrix, rows)
         return self
 
     def T(self):
         if self.mtype == '\\ematrix':
             raise LaTeXParsingError('Cannot transpose \\ematrix')
-        self.matrix = self.matrix.T
+        rational = all(x.is_Rational for x in self.matrix)
+        self.matrix = self.select_backend(rational).transpose(self.matrix)
         return self
 
     def ref(self, reduced: bool):
-        matrix = self.matrix
         if self.mtype == '\\ematrix':
-            matrix = sp.Matrix.hstack(self.matrix, self.ematrix)
-        matrix = matrix.echelon_form() if not reduced else matrix.rref()[0]
+            return self.block_ref(reduced)
+        rows = self.numeric_rows()
+        self.matrix = self.select_backend(rows is not None).echelon_form(self.matrix, rows, reduced)
+        return self
 
-        if self.mtype == '\\ematrix':
-            left = []
-            for i in range(self.shape()[0]):
-                left.append(matrix.row(i)[:self.shape()[1]])
-            right = []
-            for i in range(self.shape()[0]):
-                right.append(matrix.row(i)[self.shape()[1]:])
-            self.matrix = sp.Matrix(left)
-            self.ematrix = sp.Matrix(right)
-        else:
-            self.matrix = matrix
+    def block_ref(self, reduced: bool):
+        """
+        Row echelon form of \\ematrix. Numeric blocks are converted from sympy separately and eliminated
+        by the backend without joining them (see engines.block), symbolic blocks are joined and eliminated
+        by sympy.
+        """
+
+        lines, elines = self.row_lists()
+        if not lines:
+            return self
+        rows = numeric.lists_to_rows(lines)
+        erows = numeric.lists_to_rows(elines or [[] for _ in lines]) if rows is not None else None
+        backend = self.select_backend(erows is not None)
+        self.matrix, self.ematrix = backend.block_echelon_form(self.matrix, self.ematrix, rows, erows, reduced)
         return self
 
+
+def simplify_lines(matrix: sp.Matrix, rows: set, cols: set):
+    """Simplifies entries of given rows and columns, equal entries are simplified once in a request"""
+
+    if not rows and not cols:
+        return matrix
+
+    def simplify(value):
+        # Numbers are already in canonical form
+        return value if value.is_Rational else memoized(sp.simplify, value)
+
+    lines = matrix.tolist()
+    for i in rows:
+        lines[i] = [simplify(value) for value in lines[i]]
+    for j in cols:
+        for i, line in enumerate(lines):
+            if i not in rows:
+                line[j] = simplify(line[j])
+    return sp.ImmutableMatrix(*matrix.shape, [value for line in lines for value in line])
+
+
+@lru_cache(maxsize=CELL_CACHE_SIZE)
+def parse_normalized_cell(text: str):
+    """Parses and simplifies normalized cell text, plain numbers and identifiers are parsed without any parser"""
+
+    if INTEGER_PATTERN.fullmatch(text):
+        return sp.Integer(text)
+    elif DECIMAL_PATTERN.fullmatch(text):
+        return sp.Float(text)
+    elif IDENTIFIER_PATTERN.fullmatch(text):
+        return sp.Symbol(text)
+    return memoized(sp.simplify, parse_expression(text))
+
+
+def parse_cell(text: str):
+    """Parses matrix cell through shared LRU cache"""
+
+    return parse_normalized_cell(' '.join(text.split()))
+
+
+def cell_cache_info():
+    """Returns hits, misses and size of parsed cells cache"""
+
+    info = parse_normalized_cell.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+
 def parse_matrix_block(text):
     lines = text.strip().split(r'\\')
     matrix = []
@@ -128,34 +386,52 @@ def parse_matrix_block(text):
         if line == '':
             continue
         try:
-            matrix.append(list(map(parse_latex, line.split('&'))))
+            # Equal cells of the request share one object
+            matrix.append([intern(parse_cell(cell)) for cell in line.split('&')])
         except LaTeXParsingError:
             raise LaTeXParsingError(f'LaTeX parser cannot parse row {line}')
-    matrix = sp.Matrix(matrix)
-    return sp.simplify(matrix)
+    return sp.ImmutableMatrix(matrix)
+
+
+def matrix_blocks(command: Command):
+    """Returns amount of blocks of matrix command"""
+
+    if command is None:
+        raise LaTeXParsingError('Cannot find matrix command')
+    if command.name not in MATRIX_BLOCKS:
+        raise LaTeXParsingError("Not matrix")
+    return MATRIX_BLOCKS[command.name]
 
 
 # Parses one of four matrix tags
-def parse_matrix(command: Command):
+def parse_matrix(command: Command, approximate: bool = False, engine: str = 'sympy', backend: str = 'auto'):
     r"""
     Parses matrix command and returns Matrix object.
 
     Args:
         command (Command): matrix command such as the following: \\ematrix, \\matrix, \\dmatrix, \\pmatrix.
+        approximate (bool): use float arithmetic for purely numeric matrices.
+        engine (str): engine for symbolic matrices, one of domain.ENGINES.
+        backend (str): requested backend, one of backends.BACKENDS.
+
+    Matrices with density below sparse.SPARSE_DENSITY are marked as sparse, so numeric engine
+    eliminates them with sparse algorithms.
 
     Returns:
         tuple: tuple(amount of blocks parsed, Matrix)
     """
 
-    if command is None:
-        raise LaTeXParsingError('Cannot find matrix command')
+    if engine not in domain.ENGINES:
+        raise ValueError(f"Unknown engine: {engine}")
+    if backend not in backends.BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
 
-    if command.name in (r'\matrix', r'\pmatrix', r'\dmatrix'):
+    if matrix_blocks(command) == 1:
         matrix = parse_matrix_block(command[0].inner)
-        return 1, Matrix(command.name, matrix)
-    elif command.name in (r'\ematrix',):
+        result = 1, Matrix(command.name, matrix, approximate=approximate, engine=engine, backend=backend)
+    else:
         matrix1 = parse_matrix_block(command[0].inner)
         matrix2 = parse_matrix_block(command[1].inner)
-        return 2, Matrix(command.name, matrix1, matrix2)
-    else:
-        raise LaTeXParsingError("Not matrix")
+        result = 2, Matrix(command.name, matrix1, matrix2, approximate, engine, backend)
+    result[1].sparse = sparse.is_sparse(result[1].matrix)
+    return result
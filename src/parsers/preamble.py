@@ -0,0 +1,125 @@
+from utils import find_close_bracket
+
+import hashlib
+import json
+import os
+import re
+
+
+# Directory with compiled command files, caching is disabled if it's empty
+CACHE_DIR = os.environ.get('MATRIX_OPERATIONS_CACHE', os.path.join(os.path.expanduser('~'), '.cache',
+                                                                     'matrix_operations'))
+# Changes when format of compiled commands changes, so old cache files are ignored
+CACHE_VERSION = 1
+
+NEWCOMMAND = re.compile(r"\\newcommand\s*{\s*(?P<name>\\[a-zA-Z]+)\s*}\s*(?:\[(?P<args_cnt>[0-9]+)])?\s*")
+ARGUMENT = re.compile(r'#(?P<id>\d+)')
+
+# Commands which can't be redefined
+RESERVED_COMMANDS = (r'\dmatrix', r'\ematrix', r'\matrix', r'\pmatrix', r'\arrop', r'\eqop', r'\simop')
+
+
+def compile_template(body: str):
+    """
+    Splits body of custom command into literal chunks and argument slots.
+
+    Returns:
+        tuple: tuple of str (literal chunk) and int (index of argument block).
+    """
+
+    template = []
+    pos = 0
+    for arg in ARGUMENT.finditer(body):
+        if arg.start() > pos:
+            template.append(body[pos:arg.start()])
+        template.append(int(arg['id']) - 1)
+        pos = arg.end()
+    if pos < len(body):
+        template.append(body[pos:])
+    return tuple(template)
+
+
+def parse_commands(text: str):
+    r"""
+    Reads and compiles all "\\newcommand" tags from text.
+
+    Returns:
+        dict: {name: tuple(amount of arguments, template)}.
+    """
+
+    commands = {}
+    text = text.replace('\n', '')
+    for i in NEWCOMMAND.finditer(text):
+        closing = find_close_bracket(text, i.end(), not_found_exception=False)
+        if closing != -1:
+            commands[i['name']] = (int(i['args_cnt']) if i['args_cnt'] else 0,
+                                   compile_template(text[i.end() + 1: closing]))
+    for m in RESERVED_COMMANDS:
+        commands.pop(m, None)
+    return commands
+
+
+def cache_path(path: str):
+    return os.path.join(CACHE_DIR, hashlib.sha1(os.path.abspath(path).encode()).hexdigest() + '.json')
+
+
+def read_cache(path: str, mtime: int, content_hash: str):
+    """Returns compiled commands of file from cache or None if there are no valid ones"""
+
+    try:
+        with open(cache_path(path), 'r', encoding='utf-8') as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (cached.get('version') != CACHE_VERSION or cached.get('path') != os.path.abspath(path)
+            or cached.get('mtime') != mtime or cached.get('hash') != content_hash):
+        return None
+    return {name: (count, tuple(template)) for name, (count, template) in cached['commands'].items()}
+
+
+def write_cache(path: str, mtime: int, content_hash: str, commands: dict):
+    """Stores compiled commands of file in cache. Cache is optional, so errors are ignored"""
+
+    cached = {'version': CACHE_VERSION, 'path': os.path.abspath(path), 'mtime': mtime, 'hash': content_hash,
+              'commands': commands}
+    target = cache_path(path)
+    temp = f'{target}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(cached, f)
+        # Workers may write the same file simultaneously, replace is atomic
+        os.replace(temp, target)
+    except OSError:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+
+
+def load_commands(path: str):
+    """
+    Reads compiled custom commands of file from cache or parses the file and stores the result in cache.
+    Cache entry is valid while path, modification time and hash of content are the same.
+
+    Returns:
+        tuple: tuple(modification time of file in ns, {name: tuple(amount of arguments, template)}).
+    """
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, 'rb') as f:
+            content = f.read()
+    except OSError:
+        raise OSError(f"Unable to open/read file: {path}")
+
+    content_hash = hashlib.sha1(content).hexdigest()
+    if CACHE_DIR:
+        commands = read_cache(path, mtime, content_hash)
+        if commands is not None:
+            return mtime, commands
+
+    commands = parse_commands(content.decode('utf-8'))
+    if CACHE_DIR:
+        write_cache(path, mtime, content_hash, commands)
+    return mtime, commands
@@ -0,0 +1,184 @@
+from collections import deque
+from contextlib import contextmanager
+
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+
+
+# Amount of the last requests of every command which are used for percentiles
+STATS_WINDOW = 1000
+PERCENTILES = (50, 90, 99)
+
+# Traces of requests running in the current thread
+local = threading.local()
+
+# Requests which run longer than profile_threshold seconds are profiled by cProfile and dumped into profile_dir
+profile_threshold = None
+profile_dir = None
+
+
+class Trace:
+    """Wall time and amount of calls of every stage of one request"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.start = time.perf_counter()
+
+    def add(self, name: str, elapsed: float):
+        stage = self.stages.get(name)
+        if stage is None:
+            self.stages[name] = [elapsed, 1]
+        else:
+            stage[0] += elapsed
+            stage[1] += 1
+
+    def to_dict(self):
+        return {
+            'time': round(time.perf_counter() - self.start, 6),
+            'stages': {name: {'time': round(total, 6), 'calls': calls} for name, (total, calls) in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+def current():
+    return getattr(local, 'trace', None)
+
+
+@contextmanager
+def stage(name: str):
+    """Adds wall time of the block to the stage of the current trace, does nothing if request isn't traced"""
+
+    trace = current()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+
+def count(name: str, value: int = 1):
+    """Adds value to the counter of the current trace, like amount of cache hits"""
+
+    trace = current()
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + value
+
+
+def configure(threshold: float = None, directory: str = None):
+    """Enables cProfile dumps of requests which run longer than threshold seconds"""
+
+    global profile_threshold, profile_dir
+    profile_threshold = threshold or None
+    profile_dir = directory if threshold else None
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def dump_name(inp: dict):
+    name = f"{inp.get('command')}-{inp.get('id')}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"
+    return os.path.join(profile_dir, re.sub(r'[^\w.-]', '_', name))
+
+
+@contextmanager
+def request(inp: dict, traced: bool):
+    """
+    Traces request if traced is True and profiles it if cProfile dumps are enabled.
+
+    Yields:
+        dict: dictionary which gets 'profile' with trace and 'profile_dump' with path to cProfile dump
+        after the block.
+    """
+
+    result = {}
+    profiler = cProfile.Profile() if profile_threshold else None
+    if traced:
+        local.trace = Trace()
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield result
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            if time.perf_counter() - start > profile_threshold:
+                path = dump_name(inp)
+                try:
+                    profiler.dump_stats(path)
+                    result['profile_dump'] = path
+                except OSError:
+                    pass
+        if traced:
+            result['profile'] = local.trace.to_dict()
+            local.trace = None
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    result = {f'p{p}': round(values[min(len(values) - 1, len(values) * p // 100)], 6) for p in PERCENTILES}
+    result['mean'] = round(sum(values) / len(values), 6)
+    result['max'] = round(values[-1], 6)
+    return result
+
+
+class Stats:
+    """Latencies of the last STATS_WINDOW requests and time of their stages for every command"""
+
+    def __init__(self, trace_file: str = None):
+        """
+        Args:
+            trace_file (str): JSONL file which gets a line for every traced request or None.
+        """
+
+        self.lock = threading.Lock()
+        self.latency = {}
+        self.stages = {}
+        self.counts = {}
+        self.trace_file = open(trace_file, 'a', encoding='utf-8') if trace_file else None
+
+    def record(self, command: str, latency: float, response: dict):
+        """Adds request which was completed in latency seconds with response from worker"""
+
+        profile = response.get('profile')
+        with self.lock:
+            self.counts[command] = self.counts.get(command, 0) + 1
+            self.latency.setdefault(command, deque(maxlen=STATS_WINDOW)).append(latency)
+            if profile is not None:
+                stages = self.stages.setdefault(command, {})
+                for name, value in profile['stages'].items():
+                    stages.setdefault(name, deque(maxlen=STATS_WINDOW)).append(value['time'])
+            if self.trace_file is not None:
+                line = {'time': time.time(), 'command': command, 'id': response.get('id'),
+                        'latency': round(latency, 6), 'error': response.get('error')}
+                for key in ('sub_id', 'cached', 'profile', 'profile_dump'):
+                    if key in response:
+                        line[key] = response[key]
+                self.trace_file.write(json.dumps(line) + '\n')
+                self.trace_file.flush()
+
+    def summary(self):
+        """
+        Returns:
+            dict: {command: {'count', 'latency': percentiles, 'stages': {stage: percentiles}}}.
+        """
+
+        with self.lock:
+            return {command: {
+                'count': self.counts[command],
+                'latency': percentiles(latency),
+                'stages': {name: percentiles(values) for name, values in self.stages.get(command, {}).items()},
+            } for command, latency in self.latency.items()}
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
@@ -3,6 +3,16 @@ import string
 import sympy as sp
 
 from sympy.parsing.latex.errors import LaTeXParsingError
+from functools import lru_cache
+
+
+# Maximum amount of LaTeX strings of matrix entries kept in memory between requests
+LATEX_CACHE_SIZE = 4096
+
+PARENTHESES_PATTERN = re.compile(r'\\left(?P<l>\()|\\right(?P<r>\))')
+MATRIX_PATTERN = re.compile(r'\\left\[\\begin{matrix}(?P<inner>.+?)\\end{matrix}\\right]')
+# Sympy prints matrices with more columns as array
+MATRIX_MAX_COLUMNS = 10
 
 
 class Command:
@@ -36,6 +46,15 @@ class Command:
         self.end = pos + len(name) - 1
 
 
+class Group:
+    """Brace group which doesn't belong to any command"""
+
+    def __init__(self, begin: int):
+        self.children = []
+        self.begin = begin
+        self.closed = False
+
+
 def find_close_bracket(text, pos=0, bracket='{}', not_found_exception=True):
     """Finds close bracket for the open one which is on the pos or returns either exceptions or -1 depending on
     not_found_exception argument"""
@@ -62,9 +81,8 @@ def skip_spaces(text: str, pos: int):
     return pos
 
 
-def read_command(text: str, pos: int):
-    if pos >= len(text) or text[pos] != '\\':
-        return None
+def read_command_name(text: str, pos: int):
+    """Reads name of command which starts on pos and returns tuple(Command without blocks, position after name)"""
 
     begin = pos
     pos += 1
@@ -77,6 +95,14 @@ def read_command(text: str, pos: int):
 
     if pos != len(text) and text[pos] not in "(){}[]\\ ":
         raise LaTeXParsingError(f"Unexpected symbol after {command.name}: '{text[pos]}'")
+    return command, pos
+
+
+def read_command(text: str, pos: int):
+    if pos >= len(text) or text[pos] != '\\':
+        return None
+
+    command, pos = read_command_name(text, pos)
     pos = skip_spaces(text, pos)
 
     while pos < len(text) and text[pos] == '{':
@@ -87,6 +113,82 @@ def read_command(text: str, pos: int):
     return command
 
 
+def parse_tree(text: str):
+    r"""
+    Splits LaTeX into tree of text chunks, commands and brace groups in one pass.
+    Blocks of commands get raw text in Block.inner and parsed content in Block.children.
+    Line breaks (\\) and escaped symbols like \{ stay in text.
+
+    Args:
+        text (str): string with normalized LaTeX.
+
+    Returns:
+        list: list of str, Command and Group nodes.
+    """
+
+    root = []
+    children = root
+    # Stack of tuple(children list of parent, Command or Group which is open)
+    stack = []
+    start = pos = 0
+    n = len(text)
+
+    def open_block(command, brace):
+        block = Command.Block(None, brace, None)
+        block.children = []
+        command.blocks.append(block)
+        stack.append((children, command))
+        return block.children
+
+    while pos < n:
+        char = text[pos]
+        if char == '\\' and pos + 1 < n and not text[pos + 1].isalpha():
+            if text[pos + 1] not in "(){}[]\\ ":
+                raise LaTeXParsingError(f"Unexpected symbol after \\: '{text[pos + 1]}'")
+            pos += 2
+        elif char == '\\':
+            if pos > start:
+                children.append(text[start:pos])
+            command, pos = read_command_name(text, pos)
+            children.append(command)
+            start = pos
+            brace = skip_spaces(text, pos)
+            if brace < n and text[brace] == '{':
+                children = open_block(command, brace)
+                start = pos = brace + 1
+        elif char == '{':
+            if pos > start:
+                children.append(text[start:pos])
+            group = Group(pos)
+            children.append(group)
+            stack.append((children, group))
+            children = group.children
+            start = pos = pos + 1
+        elif char == '}' and stack:
+            if pos > start:
+                children.append(text[start:pos])
+            children, node = stack.pop()
+            start = pos = pos + 1
+            if isinstance(node, Group):
+                node.closed = True
+                continue
+            block = node.blocks[-1]
+            block.inner = text[block.begin + 1:pos - 1]
+            block.end = node.end = pos - 1
+            brace = skip_spaces(text, pos)
+            if brace < n and text[brace] == '{':
+                children = open_block(node, brace)
+                start = pos = brace + 1
+        else:
+            pos += 1
+
+    if any(isinstance(node, Command) for _, node in stack):
+        raise LaTeXParsingError("Matching close bracket not found")
+    if n > start:
+        children.append(text[start:])
+    return root
+
+
 def normalize_string(s: str):
     return s.translate(str.maketrans({i: ' ' for i in string.whitespace}))
 
@@ -95,9 +197,45 @@ def matrix_replacer(expr):
     return '\matrix{\n' + expr['inner'] + '\n}'
 
 
+@lru_cache(maxsize=LATEX_CACHE_SIZE)
+def latex_cell(entry):
+    """LaTeX of matrix entry through shared LRU cache, repeated values are printed once"""
+
+    return sp.latex(entry)
+
+
+def latex_cache_info():
+    """Returns hits, misses and size of LaTeX cache of matrix entries"""
+
+    info = latex_cell.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+
+def cell_to_string(entry):
+    return PARENTHESES_PATTERN.sub(r'\g<l>\g<r>', latex_cell(entry)).replace('\\\\', '\\\\\n')
+
+
+def expression_lines(expr):
+    """
+    Yields LaTeX of expression piece by piece, matrices are yielded row by row and every entry
+    is printed separately, so whole LaTeX of large matrix isn't built and searched by regexes.
+    """
+
+    if not isinstance(expr, sp.MatrixBase) or not expr.rows or not expr.cols:
+        expr = PARENTHESES_PATTERN.sub(r'\g<l>\g<r>', sp.latex(expr))
+        yield MATRIX_PATTERN.sub(matrix_replacer, expr).replace('\\\\', '\\\\\n')
+        return
+
+    if expr.cols <= MATRIX_MAX_COLUMNS:
+        begin, end = '\\matrix{\n', '\n}'
+    else:
+        begin, end = '\\left[\\begin{array}{' + 'c' * expr.cols + '}', '\\end{array}\\right]'
+    yield begin
+    for i in range(expr.rows):
+        line = ' & '.join(cell_to_string(entry) for entry in expr.row(i))
+        yield line + '\\\\\n' if i < expr.rows - 1 else line
+    yield end
+
+
 def expression_to_string(expr):
-    expr = sp.latex(expr)
-    expr = re.sub(r'\\left(?P<l>\()|\\right(?P<r>\))', r'\g<l>\g<r>', expr)
-    pattern = re.compile(r'\\left\[\\begin{matrix}(?P<inner>.+?)\\end{matrix}\\right]')
-    expr = re.sub(pattern, matrix_replacer, expr).replace('\\\\', '\\\\\n')
-    return expr
+    return ''.join(expression_lines(expr))
@@ -0,0 +1,153 @@
+from engines import backends, numeric
+from parsers.latex_parser import Parser
+
+import random
+import pytest
+import sympy as sp
+
+
+# Exact backends must give the same output as SymPy, the reference
+EXACT = [name for name in ('python', 'flint') if backends.REGISTRY[name].available()]
+# Relative tolerance of NumPy results
+TOLERANCE = 1e-8
+
+
+def random_cell():
+    if random.random() < 0.3:
+        return '0'
+    a, b = random.randint(-9, 9), random.choice((1, 1, 2, 3))
+    if b == 1 or a == 0:
+        return str(a)
+    return ('-' if a < 0 else '') + r'\frac{%d}{%d}' % (abs(a), b)
+
+
+def random_block(rows: int, cols: int, rank: int = None):
+    lines = [[random_cell() for _ in range(cols)] for _ in range(rows if rank is None else rank)]
+    while len(lines) < rows:
+        # Repeated rows make singular matrices
+        lines.append(random.choice(lines))
+    return r'\\ '.join(' & '.join(line) for line in lines)
+
+
+def cases():
+    random.seed(0)
+    texts = []
+    for size in (1, 2, 3, 4, 5, 6, 10, 12):
+        for rows, cols, rank in ((size, size, None), (size, size + 2, None), (size + 2, size, None),
+                                 (size + 1, size + 1, size)):
+            texts.append(r'\matrix{' + random_block(rows, cols, rank) + '}')
+            texts.append(r'\ematrix{' + random_block(rows, cols, rank) + '}{' + random_block(rows, 2) + '}')
+    return texts
+
+
+CASES = cases()
+COMMANDS = {
+    'ref': lambda parser, text, backend: parser.ref(text, False, backend=backend),
+    'rref': lambda parser, text, backend: parser.ref(text, True, backend=backend),
+    'inverse': lambda parser, text, backend: parser.inv(text, backend=backend),
+    'matrix_info': lambda parser, text, backend: parser.info(text, backend=backend),
+}
+
+
+def output(command: str, text: str, backend: str):
+    try:
+        return COMMANDS[command](Parser(), text, backend)
+    except Exception as e:
+        # Errors (singular or non-square matrix, \ematrix) are the same whatever backend serves the request
+        return type(e), str(e)
+
+
+@pytest.mark.parametrize('backend', EXACT + ['auto'])
+@pytest.mark.parametrize('command', COMMANDS)
+def test_exact_backend_output(backend, command):
+    for text in CASES:
+        assert output(command, text, backend) == output(command, text, 'sympy'), text
+
+
+def numpy_results(matrix: sp.Matrix, backend: backends.Backend):
+    rows = numeric.to_rows(matrix)
+    results = {'det_rank': backend.det_rank(matrix, rows), 'rref': backend.echelon_form(matrix, rows, True)}
+    try:
+        results['inv'] = backend.inv(matrix, rows)
+    except ValueError:
+        results['inv'] = None
+    return results
+
+
+def pivots(matrix: sp.Matrix):
+    """Columns of leading entries of rows, they are the same for every echelon form of matrix"""
+
+    # Exact entries are compared with zero, floats with tolerance
+    scale = max([1] + [abs(float(x)) for x in matrix if x.is_Float])
+    columns = []
+    for row in matrix.tolist():
+        column = next((j for j, x in enumerate(row) if (abs(float(x)) > TOLERANCE * scale if x.is_Float else x)), None)
+        if column is not None:
+            columns.append(column)
+    return columns
+
+
+def close(result, expected):
+    result, expected = list(sp.Matrix([result]).T if not isinstance(result, sp.MatrixBase) else result), \
+        list(sp.Matrix([expected]).T if not isinstance(expected, sp.MatrixBase) else expected)
+    scale = max([1] + [abs(float(x)) for x in expected])
+    return len(result) == len(expected) and all(abs(float(x) - float(y)) <= TOLERANCE * scale
+                                                for x, y in zip(result, expected))
+
+
+@pytest.mark.skipif(not backends.NumpyBackend.available(), reason="NumPy isn't installed")
+def test_numpy_backend_is_close():
+    random.seed(1)
+    for _ in range(100):
+        n, m = random.randint(1, 6), random.randint(1, 6)
+        matrix = sp.Matrix(n, m, lambda i, j: sp.Rational(random.randint(-9, 9), random.choice((1, 2, 3))))
+        result = numpy_results(matrix, backends.NumpyBackend())
+        expected = numpy_results(matrix, backends.PythonBackend())
+        assert close(result['det_rank'], expected['det_rank']), matrix.tolist()
+        assert close(result['rref'], expected['rref']), matrix.tolist()
+        if expected['inv'] is not None:
+            assert close(result['inv'], expected['inv']), matrix.tolist()
+        rows = numeric.to_rows(matrix)
+        ref = backends.NumpyBackend().echelon_form(matrix, rows, False)
+        assert pivots(ref) == pivots(matrix.echelon_form()), matrix.tolist()
+
+
+def test_incomplete_backend_cant_be_created():
+    class Incomplete(backends.Backend):
+        name = 'incomplete'
+
+        def det(self, matrix, rows):
+            return 0
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def exact_results(matrix: sp.Matrix, right: sp.Matrix, backend: backends.Backend):
+    rows, erows = numeric.to_rows(matrix), numeric.to_rows(right)
+    results = {
+        'det_rank': backend.det_rank(matrix, rows),
+        'ref': backend.echelon_form(matrix, rows, False),
+        'rref': backend.echelon_form(matrix, rows, True),
+        'block_ref': backend.block_echelon_form(matrix, right, rows, erows, False),
+        'block_rref': backend.block_echelon_form(matrix, right, rows, erows, True),
+    }
+    try:
+        results['inv'] = backend.inv(matrix, rows)
+    except ValueError as e:
+        results['inv'] = type(e), str(e)
+    return results
+
+
+def test_flint_backend_matches_python():
+    pytest.importorskip('flint')
+    random.seed(2)
+    for _ in range(100):
+        n, m = random.randint(1, 8), random.randint(1, 8)
+        lines = [[sp.Rational(random.randint(-9, 9), random.choice((1, 2, 3))) for _ in range(m)]
+                 for _ in range(random.randint(1, n))]
+        # Repeated rows make singular matrices
+        matrix = sp.Matrix(lines + [random.choice(lines) for _ in range(n - len(lines))])
+        right = sp.Matrix(n, 2, lambda i, j: random.randint(-9, 9))
+        assert (exact_results(matrix, right, backends.FlintBackend())
+                == exact_results(matrix, right, backends.PythonBackend())), matrix.tolist()
@@ -0,0 +1,31 @@
+from engines import block, numeric
+
+import random
+import sympy as sp
+
+
+def random_matrix(rows: int, cols: int):
+    return sp.Matrix(rows, cols, lambda i, j: sp.Rational(random.randint(-5, 5), random.choice((1, 2, 3)))
+                     if random.random() < 0.7 else 0)
+
+
+def check(left: sp.Matrix, right: sp.Matrix, reduced: bool):
+    joined = sp.Matrix.hstack(left, right)
+    expected = joined.rref()[0] if reduced else joined.echelon_form()
+    rows, erows = block.echelon_form(numeric.to_rows(left), numeric.to_rows(right), reduced)
+    result = sp.Matrix.hstack(numeric.to_matrix(rows, left.shape), numeric.to_matrix(erows, right.shape))
+    assert result == expected, (left.tolist(), right.tolist())
+
+
+def test_block_ref_equals_sympy():
+    random.seed(0)
+    for _ in range(200):
+        n = random.randint(1, 5)
+        check(random_matrix(n, random.randint(1, 5)), random_matrix(n, random.randint(1, 3)), False)
+
+
+def test_block_rref_equals_sympy():
+    random.seed(1)
+    for _ in range(200):
+        n = random.randint(1, 5)
+        check(random_matrix(n, random.choice((n, random.randint(1, 5)))), random_matrix(n, random.randint(1, 3)), True)
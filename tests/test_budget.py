@@ -0,0 +1,47 @@
+from engines.matrix_expr import Evaluator
+from parsers.latex_parser import Parser
+from sympy.matrices.expressions import MatPow
+
+import time
+
+
+def test_partial_result_of_matrix_evaluation(monkeypatch):
+    compute = Evaluator.compute
+
+    def slow_compute(self, expr):
+        if isinstance(expr, MatPow):
+            time.sleep(30)
+        return compute(self, expr)
+
+    monkeypatch.setattr(Evaluator, 'compute', slow_compute)
+    text = r'\matrix{a & 1\\ 1 & a}^{40} + \matrix{1 & 2\\ 3 & 4}\matrix{1 & 0\\ 0 & 1}'
+    start = time.monotonic()
+    result, partial = Parser().simplify_expr_with_budget(text, 3)
+    assert time.monotonic() - start < 10
+    assert partial
+    # The product is evaluated before the budget is over, the power stays unevaluated
+    assert '^{40}' in result
+    assert '1 & 2\\\\\n3 & 4' in result
+
+
+def test_simplify_within_budget():
+    result, partial = Parser().simplify_expr_with_budget(r'\frac{x^2-1}{x-1}', 30)
+    assert result == 'x + 1'
+    assert not partial
+
+
+def test_partial_result_keeps_explicit_matrices(monkeypatch):
+    compute = Evaluator.compute
+
+    def slow_compute(self, expr):
+        if isinstance(expr, MatPow) and expr.exp == 40:
+            time.sleep(30)
+        return compute(self, expr)
+
+    monkeypatch.setattr(Evaluator, 'compute', slow_compute)
+    matrix = r'\matrix{1 & 2\\ 3 & 4}'
+    text = r'\matrix{a & 1\\ 1 & a}^{40} + ' + f'{matrix}^{{-1}}{matrix}'
+    result, partial = Parser().simplify_expr_with_budget(text, 3)
+    assert partial
+    assert '^{40}' in result
+    assert '\\matrix{\n1 & 0\\\\\n0 & 1\n}' in result
@@ -0,0 +1,40 @@
+from parsers.latex_parser import Parser
+from parsers.matrix_parser import parse_cell, cell_cache_info
+
+
+def test_cell_cache_normalizes_whitespace():
+    first = parse_cell(r'\frac{17}{19} + 1')
+    before = cell_cache_info()
+    assert parse_cell('  \\frac{17}{19}\n+  1 ') is first
+    after = cell_cache_info()
+    assert after['hits'] == before['hits'] + 1
+    assert after['misses'] == before['misses']
+
+
+def test_repeated_matrix_cells_hit_cache():
+    parser = Parser()
+    text = r'\matrix{\frac{23}{29} & \frac{31}{37}\\ \frac{41}{43} & \frac{23}{29}}'
+    parser.ref(text, True)
+    before = cell_cache_info()
+    parser.ref(text, True)
+    after = cell_cache_info()
+    assert after['misses'] == before['misses']
+    assert after['hits'] == before['hits'] + 4
+
+
+def test_el_ops_chain_continues_from_cached_result():
+    parser = Parser()
+    first = parser.apply_elementary_operations(r'\matrix{1 & 2\\ 3 & 4} \simop{(2)-3(1)}')
+    hits = parser.el_ops_states.hits
+    second = parser.apply_elementary_operations(first + r' \simop{(1)\cdot\frac{1}{2}}')
+    assert parser.el_ops_states.hits == hits + 1
+    assert second == Parser().apply_elementary_operations(r'\matrix{1 & 2\\ 3 & 4} \simop{(2)-3(1)\\ (1)\cdot\frac{1}{2}}')
+
+
+def test_el_ops_extends_cached_prefix():
+    parser = Parser()
+    parser.apply_elementary_operations(r'\matrix{1 & 2\\ 3 & 4} \simop{(2)-3(1)}')
+    hits = parser.el_ops_states.hits
+    result = parser.apply_elementary_operations(r'\matrix{1 & 2\\ 3 & 4} \simop{(2)-3(1)\\ (1)\lra(2)}')
+    assert parser.el_ops_states.hits == hits + 1
+    assert result == Parser().apply_elementary_operations(r'\matrix{1 & 2\\ 3 & 4} \simop{(1)\lra(2)\\ (1)-3(2)}')
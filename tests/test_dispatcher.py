@@ -0,0 +1,199 @@
+from dispatcher import Dispatcher, CANCEL_SIGNAL
+
+import io
+import json
+import pytest
+import threading
+import time
+
+
+MATRIX = r'\matrix{1 & 2 \\ 3 & 4}'
+# Takes about a minute, so it's still running when it is cancelled or timed out
+SLOW = r'\matrix{a & b & c \\ d & e & f \\ g & h & k}^{12}'
+# Time to start worker processes and import sympy in them
+START_TIMEOUT = 60
+
+needs_signal = pytest.mark.skipif(CANCEL_SIGNAL is None, reason="running requests are cancelled by SIGUSR1")
+
+
+class Output(io.StringIO):
+    """Output of dispatcher, lines are parsed as responses"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+
+    def write(self, text: str):
+        with self.lock:
+            return super().write(text)
+
+    def responses(self):
+        with self.lock:
+            return [json.loads(line) for line in self.getvalue().splitlines()]
+
+    def wait(self, predicate, timeout: float = START_TIMEOUT):
+        """Waits until some response satisfies predicate and returns it"""
+
+        end = time.monotonic() + timeout
+        while time.monotonic() < end:
+            for response in self.responses():
+                if predicate(response):
+                    return response
+            time.sleep(0.05)
+        raise AssertionError(f'No response in {timeout} seconds, got {self.responses()}')
+
+
+@pytest.fixture(params=[0, 2], ids=['workers=0', 'workers=2'])
+def dispatcher(request):
+    output = Output()
+    dispatcher = Dispatcher(workers=request.param, output=output, timeout=request.param and 3 * START_TIMEOUT)
+    yield dispatcher
+    dispatcher.shutdown(wait=False)
+
+
+@pytest.fixture
+def pool():
+    output = Output()
+    dispatcher = Dispatcher(workers=2, output=output)
+    # Workers are started and sympy is imported before the test measures anything
+    dispatcher.submit({'command': 'matrix_info', 'text': MATRIX, 'id': 'start'})
+    output.wait(lambda response: response['id'] == 'start')
+    yield dispatcher
+    dispatcher.shutdown(wait=False)
+
+
+def by_id(responses):
+    return {response['id']: response for response in responses}
+
+
+def test_response_shape(dispatcher):
+    dispatcher.submit({'command': 'matrix_info', 'text': MATRIX, 'id': 1, 'backend': 'python'})
+    dispatcher.submit({'command': 'simplify', 'text': r'\frac{x^2 - 1}{x - 1}', 'id': 2})
+    dispatcher.submit({'command': 'transpose', 'text': MATRIX, 'id': 3})
+    dispatcher.submit({'command': 'unknown', 'text': MATRIX, 'id': 4})
+    dispatcher.submit({'command': 'inverse', 'text': r'\matrix{1 & 2 \\ 2 & 4}', 'id': 5})
+    dispatcher.shutdown()
+    responses = by_id(dispatcher.output.responses())
+    assert responses[1] == {'command': 'matrix_info', 'id': 1, 'res': 'det: -2, rank: 2', 'backend': 'python'}
+    assert responses[2] == {'command': 'simplify', 'id': 2, 'res': 'x + 1', 'partial': False}
+    assert responses[3] == {'command': 'transpose', 'id': 3, 'res': '\\matrix{\n1&3\\\\\n2&4\\\\\n}',
+                            'backend': 'python'}
+    assert responses[4] == {'command': 'error', 'id': 4, 'error': 'unknown_command', 'res': 'Unknown command: unknown'}
+    assert responses[5] == {'command': 'error', 'id': 5, 'error': 'exception',
+                            'res': 'Matrix det == 0; not invertible.'}
+
+
+def test_batch(dispatcher):
+    items = [{'command': 'transpose', 'text': MATRIX, 'id': 'a'}, {'command': 'matrix_info', 'text': MATRIX},
+             {'command': 'unknown', 'text': MATRIX}]
+    dispatcher.submit({'command': 'batch', 'id': 7, 'items': items, 'backend': 'python'})
+    dispatcher.submit({'command': 'batch', 'id': 8, 'items': []})
+    dispatcher.shutdown()
+    responses = dispatcher.output.responses()
+    batch = [response for response in responses if response['id'] == 7]
+    # Items come in any order, the batch response is the last one
+    assert batch[-1] == {'command': 'batch', 'id': 7, 'res': 'done'}
+    items = {response['sub_id']: response for response in batch[:-1]}
+    assert set(items) == {'a', 1, 2}
+    assert items['a']['command'] == 'transpose' and items['a']['backend'] == 'python'
+    assert items[1]['res'] == 'det: -2, rank: 2'
+    assert items[2]['error'] == 'unknown_command'
+    assert {'command': 'batch', 'id': 8, 'res': 'done'} in responses
+
+
+def test_duplicate_batch_id():
+    output = Output()
+    dispatcher = Dispatcher(workers=2, output=output)
+    dispatcher.submit({'command': 'batch', 'id': 1, 'items': [{'command': 'simplify', 'text': SLOW}]})
+    dispatcher.submit({'command': 'batch', 'id': 1, 'items': [{'command': 'simplify', 'text': 'x'}]})
+    assert output.wait(lambda response: response['id'] == 1)['error'] == 'bad_request'
+    dispatcher.shutdown(wait=False)
+
+
+@pytest.mark.parametrize('size', [True, 10])
+def test_stream(dispatcher, size):
+    text = r'\matrix{' + r'\\ '.join(' & '.join(str(i * 20 + j) for j in range(20)) for i in range(20)) + '}'
+    dispatcher.submit({'command': 'transpose', 'text': text, 'id': 1, 'backend': 'python'})
+    dispatcher.submit({'command': 'transpose', 'text': text, 'id': 2, 'backend': 'python', 'stream': size})
+    dispatcher.submit({'command': 'transpose', 'text': MATRIX, 'id': 3, 'stream': 10 ** 6})
+    dispatcher.shutdown()
+    responses = dispatcher.output.responses()
+    expected = next(response for response in responses if response['id'] == 1)['res']
+    streamed = [response for response in responses if response['id'] == 2]
+    chunks, final = streamed[:-1], streamed[-1]
+    if size is True:
+        # Result is shorter than the default chunk size, it isn't split
+        assert chunks == [] and final['res'] == expected
+    else:
+        assert len(chunks) > 1
+        assert all(chunk['command'] == 'chunk' and len(chunk['res']) <= size for chunk in chunks)
+        assert [chunk['seq'] for chunk in chunks] == list(range(len(chunks)))
+        assert ''.join(chunk['res'] for chunk in chunks) == expected
+        assert final == {'command': 'transpose', 'id': 2, 'backend': 'python', 'chunks': len(chunks)}
+    assert 'chunks' not in next(response for response in responses if response['id'] == 3)
+
+
+def test_cancel_unknown_request(dispatcher):
+    dispatcher.submit({'command': 'cancel', 'target': 42, 'id': 1})
+    dispatcher.shutdown()
+    assert dispatcher.output.responses() == [{'command': 'cancel', 'id': 1, 'target': 42, 'res': False}]
+
+
+@needs_signal
+def test_cancel_running_request(pool):
+    output = pool.output
+    pool.submit({'command': 'simplify', 'text': SLOW, 'id': 1})
+    while 1 not in pool.running:
+        time.sleep(0.05)
+    start = time.monotonic()
+    pool.submit({'command': 'cancel', 'target': 1, 'id': 2})
+    assert output.wait(lambda response: response['id'] == 2)['res'] is True
+    assert output.wait(lambda response: response['id'] == 1) == {
+        'command': 'error', 'id': 1, 'error': 'cancelled', 'res': 'Request was cancelled'}
+    # Worker which ran the request is interrupted and serves the next requests
+    pool.submit({'command': 'batch', 'id': 3, 'items': [{'command': 'matrix_info', 'text': MATRIX}] * 4})
+    output.wait(lambda response: response['id'] == 3 and response['command'] == 'batch')
+    assert time.monotonic() - start < 20
+    assert [response['id'] for response in output.responses()].count(1) == 1
+
+
+@needs_signal
+def test_cancel_batch(pool):
+    output = pool.output
+    pool.submit({'command': 'batch', 'id': 1, 'items': [{'command': 'simplify', 'text': SLOW}] * 3})
+    while (1, 0) not in pool.running:
+        time.sleep(0.05)
+    pool.submit({'command': 'cancel', 'target': 1, 'id': 2})
+    assert output.wait(lambda response: response['id'] == 2)['res'] is True
+    output.wait(lambda response: response['id'] == 1 and response['command'] == 'batch')
+    items = [response for response in output.responses() if response['id'] == 1 and 'sub_id' in response]
+    assert sorted(item['sub_id'] for item in items) == [0, 1, 2]
+    assert all(item['error'] == 'cancelled' for item in items)
+
+
+@needs_signal
+def test_timeout(pool):
+    output = pool.output
+    start = time.monotonic()
+    pool.submit({'command': 'simplify', 'text': SLOW, 'id': 1, 'timeout': 1})
+    assert output.wait(lambda response: response['id'] == 1) == {
+        'command': 'error', 'id': 1, 'error': 'timeout', 'res': 'Request took longer than 1 seconds'}
+    # Timed out request is stopped, so both workers serve new requests
+    pool.submit({'command': 'batch', 'id': 2, 'items': [{'command': 'simplify', 'text': 'x + x'}] * 4})
+    output.wait(lambda response: response['id'] == 2 and response['command'] == 'batch')
+    assert time.monotonic() - start < 20
+    assert [response['id'] for response in output.responses()].count(1) == 1
+
+
+def test_time_budget():
+    output = Output()
+    dispatcher = Dispatcher(workers=0, output=output, time_budget=1)
+    start = time.monotonic()
+    dispatcher.submit({'command': 'rref', 'text': r'\matrix{a & b & c & d \\ e & f & g & h \\ k & l & m & n}',
+                       'id': 1, 'budget': 0.001})
+    dispatcher.submit({'command': 'simplify', 'text': SLOW, 'id': 2})
+    dispatcher.shutdown()
+    responses = by_id(output.responses())
+    assert responses[1]['error'] == 'timeout'
+    assert responses[2]['partial'] is True
+    assert time.monotonic() - start < 20
@@ -0,0 +1,37 @@
+from engines import domain
+from engines.lu import Factorization
+from parsers.latex_parser import Parser
+
+import pytest
+import sympy as sp
+
+
+a, b = sp.symbols('a b')
+
+MATRICES = [
+    sp.Matrix([[a, b], [1, 1 / a]]),
+    sp.Matrix([[1, 1 / a], [b, 1]]),
+    sp.Matrix([[a, 1], [1, 1 / a + b]]),
+    sp.Matrix([[1 / a, b, 1], [1, 1 / b, a], [a + b, 2, 1 / (a * b)]]),
+]
+
+
+@pytest.mark.parametrize('matrix', MATRICES)
+def test_symbolic_det_is_cancelled(matrix):
+    expected = sp.cancel(matrix.det())
+    assert domain.det(matrix) == expected
+    assert Factorization(sp.ImmutableMatrix(matrix)).det() == expected
+
+
+@pytest.mark.parametrize('text, engine, expected', [
+    (r'\matrix{a & b \\ 1 & \frac{1}{a}}', 'sympy', 'det: 1 - b, rank: 2'),
+    (r'\matrix{1 & \frac{1}{a} \\ b & 1}', 'sympy', 'det: 1 - b/a, rank: 2'),
+    (r'\matrix{a & b \\ 1 & \frac{1}{a}}', 'domain', 'det: 1 - b, rank: 2'),
+    (r'\matrix{1 & \frac{1}{a} \\ b & 1}', 'domain', 'det: (a - b)/a, rank: 2'),
+])
+def test_symbolic_det_form(text, engine, expected):
+    assert Parser().info(text, engine=engine) == expected
+
+
+def test_sympy_engine_is_default():
+    assert Parser().info(r'\matrix{1 & \frac{1}{a} \\ b & 1}') == 'det: 1 - b/a, rank: 2'
@@ -0,0 +1,19 @@
+from parsers.latex_parser import Parser
+
+import pytest
+
+
+@pytest.fixture
+def parser():
+    return Parser()
+
+
+@pytest.mark.parametrize('ops', [r'(3col)\lra(1col)', r'(1col)\lra(3col)', r'(3col)\cdot 2', r'(3col)+2(1col)'])
+def test_col_op_out_of_ematrix(parser, ops):
+    with pytest.raises(ValueError):
+        parser.apply_elementary_operations(r'\ematrix{1 & 2 & 3\\ 4 & 5 & 6}{1\\ 2} \simop{' + ops + '}')
+
+
+def test_col_op_on_both_blocks(parser):
+    result = parser.apply_elementary_operations(r'\ematrix{1 & 2 & 3\\ 4 & 5 & 6}{1 & 0\\ 2 & 1} \simop{(2col)\lra(1col)}')
+    assert result == '\\ematrix{\n2&1&3\\\\\n5&4&6\\\\\n}{\n0&1\\\\\n1&2\\\\\n}'
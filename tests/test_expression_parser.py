@@ -0,0 +1,30 @@
+from parsers.expression_parser import UnsupportedLaTeX, parse_expression, parse_fast
+
+from sympy.parsing.latex import parse_latex
+import pytest
+
+
+CASES = [
+    '1', '12', '1.5', '1 2', '3 .5', '1 2.5 3', '3.5 2', '3 4 x', 'x^2 3', '2^3 4', '1 2^2', '2x', '0.5x',
+    'x y', 'a b c', '-a - b - c', r'\frac{1}{2}', r'\frac{x + 1}{x - 1}', r'2 \cdot 3', r'6 \div 4 \times x',
+    r'\alpha \beta^{2}', r'\sqrt{2}', r'\sqrt[3]{x}', r'\left(a + b\right)^{2}', '(1 + 2)(3 - x)', 'x^{-1}',
+    '3.', '.5', '12.', '1.2.3', '1,000', 'x_1', '5!',
+]
+
+
+def parse(parser, text: str):
+    try:
+        return parser(text).doit()
+    except Exception as error:
+        return type(error)
+
+
+@pytest.mark.parametrize('text', CASES)
+def test_parse_expression_matches_parse_latex(text):
+    assert parse(parse_expression, text) == parse(parse_latex, text)
+
+
+@pytest.mark.parametrize('text', ['3.', '.5', '12.', '1.2.3', '1,000'])
+def test_malformed_numbers_fall_back(text):
+    with pytest.raises(UnsupportedLaTeX):
+        parse_fast(text)
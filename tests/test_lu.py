@@ -0,0 +1,26 @@
+from engines.lu import Factorization
+
+import sympy as sp
+
+
+a = sp.Symbol('a')
+
+
+def test_solve_with_algebraic_rhs():
+    matrix = sp.ImmutableMatrix([[a, 1], [1, 2]])
+    rhs = sp.ImmutableMatrix([[sp.sqrt(2)], [1]])
+    result = Factorization(matrix).solve(rhs)
+    assert (result - matrix.inv() * rhs).applyfunc(sp.simplify) == sp.zeros(2, 1)
+
+
+def test_solve_numeric():
+    matrix = sp.ImmutableMatrix([[1, 2], [3, 4]])
+    rhs = sp.ImmutableMatrix([[sp.Rational(1, 2), 1], [0, 3]])
+    assert Factorization(matrix).solve(rhs) == matrix.inv() * rhs
+
+
+def test_inverse_times_algebraic_matrix():
+    from parsers.latex_parser import Parser
+
+    result = Parser().simplify_expr_with_matrices(r'\matrix{a & 1\\ 1 & 2}^{-1} \matrix{\sqrt{2}\\ 1}')
+    assert result == '\\matrix{\n\\frac{-1 + 2 \\sqrt{2}}{2 a - 1}\\\\\n\\frac{a - \\sqrt{2}}{2 a - 1}\n}'
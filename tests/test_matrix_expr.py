@@ -0,0 +1,21 @@
+from parsers.latex_parser import Parser
+
+import pytest
+
+
+M = r'\matrix{1 & 2 \\ 3 & 4}'
+IDENTITY = '\\matrix{\n1 & 0\\\\\n0 & 1\n}'
+
+
+@pytest.mark.parametrize('text', [M + '^{-1}' + M, M + M + '^{-1}', M + '^{0}', M + '^{-1}' + M + '^{2}' + M + '^{-1}'])
+def test_equal_matrices_are_not_folded_into_identity(text):
+    assert Parser().simplify_expr_with_matrices(text) == IDENTITY
+
+
+def test_identity_in_sum():
+    assert Parser().simplify_expr_with_matrices(M + M + '^{-1} + ' + M) == '\\matrix{\n2 & 2\\\\\n3 & 5\n}'
+
+
+@pytest.mark.parametrize('text', [M + ' - ' + M, '2' + M + ' - ' + M + ' - ' + M, '0' + M, M + '^{2} - ' + M + M])
+def test_equal_matrices_are_not_folded_into_zero(text):
+    assert Parser().simplify_expr_with_matrices(text) == '\\matrix{\n0 & 0\\\\\n0 & 0\n}'
@@ -0,0 +1,41 @@
+from engines import modular, numeric
+from fractions import Fraction
+
+import random
+import pytest
+
+
+pytestmark = pytest.mark.skipif(modular.np is None, reason="modular engine requires numpy")
+
+
+def adversarial_matrix():
+    """Dense 40 x 41 matrix of rank 40 whose last row vanishes modulo the largest primes"""
+
+    random.seed(0)
+    rows = [[random.randint(-9, 9) for _ in range(41)] for _ in range(39)]
+    product = 1
+    for p in modular.get_primes(3):
+        product *= p
+    rows.append([0] * 39 + [product, 0])
+    return rows
+
+
+def test_rank_of_row_divisible_by_primes():
+    rows = adversarial_matrix()
+    assert numeric.rank([[Fraction(x) for x in row] for row in rows]) == 40
+    assert modular.det_rank(rows) == (None, 40)
+
+
+def test_matrix_info_rank():
+    from parsers.latex_parser import Parser
+
+    rows = adversarial_matrix()
+    text = r'\matrix{' + r'\\ '.join(' & '.join(map(str, row)) for row in rows) + '}'
+    assert Parser().info(text).endswith('rank: 40')
+
+
+def test_det_of_random_matrix():
+    random.seed(1)
+    rows = [[random.randint(-50, 50) for _ in range(40)] for _ in range(40)]
+    det, rank = numeric.det_rank([[Fraction(x) for x in row] for row in rows])
+    assert modular.det_rank(rows) == (det, rank)
@@ -0,0 +1,44 @@
+from engines import numeric
+
+import pytest
+import random
+import re
+import sympy as sp
+
+
+def random_matrix(rows: int, cols: int):
+    return sp.Matrix(rows, cols, lambda i, j: sp.Rational(random.randint(-5, 5), random.choice((1, 2, 3)))
+                     if random.random() < 0.7 else 0)
+
+
+def test_ref_keeps_fractions():
+    matrix = sp.Matrix([[sp.Rational(7, 2), 1], [1, 2]])
+    result = numeric.to_matrix(numeric.echelon_form(numeric.to_rows(matrix)), matrix.shape)
+    assert result == matrix.echelon_form()
+    assert result[0, 0] == sp.Rational(7, 2)
+
+
+def test_ref_equals_sympy():
+    random.seed(0)
+    for _ in range(200):
+        matrix = random_matrix(random.randint(1, 6), random.randint(1, 6))
+        result = numeric.to_matrix(numeric.echelon_form(numeric.to_rows(matrix)), matrix.shape)
+        assert result == matrix.echelon_form(), matrix.tolist()
+
+
+def test_rref_equals_sympy():
+    random.seed(1)
+    for _ in range(200):
+        matrix = random_matrix(random.randint(1, 6), random.randint(1, 6))
+        result = numeric.to_matrix(numeric.echelon_form(numeric.to_rows(matrix), True), matrix.shape)
+        assert result == matrix.rref()[0], matrix.tolist()
+
+
+@pytest.mark.parametrize('inverse', [numeric.inv, pytest.param(numeric.float_inv, marks=pytest.mark.skipif(
+    numeric.np is None, reason="NumPy isn't installed"))])
+def test_inverse_errors_match_sympy(inverse):
+    for matrix in (sp.Matrix([[1, 2, 3], [4, 5, 6]]), sp.Matrix([[1, 2], [2, 4]])):
+        with pytest.raises(Exception) as expected:
+            matrix.inv()
+        with pytest.raises(type(expected.value), match=re.escape(str(expected.value))):
+            inverse(numeric.to_rows(matrix))
@@ -0,0 +1,74 @@
+from cache import LRUCache, DiskCache, ResultCache
+from dispatcher import Dispatcher
+
+import io
+import os
+import json
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert 'b' not in cache
+    assert cache.get('a') == 1 and cache.get('c') == 3
+    assert cache.info() == {'hits': 3, 'misses': 0, 'size': 2, 'maxsize': 2}
+
+
+def test_disk_cache_keeps_size_limit(tmp_path):
+    cache = DiskCache(str(tmp_path / 'results.sqlite'), 1000)
+    for i in range(30):
+        cache.put(f'key{i:02}', 'x' * 95)
+        assert cache.size <= 1000
+    assert cache.get('key00') is None
+    assert cache.get('key29') == 'x' * 95
+    total = cache.connection.execute('SELECT SUM(size) FROM results').fetchone()[0]
+    assert total == cache.size
+    # Value which doesn't fit at all isn't stored
+    cache.put('huge', 'x' * 2000)
+    assert cache.get('huge') is None
+    cache.close()
+
+
+def test_disk_cache_keeps_results_between_sessions(tmp_path):
+    path = str(tmp_path / 'results.sqlite')
+    cache = ResultCache(4, path=path)
+    key = cache.key({'command': 'transpose', 'text': r'\matrix{1 & 2}'})
+    cache.put(key, {'command': 'transpose', 'res': 'result', 'backend': 'python', 'profile': {}})
+    cache.close()
+
+    cache = ResultCache(4, path=path)
+    assert cache.get(key) == ({'res': 'result', 'backend': 'python'}, 'disk')
+    assert cache.get(key) == ({'res': 'result', 'backend': 'python'}, 'memory')
+    cache.close()
+
+
+def test_key_includes_preamble_hash(tmp_path):
+    command_file = tmp_path / 'commands.tex'
+    command_file.write_text(r'\newcommand{\A}{\matrix{1 & 2 \\ 3 & 4}}')
+    cache = ResultCache(4, str(command_file))
+    inp = {'command': 'matrix_info', 'text': r'\A'}
+    key = cache.key(inp)
+    assert key == cache.key({**inp, 'text': '  \\A '})
+    assert key != cache.key({**inp, 'engine': 'domain'})
+    assert key != ResultCache(4).key(inp)
+
+    mtime = command_file.stat().st_mtime_ns
+    command_file.write_text(r'\newcommand{\A}{\matrix{1 & 2 \\ 3 & 5}}')
+    os.utime(command_file, ns=(mtime + 10 ** 9, mtime + 10 ** 9))
+    assert cache.key(inp) != key
+
+
+def test_cached_response_has_fields_of_computed_one():
+    output = io.StringIO()
+    dispatcher = Dispatcher(workers=0, output=output, cache=ResultCache(16))
+    inp = {'command': 'matrix_info', 'text': r'\matrix{1 & 2 \\ 3 & 4}', 'backend': 'python'}
+    dispatcher.submit({**inp, 'id': 1})
+    dispatcher.submit({**inp, 'id': 2})
+    dispatcher.shutdown()
+    computed, cached = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert computed['cached'] is False and cached['cached'] == 'memory'
+    assert computed['backend'] == 'python'
+    assert {**computed, 'id': 2, 'cached': 'memory'} == cached
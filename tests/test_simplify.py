@@ -0,0 +1,43 @@
+from engines.simplify import simplify_entry, simplify_expanded
+from parsers.latex_parser import Parser
+
+import pytest
+import sympy as sp
+
+
+x, a, b = sp.symbols('x a b')
+
+
+@pytest.mark.parametrize('expr', [
+    x + 1 / x,
+    a / b + b / a,
+    (x ** 2 - 1) / (x - 1),
+    1 / (x + 1) + 1 / (x - 1),
+    (a ** 2 + 2 * a * b + b ** 2) / (a + b) ** 3,
+    2 * sp.sqrt(2) * a / (4 - sp.sqrt(2)),
+    sp.sqrt(2) / (1 + sp.sqrt(2)),
+    sp.pi * x / (x + x ** 2),
+])
+def test_simplify_entry_equals_sympy(expr):
+    entry = sp.expand(expr)
+    assert simplify_entry(entry) == sp.simplify(entry)
+
+
+def test_simplify_keeps_short_entry():
+    assert simplify_entry(x + 1 / x) == x + 1 / x
+
+
+def test_simplify_matrix():
+    matrix = sp.ImmutableMatrix([[2 * sp.sqrt(2) * a / (4 - sp.sqrt(2)), x + 1 / x], [1, x ** 2 / (x - 1) - 1 / (x - 1)]])
+    assert simplify_expanded(matrix) == matrix.applyfunc(sp.simplify)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('2 + 3', '5'),
+    ('a b + a b', '2 a b'),
+    ('x^2 + 2x + 1', 'x^{2} + 2 x + 1'),
+    ('a - b - c', 'a - b - c'),
+    (r'\frac{x^2 - 1}{x - 1}', 'x + 1'),
+])
+def test_parser_simplifies_scalars(text, expected):
+    assert Parser().simplify_expr_with_matrices(text) == expected